@@ -0,0 +1,76 @@
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from . import config, models
+from .database import SessionLocal
+
+
+def archive_history(db: Session, older_than_days: Optional[int] = None,
+                    batch_size: Optional[int] = None,
+                    now: Optional[datetime] = None) -> dict:
+    """
+    Move returned loans older than the cutoff to the archive table.
+
+    Each batch copies rows with INSERT ... SELECT and deletes them from the
+    hot table in one transaction, so a loan is always in exactly one of the
+    two. Batches are about batch_size rows (loans returned at the same
+    instant stay together), oldest first along
+    ix_borrowing_history_return_date.
+
+    SQLite tables created before borrowing_history used AUTOINCREMENT may
+    have reused the id of an archived loan; such loans are skipped and stay
+    in the hot table. Returns counts and timing of the run.
+    """
+    if older_than_days is None:
+        older_than_days = config.ARCHIVE_AFTER_DAYS
+    batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+    now = now or datetime.now(UTC)
+    cutoff = now - timedelta(days=older_than_days)
+
+    hot = models.BorrowingHistory.__table__
+    archive = models.BorrowingHistoryArchive.__table__
+    columns = [column.name for column in archive.columns]
+    archived = select(archive.c.id).where(archive.c.id == hot.c.id).exists()
+    stats = {"archived": 0, "batches": 0}
+    skipped_ids = set()
+    start = time.perf_counter()
+
+    while True:
+        # The batch is a return_date range ending at the batch_size-th
+        # oldest loan, so both statements are index range scans instead of
+        # carrying thousands of ids as bound parameters.
+        boundary = db.execute(
+            select(hot.c.return_date)
+            .where(hot.c.return_date < cutoff, ~archived)
+            .order_by(hot.c.return_date).offset(batch_size - 1).limit(1)
+        ).scalar()
+        if boundary is None:
+            batch = hot.c.return_date < cutoff
+        else:
+            batch = hot.c.return_date <= boundary
+        skipped = db.scalars(select(hot.c.id).where(batch, archived)).all()
+        if skipped:
+            skipped_ids.update(skipped)
+            batch = batch & hot.c.id.not_in(skipped)
+        moved = db.execute(insert(archive).from_select(
+            columns, select(*[hot.c[name] for name in columns]).where(batch)
+        )).rowcount
+        if not moved:
+            break
+        db.execute(delete(hot).where(batch))
+        db.commit()
+        stats["archived"] += moved
+        stats["batches"] += 1
+
+    stats["skipped"] = len(skipped_ids)
+    stats["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return stats
+
+
+def archive_history_job() -> dict:
+    with SessionLocal() as db:
+        return archive_history(db)
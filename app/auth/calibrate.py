@@ -0,0 +1,30 @@
+"""
+Report bcrypt throughput to size login capacity.
+
+    python -m app.auth.calibrate [--min-rounds 8] [--max-rounds 14]
+"""
+import argparse
+import os
+
+from .passwords import measure_hash_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--min-rounds", type=int, default=8)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    parser.add_argument("--samples", type=int, default=3)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f"{'cost':>4} {'ms/hash':>10} {'hashes/s/core':>14} "
+          f"{'logins/s ({} cores)'.format(cores):>22}")
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        ms = measure_hash_ms(rounds, args.samples)
+        per_core = 1000 / ms
+        print(f"{rounds:>4} {ms:>10.1f} {per_core:>14.1f} "
+              f"{per_core * cores:>22.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import logging
+import time
+
+import bcrypt
+
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+MIN_ROUNDS = 4
+MAX_ROUNDS = 16
+
+# Work factor for new hashes, see configure_work_factor()
+bcrypt_rounds = config.BCRYPT_ROUNDS
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(
+        plain_password.encode('utf-8'),
+        hashed_password.encode('utf-8')
+    )
+
+
+def get_password_hash(password: str) -> str:
+    return bcrypt.hashpw(
+        password.encode('utf-8'),
+        bcrypt.gensalt(rounds=bcrypt_rounds)
+    ).decode('utf-8')
+
+
+def hash_rounds(hashed_password: str) -> int:
+    # Modular crypt format: $2b$<rounds>$<salt and hash>
+    return int(hashed_password.split("$")[2])
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    return hash_rounds(hashed_password) != bcrypt_rounds
+
+
+def measure_hash_ms(rounds: int, samples: int = 3) -> float:
+    """Median wall time of one bcrypt hash at the given cost"""
+    salt = bcrypt.gensalt(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration password", salt)
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def calibrate_rounds(target_ms: float) -> int:
+    """Highest cost whose hash takes at most target_ms on this machine"""
+    rounds = MIN_ROUNDS
+    # Every extra round doubles the work, so stop at the first one over budget
+    while rounds < MAX_ROUNDS and measure_hash_ms(rounds + 1) <= target_ms:
+        rounds += 1
+    return rounds
+
+
+def configure_work_factor():
+    """Apply BCRYPT_TARGET_MS, if set, by measuring this machine"""
+    global bcrypt_rounds
+    if config.BCRYPT_TARGET_MS > 0:
+        bcrypt_rounds = calibrate_rounds(config.BCRYPT_TARGET_MS)
+        logger.info("bcrypt cost %d fits the %.0f ms budget",
+                    bcrypt_rounds, config.BCRYPT_TARGET_MS)
+    else:
+        bcrypt_rounds = config.BCRYPT_ROUNDS
@@ -0,0 +1,118 @@
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitStore(ABC):
+    """
+    Token bucket state keyed by string.
+
+    The in-memory store below serves a single process; a shared backend
+    (Redis, a database table) implements the same two methods.
+    """
+
+    @abstractmethod
+    def take(self, key: str, capacity: float, refill_per_second: float,
+             now: float) -> float:
+        """
+        Take one token; return 0 if allowed, else seconds until allowed.
+
+        A refill rate of 0 means the bucket never refills: once capacity
+        is spent every take returns math.inf.
+        """
+
+    @abstractmethod
+    def reset(self, key: Optional[str] = None):
+        """Refill one bucket, or all of them when key is None"""
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """
+    Buckets as (tokens, updated_at) pairs, refilled lazily on access.
+
+    Tokens drip back continuously, so the limit acts as a sliding window
+    rather than one that resets on a fixed boundary. The least recently
+    used buckets are evicted past max_keys so random usernames can't grow
+    memory without bound.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_per_second, now):
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            elif refill_per_second > 0:
+                retry_after = (1 - tokens) / refill_per_second
+            else:
+                retry_after = math.inf
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+    def reset(self, key=None):
+        with self._lock:
+            if key is None:
+                self._buckets.clear()
+            else:
+                self._buckets.pop(key, None)
+
+
+class LoginRateLimiter:
+    """
+    Per-username and per-IP buckets checked before any password hashing.
+
+    A successful login refills the username bucket, so only failed
+    guesses accumulate against an account.
+    """
+
+    def __init__(self, store: RateLimitStore):
+        self.store = store
+        self.metrics = Counter()
+
+    def check(self, username: str, client_ip: str) -> float:
+        """Return 0 if the attempt may proceed, else the Retry-After seconds"""
+        now = time.monotonic()
+        retry_after = self.store.take(
+            f"ip:{client_ip}", config.LOGIN_IP_BURST,
+            config.LOGIN_IP_PER_MINUTE / 60, now)
+        scope = "ip"
+        if not retry_after:
+            retry_after = self.store.take(
+                f"user:{username}", config.LOGIN_USERNAME_BURST,
+                config.LOGIN_USERNAME_PER_MINUTE / 60, now)
+            scope = "username"
+
+        if retry_after:
+            self.metrics["rejected"] += 1
+            self.metrics[f"rejected_{scope}"] += 1
+            logger.warning("Login attempt rejected by %s limit: user=%r ip=%s",
+                           scope, username, client_ip)
+        else:
+            self.metrics["allowed"] += 1
+        return retry_after
+
+    def succeeded(self, username: str):
+        self.store.reset(f"user:{username}")
+
+    def reset(self):
+        self.store.reset()
+        self.metrics.clear()
+
+
+login_limiter = LoginRateLimiter(MemoryRateLimitStore())
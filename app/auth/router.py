@@ -1,84 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
+import math
 
-from sqlalchemy.orm import Session
-
-from datetime import datetime, timedelta, UTC
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
 
-from jose import JWTError, jwt
-import bcrypt
+from sqlalchemy.orm import Session
 
 from . import models, schemas
+from .ratelimit import login_limiter
+from .sessions import (
+    InvalidRefreshToken, issue_refresh_token, revoke_refresh_token,
+    rotate_refresh_token
+)
+from .utils import (
+    authenticate_user, create_user_token, get_password_hash, get_user
+)
 from ..database import get_db
 
 router = APIRouter()
 
-# to get a string like this run:
-# openssl rand -hex 32
-SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-
-def create_access_token(data: dict):
-    to_encode = data.copy()
-    expire = datetime.now(UTC) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(
-        plain_password.encode('utf-8'),
-        hashed_password.encode('utf-8')
-    )
-
-
-def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(
-        password.encode('utf-8'),
-        bcrypt.gensalt()
-    ).decode('utf-8')
-
-
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user_by_username(db, username)
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
-        return False
-    return user
-
-
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    user = get_user_by_username(db, username)
-    if user is None:
-        raise credentials_exception
-    return user
-
 
 @router.post("/token", response_model=schemas.Token,
              summary="Login for access token",
@@ -88,14 +27,28 @@ async def get_current_user(
 - #### 📝 **username**: Your registered username;
 - #### 🔑 **password**: Your account password.
 
-⏱️ Returns a JWT token valid for 30 minutes.
+⏱️ Returns a JWT token valid for 30 minutes and a refresh token to renew it.
+🚦 Repeated attempts per username or client IP are answered with 429.
 """,
              response_description="Access token for authentication"
              )
 async def login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
+    # Rejected before any bcrypt work, so floods can't saturate the CPU
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = login_limiter.check(form_data.username, client_ip)
+    if retry_after:
+        # No Retry-After when a limit configured to 0 per minute never refills
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+            if math.isfinite(retry_after) else None,
+        )
+
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
@@ -103,9 +56,65 @@ async def login_for_access_token(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    login_limiter.succeeded(form_data.username)
+
+    access_token = create_user_token(user)
+    refresh_token = issue_refresh_token(db, user)
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token
+    }
 
-    access_token = create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/token/refresh", response_model=schemas.Token,
+             summary="Refresh access token",
+             description="""
+## 🔄 Exchange a refresh token for a new access token:
+
+- #### 🎟️ **refresh_token**: Refresh token from `/token` or a previous refresh.
+
+⏱️ Returns a new access token and a new refresh token; the old one stops working.
+⚠️ Reusing an already exchanged refresh token revokes all sessions of the user.
+""",
+             response_description="New access and refresh tokens"
+             )
+async def refresh_access_token(
+    body: schemas.RefreshRequest,
+    db: Session = Depends(get_db)
+):
+    try:
+        user, refresh_token = rotate_refresh_token(db, body.refresh_token)
+    except InvalidRefreshToken:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return {
+        "access_token": create_user_token(user),
+        "token_type": "bearer",
+        "refresh_token": refresh_token
+    }
+
+
+@router.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT,
+             summary="Revoke refresh token",
+             description="""
+## 🚪 Revoke a refresh token (log out the session):
+
+- #### 🎟️ **refresh_token**: Refresh token to revoke.
+
+Unknown or already revoked tokens are accepted silently.
+""",
+             response_description="Refresh token revoked"
+             )
+async def revoke_token(
+    body: schemas.RefreshRequest,
+    db: Session = Depends(get_db)
+):
+    revoke_refresh_token(db, body.refresh_token)
 
 
 @router.post("/users/", response_model=schemas.User,
@@ -124,7 +133,7 @@ async def create_user(
     user: schemas.UserCreate,
     db: Session = Depends(get_db)
 ):
-    db_user = get_user_by_username(db, username=user.username)
+    db_user = get_user(db, username=user.username)
     if db_user:
         raise HTTPException(
             status_code=400,
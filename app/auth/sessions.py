@@ -0,0 +1,135 @@
+import hashlib
+import hmac
+import secrets
+import time
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .. import config
+
+# Expired sessions are swept from the login path at most this often
+SWEEP_INTERVAL_SECONDS = 300
+SWEEP_BATCH_SIZE = 1000
+
+_last_sweep = 0.0
+
+
+class InvalidRefreshToken(Exception):
+    pass
+
+
+def hash_refresh_token(token: str) -> str:
+    return hmac.new(
+        config.REFRESH_TOKEN_HMAC_KEY.encode("utf-8"),
+        token.encode("utf-8"),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def issue_refresh_token(db: Session, user: models.User) -> str:
+    """Create a session for user and return its opaque refresh token"""
+    maybe_sweep_expired_sessions(db)
+    token = secrets.token_urlsafe(32)
+    db.add(models.RefreshSession(
+        user_id=user.id,
+        token_hash=hash_refresh_token(token),
+        expires_at=datetime.now(UTC) + timedelta(
+            days=config.REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    db.commit()
+    return token
+
+
+def rotate_refresh_token(db: Session, token: str) -> tuple[models.User, str]:
+    """
+    Exchange a refresh token for a new one, returning the user and token.
+
+    Presenting a token that was already rotated or revoked means it leaked,
+    so every session of that user is revoked.
+    """
+    now = datetime.now(UTC)
+    row = db.query(models.RefreshSession, models.User).join(
+        models.User, models.User.id == models.RefreshSession.user_id
+    ).filter(
+        models.RefreshSession.token_hash == hash_refresh_token(token),
+        models.RefreshSession.expires_at > now
+    ).first()
+    if row is None:
+        raise InvalidRefreshToken()
+
+    session, user = row
+    if session.revoked_at is not None:
+        revoke_user_sessions(db, user.id)
+        raise InvalidRefreshToken()
+    if not user.is_active:
+        raise InvalidRefreshToken()
+
+    # Of two refreshes racing with the same token only one claims it; the
+    # other finds it revoked, the same as a replay
+    claimed = db.execute(
+        update(models.RefreshSession).where(
+            models.RefreshSession.id == session.id,
+            models.RefreshSession.revoked_at.is_(None)
+        ).values(revoked_at=now)
+    ).rowcount
+    if not claimed:
+        revoke_user_sessions(db, user.id)
+        raise InvalidRefreshToken()
+    new_token = secrets.token_urlsafe(32)
+    db.add(models.RefreshSession(
+        user_id=user.id,
+        token_hash=hash_refresh_token(new_token),
+        expires_at=now + timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    db.commit()
+    return user, new_token
+
+
+def revoke_refresh_token(db: Session, token: str) -> bool:
+    result = db.execute(
+        update(models.RefreshSession).where(
+            models.RefreshSession.token_hash == hash_refresh_token(token),
+            models.RefreshSession.revoked_at.is_(None)
+        ).values(revoked_at=datetime.now(UTC))
+    )
+    db.commit()
+    return result.rowcount > 0
+
+
+def revoke_user_sessions(db: Session, user_id: int):
+    db.execute(
+        update(models.RefreshSession).where(
+            models.RefreshSession.user_id == user_id,
+            models.RefreshSession.revoked_at.is_(None)
+        ).values(revoked_at=datetime.now(UTC))
+    )
+    db.commit()
+
+
+def sweep_expired_sessions(db: Session, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Delete expired sessions in batches, returns the number deleted"""
+    now = datetime.now(UTC)
+    deleted = 0
+    while True:
+        ids = db.scalars(
+            select(models.RefreshSession.id).where(
+                models.RefreshSession.expires_at <= now
+            ).limit(batch_size)
+        ).all()
+        if not ids:
+            return deleted
+        db.execute(delete(models.RefreshSession).where(
+            models.RefreshSession.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+
+
+def maybe_sweep_expired_sessions(db: Session):
+    global _last_sweep
+    if time.monotonic() - _last_sweep < SWEEP_INTERVAL_SECONDS:
+        return
+    _last_sweep = time.monotonic()
+    sweep_expired_sessions(db)
@@ -0,0 +1,134 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+from jose import JWTError, jwk, jwt
+
+from .. import config
+
+ALGORITHM = "HS256"
+
+
+def parse_signing_keys(value: str) -> dict[str, str]:
+    """Parse "kid:secret,kid:secret" into a dict"""
+    keys = {}
+    for pair in value.split(","):
+        kid, _, secret = pair.strip().partition(":")
+        if not kid or not secret:
+            raise ValueError(f"Invalid signing key entry: {pair!r}")
+        keys[kid] = secret
+    return keys
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+class TokenService:
+    """
+    Issues and verifies HS256 access tokens.
+
+    Keys are parsed once per kid and cached: a python-jose key object for the
+    "jose" backend, a keyed HMAC to copy() from for the "stdlib" backend,
+    which skips jose's generic JWS machinery entirely.
+    """
+
+    def __init__(self, keys: dict[str, str], active_kid: str,
+                 backend: str = "stdlib"):
+        if active_kid not in keys:
+            raise ValueError(f"Active kid {active_kid!r} has no signing key")
+        if backend not in ("stdlib", "jose"):
+            raise ValueError(f"Unknown token backend {backend!r}")
+        self.keys = keys
+        self.active_kid = active_kid
+        self.backend = backend
+        self._jose_keys = {}
+        self._hmacs = {}
+
+    def rotate(self, kid: str, secret: str):
+        """Sign new tokens with a new key; tokens of older kids stay valid"""
+        self.keys = {**self.keys, kid: secret}
+        self.active_kid = kid
+        # Re-keying an existing kid must not keep verifying with the old secret
+        self._jose_keys.pop(kid, None)
+        self._hmacs.pop(kid, None)
+
+    def retire(self, kid: str):
+        """Stop accepting tokens signed with kid"""
+        if kid == self.active_kid:
+            raise ValueError("Cannot retire the active signing key")
+        self.keys = {k: v for k, v in self.keys.items() if k != kid}
+        self._jose_keys.pop(kid, None)
+        self._hmacs.pop(kid, None)
+
+    def encode(self, claims: dict) -> str:
+        return jwt.encode(
+            claims, self.keys[self.active_kid], algorithm=ALGORITHM,
+            headers={"kid": self.active_kid}
+        )
+
+    def decode(self, token: str) -> dict:
+        """Verify signature and expiry, raising JWTError on any failure"""
+        if self.backend == "jose":
+            return self._decode_jose(token)
+        return self._decode_stdlib(token)
+
+    def _kid(self, header: dict) -> str:
+        # Tokens issued before kids were introduced carry none
+        kid = header.get("kid", self.active_kid)
+        if kid not in self.keys:
+            raise JWTError("Unknown signing key")
+        return kid
+
+    def _decode_jose(self, token: str) -> dict:
+        kid = self._kid(jwt.get_unverified_header(token))
+        key = self._jose_keys.get(kid)
+        if key is None:
+            key = self._jose_keys[kid] = jwk.construct(self.keys[kid], ALGORITHM)
+        return jwt.decode(token, key, algorithms=[ALGORITHM])
+
+    def _decode_stdlib(self, token: str) -> dict:
+        # Headers arrive as latin-1; anything past ASCII can't be a JWT
+        if not token.isascii():
+            raise JWTError("Malformed token")
+        try:
+            header_segment, payload_segment, signature_segment = token.split(".")
+            header = json.loads(_b64decode(header_segment))
+            signature = _b64decode(signature_segment)
+        except (ValueError, TypeError) as exc:
+            raise JWTError("Malformed token") from exc
+        if not isinstance(header, dict) or header.get("alg") != ALGORITHM:
+            raise JWTError("The specified alg value is not allowed")
+
+        kid = self._kid(header)
+        keyed = self._hmacs.get(kid)
+        if keyed is None:
+            keyed = self._hmacs[kid] = hmac.new(
+                self.keys[kid].encode("utf-8"), digestmod=hashlib.sha256)
+        mac = keyed.copy()
+        mac.update(f"{header_segment}.{payload_segment}".encode("ascii"))
+        if not hmac.compare_digest(mac.digest(), signature):
+            raise JWTError("Signature verification failed.")
+
+        try:
+            payload = json.loads(_b64decode(payload_segment))
+        except ValueError as exc:
+            raise JWTError("Malformed token") from exc
+        if not isinstance(payload, dict):
+            raise JWTError("Malformed token")
+        exp = payload.get("exp")
+        if exp is not None:
+            if not isinstance(exp, (int, float)):
+                raise JWTError("Expiration Time claim (exp) must be an integer.")
+            if exp < time.time():
+                raise JWTError("Signature has expired.")
+        return payload
+
+
+token_service = TokenService(
+    parse_signing_keys(config.JWT_SIGNING_KEYS),
+    config.JWT_ACTIVE_KID,
+    config.JWT_BACKEND
+)
@@ -3,56 +3,60 @@ from fastapi.security import OAuth2PasswordBearer
 
 from sqlalchemy.orm import Session
 
-from jose import JWTError, jwt
-import bcrypt
+from jose import JWTError
 
 from datetime import datetime, timedelta, UTC
+from functools import cache
 from typing import Annotated
 
 from . import models, schemas
+from .passwords import get_password_hash, needs_rehash, verify_password
+from .tokens import token_service
+from .. import config
 from ..database import get_db
 
-# Configuration
-SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(
-        plain_password.encode('utf-8'),
-        hashed_password.encode('utf-8')
-    )
-
-
-def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(
-        password.encode('utf-8'),
-        bcrypt.gensalt()
-    ).decode('utf-8')
-
-
 def create_access_token(data: dict):
     to_encode = data.copy()
-    expire = datetime.now(UTC) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.now(UTC) + timedelta(
+        minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
     # Convert to timestamp for JWT
     to_encode.update({"exp": int(expire.timestamp())})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    return token_service.encode(to_encode)
+
+
+def create_user_token(user: models.User) -> str:
+    # uid and active let get_current_user skip the DB in stateless mode
+    return create_access_token(data={
+        "sub": user.username,
+        "uid": user.id,
+        "active": bool(user.is_active),
+    })
 
 
 def get_user(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
 
+@cache
+def _dummy_password_hash() -> str:
+    return get_password_hash("dummy password for unknown users")
+
+
 def authenticate_user(db: Session, username: str, password: str):
     user = get_user(db, username)
     if not user:
+        # Same bcrypt cost as a real check, so timing doesn't reveal usernames
+        verify_password(password, _dummy_password_hash())
         return False
     if not verify_password(password, user.hashed_password):
         return False
+    if needs_rehash(user.hashed_password):
+        # Upgrade (or downgrade) to the configured cost while we have the password
+        user.hashed_password = get_password_hash(password)
+        db.commit()
     return user
 
 
@@ -66,7 +70,7 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = token_service.decode(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -74,7 +78,13 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
+    if config.AUTH_STATELESS and "uid" in payload:
+        if not payload.get("active", True):
+            raise credentials_exception
+        return schemas.User(
+            id=payload["uid"], username=username, is_active=True)
+
     user = get_user(db, username=token_data.username)
-    if user is None:
+    if user is None or not user.is_active:
         raise credentials_exception
     return user
@@ -0,0 +1,44 @@
+from typing import Any, Dict, Iterable, List
+
+from fastapi import HTTPException, Query
+from sqlalchemy.orm import Session
+
+# IDs accepted by one batch lookup; far below SQLite's bound parameter limit
+MAX_BATCH_IDS = 1000
+
+
+def batch_ids(
+    ids: str = Query(..., description="Comma separated IDs, at most 1000")
+) -> List[int]:
+    """Parse ?ids=3,1,2 into unique IDs, keeping their first-seen order"""
+    try:
+        parsed = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="ids must be comma separated integers")
+    parsed = list(dict.fromkeys(parsed))
+    if not parsed:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    if len(parsed) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_IDS} ids per request")
+    return parsed
+
+
+def load_by_ids(db: Session, model, ids: Iterable[int],
+                *options) -> Dict[int, Any]:
+    """Rows of `model` with the given primary keys, one IN query"""
+    ids = list(ids)
+    if not ids:
+        return {}
+    rows = db.query(model).options(*options).filter(model.id.in_(ids)).all()
+    return {row.id: row for row in rows}
+
+
+def ordered_batch(found: Dict[int, Any], ids: List[int]) -> dict:
+    """Found rows in request order, plus the IDs that matched nothing"""
+    return {
+        "items": [found[i] for i in ids if i in found],
+        "missing": [i for i in ids if i not in found],
+    }
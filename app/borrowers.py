@@ -0,0 +1,88 @@
+"""
+Borrowers and the migration of free-text borrower names to them.
+"""
+from datetime import datetime, UTC
+
+from sqlalchemy import func, inspect, insert, select, union, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+def borrower_id_for(db: Session, name: str) -> int:
+    """
+    Id of the borrower with this name, created on first use. Concurrent
+    first loans of a new name agree on one row: the insert skips a name
+    another transaction added in the meantime.
+    """
+    borrower_id = db.scalar(
+        select(models.Borrower.id).where(models.Borrower.name == name))
+    if borrower_id is not None:
+        return borrower_id
+    dialect = db.get_bind().dialect.name
+    values = {"name": name, "created_at": datetime.now(UTC)}
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = (postgresql.insert if dialect == "postgresql"
+                          else sqlite.insert)
+        db.execute(dialect_insert(models.Borrower).values(**values)
+                   .on_conflict_do_nothing(index_elements=["name"]))
+    else:
+        db.execute(insert(models.Borrower).values(**values))
+    return db.scalar(
+        select(models.Borrower.id).where(models.Borrower.name == name))
+
+
+def migrate_borrowers(db: Session, batch_size: int = 10_000) -> dict:
+    """
+    Create a borrower per distinct borrower_name and point loans at it.
+
+    Part of app.migrations.upgrade_schema, which adds the borrower_id
+    columns first. Idempotent: names that already have a borrower and loans
+    that already have a borrower_id are left alone, and a database with no
+    unlinked loans costs one lookup per loan table. Loans are updated in
+    primary key ranges of batch_size, one transaction each.
+    """
+    stats = {"borrowers_created": 0, "loans_updated": 0}
+    tables = [models.BorrowingHistory.__table__]
+    if inspect(db.connection()).has_table(
+            models.BorrowingHistoryArchive.__tablename__):
+        tables.append(models.BorrowingHistoryArchive.__table__)
+    tables = [table for table in tables if db.scalar(
+        select(table.c.id).where(table.c.borrower_id == None,
+                                 table.c.borrower_name != None).limit(1)
+    ) is not None]
+    if not tables:
+        return stats
+
+    borrowers = models.Borrower.__table__
+    names = union(*[
+        select(table.c.borrower_name).where(table.c.borrower_name != None)
+        for table in tables
+    ]).subquery()
+    stats["borrowers_created"] = db.execute(
+        insert(borrowers).from_select(
+            ["name", "created_at"],
+            select(names.c.borrower_name, func.current_timestamp())
+            .where(names.c.borrower_name.not_in(select(borrowers.c.name)))
+            .distinct()
+        )
+    ).rowcount
+    db.commit()
+
+    for table in tables:
+        borrower_id = select(borrowers.c.id).where(
+            borrowers.c.name == table.c.borrower_name).scalar_subquery()
+        low, high = db.execute(
+            select(func.min(table.c.id), func.max(table.c.id))).one()
+        while low is not None and low <= high:
+            stats["loans_updated"] += db.execute(
+                update(table).values(borrower_id=borrower_id).where(
+                    table.c.id >= low, table.c.id < low + batch_size,
+                    table.c.borrower_id == None,
+                    table.c.borrower_name != None)
+            ).rowcount
+            db.commit()
+            low += batch_size
+    return stats
+
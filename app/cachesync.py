@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import Callable, Dict
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from . import config, models
+
+
+class CacheSync:
+    """
+    Invalidates per-process caches when another worker changes their data.
+
+    Every cache has a row in cache_generations. A commit that changes what a
+    cache holds bumps the row in the same transaction (bump()), and each
+    worker compares the generations with the ones it last saw at most once
+    per CACHE_SYNC_INTERVAL_SECONDS (poll()). Generations the worker bumped
+    itself don't invalidate its own cache, which was updated in place.
+    """
+
+    def __init__(self):
+        self._invalidators: Dict[str, Callable[[], None]] = {}
+        self._seen: Dict[str, int] = {}
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return config.CACHE_SYNC_INTERVAL_SECONDS > 0
+
+    def register(self, name: str, invalidate: Callable[[], None]):
+        self._invalidators[name] = invalidate
+
+    def bump(self, session: Session, name: str, always: bool = False):
+        """
+        Advance a cache's generation in the session's transaction; skipped
+        while syncing is off unless always is set.
+        """
+        if not (self.enabled or always):
+            return
+        table = models.CacheGeneration.__table__
+        generation = session.execute(
+            update(table).where(table.c.name == name)
+            .values(generation=table.c.generation + 1)
+            .returning(table.c.generation)
+        ).scalar()
+        if generation is None:
+            generation = 1
+            session.add(models.CacheGeneration(name=name, generation=1))
+        session.info.setdefault("cache_generations", {})[name] = generation
+
+    def poll(self, db: Session):
+        """Invalidate the caches whose generation moved since last seen"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < config.CACHE_SYNC_INTERVAL_SECONDS:
+            return
+        self._checked_at = now
+        rows = db.execute(select(
+            models.CacheGeneration.name, models.CacheGeneration.generation
+        ).where(models.CacheGeneration.name.in_(self._invalidators))).all()
+        for name, generation in rows:
+            self._advance(name, generation, own=False)
+
+    def _advance(self, name: str, generation: int, own: bool):
+        with self._lock:
+            seen = self._seen.get(name)
+            self._seen[name] = generation
+        # Our own commit moves the generation by exactly one; anything else
+        # means another worker committed in between
+        in_step = seen == (generation - 1 if own else generation)
+        if not in_step and name in self._invalidators:
+            self._invalidators[name]()
+
+    def reset(self):
+        self._seen.clear()
+        self._checked_at = float("-inf")
+
+
+cache_sync = CacheSync()
+
+
+@event.listens_for(Session, "after_commit")
+def _record_own_generations(session):
+    for name, generation in session.info.pop(
+            "cache_generations", {}).items():
+        cache_sync._advance(name, generation, own=True)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_generations(session):
+    session.info.pop("cache_generations", None)
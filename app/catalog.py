@@ -0,0 +1,526 @@
+import heapq
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict
+from datetime import date
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import models
+from .cachesync import cache_sync
+from .sortkeys import author_sort_key
+
+_NONZERO_BYTE = re.compile(b"[^\x00]")
+
+SORT_MODES = ("title", "author", "publish_date")
+
+
+def to_bitmap(ids: Iterable[int]) -> int:
+    """Pack ids into an int where bit N is set when id N is present"""
+    ids = list(ids)
+    if not ids:
+        return 0
+    # Setting bits in a bytearray is linear; OR-ing shifted ints is quadratic
+    buffer = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        buffer[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def iter_bitmap(bitmap: int) -> Iterator[int]:
+    """Yield the ids set in a bitmap in ascending order"""
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    # The regex engine skips the zero bytes at C speed
+    for match in _NONZERO_BYTE.finditer(data):
+        position = match.start()
+        byte = data[position]
+        base = position << 3
+        while byte:
+            low = byte & -byte
+            yield base + low.bit_length() - 1
+            byte ^= low
+
+
+def _set_bit(bitmaps: dict[int, int], key: int, book_id: int):
+    bitmaps[key] = bitmaps.get(key, 0) | (1 << book_id)
+
+
+def _clear_bit(bitmaps: dict[int, int], key: int, book_id: int):
+    if key in bitmaps:
+        bitmaps[key] &= ~(1 << book_id)
+
+
+class CatalogIndex:
+    """
+    In-process read model of the catalog.
+
+    Array-backed columns indexed by book id (titles, publish dates, author
+    and publisher ids) plus bitmaps over book ids, one per genre, author,
+    publisher, publish year and availability. Filtering is a chain of ANDs,
+    facet counts are popcounts and sorted pages walk a pre-sorted id list,
+    so none of them touch the database. Unlike the SQL path, which sorts a
+    genre's books per request, no filter combination needs a sort.
+
+    The index is built on first use and then kept current from the
+    after_commit hooks below; invalidate() forces a full rebuild. Commits
+    made by other worker processes are noticed through cache_sync.
+    """
+
+    # Below this many matches, walking the ids beats one popcount per value
+    SPARSE_LIMIT = 50_000
+    RESULT_CACHE_SIZE = 256
+
+    def __init__(self):
+        # Reentrant: load() computes the default facets while ensure_fresh()
+        # holds the lock
+        self._lock = threading.RLock()
+        self._stale = True
+        self.load([], [], [])
+        self.loaded = False
+
+    def load(self, books, book_genres, authors):
+        """
+        Build the index from (id, title_sort_key, author_id, publisher_id,
+        is_available, publish_date) book rows, (book_id, genre_id) rows and
+        (id, name) author rows.
+        """
+        self._title_keys: list[Optional[str]] = []
+        self._publish_dates = array("l")
+        self._author_of = array("l")
+        self._publisher_of = array("l")
+        self._author_keys: dict[int, str] = {
+            author_id: author_sort_key(name) for author_id, name in authors}
+        # Per year, (ordinal, id) pairs sorted for partial-year ranges
+        self._year_entries: dict[int, list[tuple[int, int]]] = {}
+
+        ids, available = [], []
+        authors_ids: dict[int, list[int]] = {}
+        publishers_ids: dict[int, list[int]] = {}
+        genres_ids: dict[int, list[int]] = {}
+        years_ids: dict[int, list[int]] = {}
+        for (book_id, title_key, author_id, publisher_id,
+             is_available, publish_date) in books:
+            self._grow(book_id)
+            ids.append(book_id)
+            self._title_keys[book_id] = title_key
+            self._author_of[book_id] = author_id or 0
+            self._publisher_of[book_id] = publisher_id or 0
+            authors_ids.setdefault(author_id or 0, []).append(book_id)
+            publishers_ids.setdefault(publisher_id or 0, []).append(book_id)
+            if is_available:
+                available.append(book_id)
+            if publish_date is not None:
+                ordinal = publish_date.toordinal()
+                self._publish_dates[book_id] = ordinal
+                years_ids.setdefault(publish_date.year, []).append(book_id)
+                self._year_entries.setdefault(publish_date.year, []).append(
+                    (ordinal, book_id))
+        for book_id, genre_id in book_genres:
+            genres_ids.setdefault(genre_id, []).append(book_id)
+
+        self.all = to_bitmap(ids)
+        self.available = to_bitmap(available)
+        self.authors = {k: to_bitmap(v) for k, v in authors_ids.items()}
+        self.publishers = {k: to_bitmap(v) for k, v in publishers_ids.items()}
+        self.genres = {k: to_bitmap(v) for k, v in genres_ids.items()}
+        self.years = {k: to_bitmap(v) for k, v in years_ids.items()}
+        for entries in self._year_entries.values():
+            entries.sort()
+        self._orders = {
+            mode: array("l", sorted(ids, key=self._sort_key(mode)))
+            for mode in SORT_MODES
+        }
+        self._results = OrderedDict()
+        self.loaded = True
+        # The unfiltered browse page is by far the most common request
+        self.facets()
+
+    def refresh(self, db: Session):
+        books = db.query(
+            models.Book.id,
+            models.Book.title_sort_key,
+            models.Book.author_id,
+            models.Book.publisher_id,
+            models.Book.is_available,
+            models.Book.publish_date
+        ).all()
+        book_genres = db.query(
+            models.BookGenre.book_id, models.BookGenre.genre_id).all()
+        authors = db.query(models.Author.id, models.Author.name).all()
+        self.load(books, book_genres, authors)
+
+    def ensure_fresh(self, db: Session):
+        cache_sync.poll(db)
+        if not self._stale:
+            return
+        with self._lock:
+            if self._stale:
+                # Cleared first so an invalidate() during the rebuild sticks,
+                # and set again if the rebuild fails so the next call retries
+                self._stale = False
+                try:
+                    self.refresh(db)
+                except BaseException:
+                    self._stale = True
+                    raise
+
+    def invalidate(self):
+        self._stale = True
+
+    def _grow(self, book_id: int):
+        if book_id >= len(self._title_keys):
+            grow = book_id + 1 - len(self._title_keys)
+            self._title_keys.extend([None] * grow)
+            self._publish_dates.extend([0] * grow)
+            self._author_of.extend([0] * grow)
+            self._publisher_of.extend([0] * grow)
+
+    def _sort_key(self, mode: str):
+        # Same keys and id tie-breaker as SQL; NULLs sort first as in SQLite
+        if mode == "title":
+            keys = self._title_keys
+            return lambda i: (keys[i] or "", i)
+        if mode == "author":
+            keys, author_of = self._author_keys, self._author_of
+            return lambda i: (keys.get(author_of[i]) or "", i)
+        dates = self._publish_dates
+        return lambda i: (dates[i], i)
+
+    # -- incremental maintenance -------------------------------------------
+
+    def apply(self, books, book_genres, authors):
+        """
+        Apply committed changes: full rows for changed books (or (id, None)
+        for deleted ones), the complete genre list of books whose genres
+        changed and (id, name) rows for changed authors.
+        """
+        with self._lock:
+            if not self.loaded or self._stale:
+                return
+            renamed = False
+            for author_id, name in authors:
+                key = author_sort_key(name)
+                renamed |= self._author_keys.get(author_id) != key
+                self._author_keys[author_id] = key
+            if renamed:
+                self._orders["author"] = array("l", sorted(
+                    self._orders["author"], key=self._sort_key("author")))
+            for row in books:
+                self._remove_book(row[0])
+                if row[1:] != (None,):
+                    self._add_book(*row)
+            for book_id, genre_ids in book_genres.items():
+                for genre_id in list(self.genres):
+                    _clear_bit(self.genres, genre_id, book_id)
+                for genre_id in genre_ids:
+                    _set_bit(self.genres, genre_id, book_id)
+            self._results = OrderedDict()
+
+    def _remove_book(self, book_id: int):
+        if not (self.all >> book_id) & 1:
+            return
+        # Columns still hold the old values, so the old sort keys are found
+        for mode in SORT_MODES:
+            order = self._orders[mode]
+            key = self._sort_key(mode)
+            del order[bisect_left(order, key(book_id), key=key)]
+        bit = ~(1 << book_id)
+        self.all &= bit
+        self.available &= bit
+        _clear_bit(self.authors, self._author_of[book_id], book_id)
+        _clear_bit(self.publishers, self._publisher_of[book_id], book_id)
+        ordinal = self._publish_dates[book_id]
+        if ordinal:
+            year = date.fromordinal(ordinal).year
+            _clear_bit(self.years, year, book_id)
+            entries = self._year_entries[year]
+            del entries[bisect_left(entries, (ordinal, book_id))]
+
+    def _add_book(self, book_id, title_key, author_id, publisher_id,
+                  is_available, publish_date):
+        self._grow(book_id)
+        self._title_keys[book_id] = title_key
+        self._author_of[book_id] = author_id or 0
+        self._publisher_of[book_id] = publisher_id or 0
+        self._publish_dates[book_id] = (
+            publish_date.toordinal() if publish_date else 0)
+        bit = 1 << book_id
+        self.all |= bit
+        if is_available:
+            self.available |= bit
+        _set_bit(self.authors, author_id or 0, book_id)
+        _set_bit(self.publishers, publisher_id or 0, book_id)
+        if publish_date is not None:
+            _set_bit(self.years, publish_date.year, book_id)
+            insort(self._year_entries.setdefault(publish_date.year, []),
+                   (publish_date.toordinal(), book_id))
+        for mode in SORT_MODES:
+            insort(self._orders[mode], book_id, key=self._sort_key(mode))
+
+    # -- queries -----------------------------------------------------------
+
+    def filter(
+        self,
+        available: Optional[bool] = None,
+        genre_id: Optional[int] = None,
+        author_id: Optional[int] = None,
+        publisher_id: Optional[int] = None,
+        published_from: Optional[date] = None,
+        published_to: Optional[date] = None
+    ) -> int:
+        bitmap = self.all
+        if available is True:
+            bitmap &= self.available
+        elif available is False:
+            bitmap &= ~self.available
+        if genre_id is not None:
+            bitmap &= self.genres.get(genre_id, 0)
+        if author_id is not None:
+            bitmap &= self.authors.get(author_id, 0)
+        if publisher_id is not None:
+            bitmap &= self.publishers.get(publisher_id, 0)
+        if published_from is not None or published_to is not None:
+            bitmap &= self._date_range(published_from, published_to)
+        return bitmap
+
+    def _date_range(self, start: Optional[date], end: Optional[date]) -> int:
+        first_year = start.year if start else min(self.years, default=0)
+        last_year = end.year if end else max(self.years, default=0)
+        low = start.toordinal() if start else 0
+        high = end.toordinal() if end else sys.maxsize
+        bitmap = 0
+        for year, year_bitmap in self.years.items():
+            if first_year < year < last_year:
+                bitmap |= year_bitmap
+            elif year == first_year or year == last_year:
+                entries = self._year_entries[year]
+                matched = entries[
+                    bisect_left(entries, (low, 0)):
+                    bisect_right(entries, (high, sys.maxsize))
+                ]
+                bitmap |= to_bitmap(book_id for _, book_id in matched)
+        return bitmap
+
+    def page(self, sort_by: str = "title", offset: int = 0, limit: int = 10,
+             **filters) -> list[int]:
+        """Return the ids of one sorted, filtered page of books"""
+        # apply() edits the sort orders in place
+        with self._lock:
+            order = self._orders[sort_by]
+            bitmap = self.filter(**filters)
+            if bitmap == self.all:
+                return list(order[offset:offset + limit])
+            if bitmap.bit_count() <= self.SPARSE_LIMIT:
+                return heapq.nsmallest(
+                    offset + limit, iter_bitmap(bitmap),
+                    key=self._sort_key(sort_by))[offset:]
+
+            # Sized to every indexed id, not just the highest match, since
+            # the walk goes through the whole order
+            members = bitmap.to_bytes(
+                (self.all.bit_length() + 7) // 8, "little")
+            page = []
+            for book_id in order:
+                if (members[book_id >> 3] >> (book_id & 7)) & 1:
+                    if offset:
+                        offset -= 1
+                        continue
+                    page.append(book_id)
+                    if len(page) == limit:
+                        break
+            return page
+
+    def facets(self, **filters) -> dict:
+        key = tuple(sorted(
+            (name, value) for name, value in filters.items()
+            if value is not None
+        ))
+        # The memo is shared by threadpool threads
+        with self._lock:
+            return self._facets(key, filters)
+
+    def _facets(self, key: tuple, filters: dict) -> dict:
+        results = self._results
+        if key in results:
+            results.move_to_end(key)
+            return results[key]
+
+        bitmap = self.filter(**filters)
+        total = bitmap.bit_count()
+        available = (bitmap & self.available).bit_count()
+        if bitmap == self.all:
+            # Without a filter every AND is a no-op, only the popcounts remain
+            authors = self._popcounts(self.authors)
+            publishers = self._popcounts(self.publishers)
+            genres = self._popcounts(self.genres)
+        elif total <= self.SPARSE_LIMIT:
+            ids = list(iter_bitmap(bitmap))
+            authors = Counter(self._author_of[i] for i in ids)
+            publishers = Counter(self._publisher_of[i] for i in ids)
+            genres = self._popcounts(self.genres, bitmap)
+        else:
+            authors = self._popcounts(self.authors, bitmap)
+            publishers = self._popcounts(self.publishers, bitmap)
+            genres = self._popcounts(self.genres, bitmap)
+
+        facets = {
+            "total": total,
+            "available": available,
+            "unavailable": total - available,
+            "genres": self._as_list(genres),
+            "authors": self._as_list(authors),
+            "publishers": self._as_list(publishers),
+        }
+        results[key] = facets
+        if len(results) > self.RESULT_CACHE_SIZE:
+            results.popitem(last=False)
+        return facets
+
+    @staticmethod
+    def _popcounts(facet: dict[int, int], bitmap: int = -1) -> dict[int, int]:
+        return {
+            value_id: (bitmap & value_bitmap).bit_count()
+            for value_id, value_bitmap in facet.items()
+        }
+
+    @staticmethod
+    def _as_list(counts: dict[int, int]) -> list[dict]:
+        return sorted(
+            ({"id": value_id, "count": count}
+             for value_id, count in counts.items() if count and value_id),
+            key=lambda c: (-c["count"], c["id"])
+        )
+
+    def memory_usage(self) -> dict:
+        """Approximate bytes held by the index, in total and per book"""
+        bitmaps = [self.all, self.available]
+        for facet in (self.authors, self.publishers, self.genres, self.years):
+            bitmaps.extend(facet.values())
+        sizes = {
+            "bitmaps": sum(sys.getsizeof(b) for b in bitmaps),
+            "columns": (
+                sys.getsizeof(self._title_keys)
+                + sum(sys.getsizeof(t) for t in self._title_keys if t)
+                + sys.getsizeof(self._publish_dates)
+                + sys.getsizeof(self._author_of)
+                + sys.getsizeof(self._publisher_of)
+            ),
+            "sort_orders": sum(
+                sys.getsizeof(order) for order in self._orders.values()),
+            "date_entries": sum(
+                sys.getsizeof(entries)
+                + sum(sys.getsizeof(entry) for entry in entries)
+                for entries in self._year_entries.values()),
+        }
+        books = self.all.bit_count()
+        total = sum(sizes.values())
+        return {
+            **sizes,
+            "total": total,
+            "books": books,
+            "per_book": total / books if books else 0.0,
+        }
+
+
+catalog_index = CatalogIndex()
+cache_sync.register("catalog", catalog_index.invalidate)
+
+
+def _pending_changes(session: Session) -> dict:
+    return session.info.setdefault(
+        "catalog_changes", {"books": set(), "genres": set(), "authors": set()})
+
+
+def touch_books(session: Session, *book_ids: int, genres: bool = False):
+    """
+    Mark books changed by Core statements, which the ORM hooks don't see;
+    genres=True when their book_genres rows changed too.
+    """
+    changes = _pending_changes(session)
+    changes["books"].update(book_ids)
+    if genres:
+        changes["genres"].update(book_ids)
+
+
+def reload_on_commit(session: Session):
+    """
+    Rebuild the index once the session commits, for changes too large to
+    apply row by row such as bulk loads. Other workers are told even when
+    this process doesn't poll, since loaders run as their own process.
+    """
+    session.info["catalog_reload"] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _track_catalog_changes(session, flush_context):
+    changes = None
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, models.Book):
+            kind, key = "books", obj.id
+        elif isinstance(obj, models.BookGenre):
+            kind, key = "genres", obj.book_id
+        elif isinstance(obj, models.Author):
+            kind, key = "authors", obj.id
+        else:
+            continue
+        changes = changes or _pending_changes(session)
+        changes[kind].add(key)
+
+
+@event.listens_for(Session, "before_commit")
+def _snapshot_catalog_changes(session):
+    # Commit flushes after this hook; flush first so the snapshot is complete
+    session.flush()
+    changes = session.info.pop("catalog_changes", None)
+    reload = session.info.get("catalog_reload", False)
+    if not changes and not reload:
+        return
+    # Other workers' indexes rebuild even when this one isn't loaded
+    cache_sync.bump(session, "catalog", always=reload)
+    if reload or not catalog_index.loaded:
+        return
+
+    books = {book_id: (book_id, None) for book_id in changes["books"]}
+    if books:
+        for row in session.query(
+            models.Book.id,
+            models.Book.title_sort_key,
+            models.Book.author_id,
+            models.Book.publisher_id,
+            models.Book.is_available,
+            models.Book.publish_date
+        ).filter(models.Book.id.in_(books)):
+            books[row.id] = tuple(row)
+    genres = {book_id: [] for book_id in changes["genres"]}
+    if genres:
+        for book_id, genre_id in session.query(
+            models.BookGenre.book_id, models.BookGenre.genre_id
+        ).filter(models.BookGenre.book_id.in_(genres)):
+            genres[book_id].append(genre_id)
+    authors = []
+    if changes["authors"]:
+        authors = session.query(models.Author.id, models.Author.name).filter(
+            models.Author.id.in_(changes["authors"])).all()
+    session.info["catalog_snapshot"] = (list(books.values()), genres, authors)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_catalog_changes(session):
+    if session.info.pop("catalog_reload", False):
+        catalog_index.invalidate()
+        return
+    snapshot = session.info.pop("catalog_snapshot", None)
+    if snapshot:
+        catalog_index.apply(*snapshot)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_changes(session):
+    session.info.pop("catalog_changes", None)
+    session.info.pop("catalog_snapshot", None)
+    session.info.pop("catalog_reload", None)
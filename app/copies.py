@@ -0,0 +1,74 @@
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import models
+from .catalog import touch_books
+
+
+def claim_copy(db: Session, book_id: int) -> bool:
+    """
+    Take one copy of a book off the shelf count; False if none is left.
+
+    A single conditional UPDATE, so two borrowers racing for the last copy
+    can't both win and the check never counts borrowing rows. `is_available`
+    is derived in the same statement (SET sees the pre-update values).
+    """
+    result = db.execute(
+        update(models.Book)
+        .where(models.Book.id == book_id, models.Book.available_copies > 0)
+        .values(available_copies=models.Book.available_copies - 1,
+                is_available=models.Book.available_copies > 1)
+    )
+    if result.rowcount == 0:
+        return False
+    touch_books(db, book_id)
+    return True
+
+
+def take_shelf_copy(db: Session, book_id: int) -> Optional[models.BookCopy]:
+    """
+    Pick a physical copy to hand out after a successful claim_copy.
+
+    Concurrent borrowers skip each other's locked rows instead of queueing
+    (a no-op on SQLite). Books loaded without copy rows return None and
+    circulate on the counter alone.
+    """
+    copy = db.query(models.BookCopy).filter(
+        models.BookCopy.book_id == book_id,
+        models.BookCopy.is_available == True
+    ).order_by(models.BookCopy.id).with_for_update(skip_locked=True).first()
+    if copy is not None:
+        copy.is_available = False
+    return copy
+
+
+def shelve_copy(db: Session, book_id: int,
+                copy: Optional[models.BookCopy] = None):
+    """Put a copy back on the shelf and count it as available."""
+    db.execute(
+        update(models.Book)
+        .where(models.Book.id == book_id)
+        .values(available_copies=models.Book.available_copies + 1,
+                is_available=True)
+    )
+    touch_books(db, book_id)
+    if copy is not None:
+        copy.is_available = True
+
+
+def add_copies(db: Session, book_id: int,
+               count: int) -> list[models.BookCopy]:
+    """Create new copy rows, not yet on the shelf; see holds.release_copy"""
+    db.execute(
+        update(models.Book)
+        .where(models.Book.id == book_id)
+        .values(total_copies=models.Book.total_copies + count)
+    )
+    touch_books(db, book_id)
+    copies = [models.BookCopy(book_id=book_id, is_available=False)
+              for _ in range(count)]
+    db.add_all(copies)
+    db.flush()
+    return copies
@@ -1,12 +1,57 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from . import config
+
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+
+
+def engine_options(url: str) -> dict:
+    """Backend specific create_engine() arguments"""
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        return {
+            "connect_args": {
+                "check_same_thread": False,
+                # Seconds to wait for another writer's lock
+                "timeout": config.DB_STATEMENT_TIMEOUT_MS / 1000,
+            }
+        }
+
+    options = {
+        "poolclass": QueuePool,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+    if backend == "postgresql":
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}"
+        }
+    return options
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./library.db"
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL)
 )
+
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a borrow or return is being written
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
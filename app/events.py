@@ -0,0 +1,109 @@
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+from typing import AsyncIterator, Optional
+
+
+class Subscription:
+    """
+    One client's bounded queue. When it is full the oldest event is
+    dropped, so a slow reader only loses stale updates and never blocks
+    the publisher.
+    """
+
+    def __init__(self, maxsize: int):
+        self.queue: deque = deque(maxlen=maxsize)
+        self.dropped = 0
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+
+    def _push(self, event: dict):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(event)
+
+    def _wake(self):
+        self._ready.set()
+
+    async def get(self) -> dict:
+        while not self.queue:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.queue.popleft()
+
+
+class AvailabilityBroker:
+    """In-process pub/sub of book availability changes"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, queue_size: Optional[int] = None) -> Subscription:
+        subscription = Subscription(queue_size or self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, book_id: int, is_available: bool):
+        """Fan an event out to every subscriber; safe to call from any thread"""
+        event = {
+            "id": next(self._ids),
+            "book_id": book_id,
+            "is_available": is_available,
+        }
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._push(event)
+            if subscription._loop is running_loop:
+                subscription._wake()
+            else:
+                subscription._loop.call_soon_threadsafe(subscription._wake)
+
+
+availability_broker = AvailabilityBroker()
+
+
+def format_sse(event: dict) -> str:
+    data = json.dumps(
+        {"book_id": event["book_id"], "is_available": event["is_available"]})
+    return f"id: {event['id']}\nevent: availability\ndata: {data}\n\n"
+
+
+async def availability_stream(
+    broker: AvailabilityBroker,
+    heartbeat_seconds: float = 15.0
+) -> AsyncIterator[str]:
+    """Server-Sent Events for one client, unsubscribing when it goes away"""
+    subscription = broker.subscribe()
+    try:
+        # Flush the headers right away so clients know they are connected
+        yield ": connected\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), heartbeat_seconds)
+            except asyncio.TimeoutError:
+                # Comment lines keep proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        broker.unsubscribe(subscription)
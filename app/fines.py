@@ -0,0 +1,89 @@
+import math
+import time
+from datetime import datetime, UTC
+from typing import Optional
+
+from sqlalchemy import bindparam, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from . import config, models
+from .database import SessionLocal
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # DateTime columns come back naive (UTC) from SQLite and PostgreSQL
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC).replace(tzinfo=None)
+    return value
+
+
+def loan_fine_cents(due_date: Optional[datetime], at: datetime) -> int:
+    """Fine for a loan at a point in time: per started day late, capped"""
+    if due_date is None:
+        return 0
+    late = (_naive_utc(at) - _naive_utc(due_date)).total_seconds()
+    if late <= 0:
+        return 0
+    days = math.ceil(late / 86400)
+    return min(days * config.FINE_PER_DAY_CENTS, config.FINE_MAX_CENTS)
+
+
+def assess_fines(db: Session, chunk_size: Optional[int] = None,
+                 now: Optional[datetime] = None) -> dict:
+    """
+    Recompute fines of overdue active loans, one chunk per transaction.
+
+    Chunks are keyset pages over ix_borrowing_history_overdue (active loans
+    by due date), and each chunk's changed fines go out as one Core
+    executemany UPDATE by primary key. Loans already at the cap are skipped.
+    Returns counts and timing of the run.
+    """
+    chunk_size = chunk_size or config.FINE_CHUNK_SIZE
+    now = _naive_utc(now or datetime.now(UTC))
+    history = models.BorrowingHistory
+    table = history.__table__
+    write_fines = update(table).where(
+        table.c.id == bindparam("loan_id")
+    ).values(fine_cents=bindparam("fine"), fine_assessed_at=now)
+    stats = {"scanned": 0, "updated": 0, "chunks": 0}
+    start = time.perf_counter()
+
+    last = None
+    while True:
+        query = select(history.id, history.due_date, history.fine_cents).where(
+            history.return_date.is_(None),
+            history.due_date < now,
+            history.fine_cents < config.FINE_MAX_CENTS
+        )
+        if last is not None:
+            query = query.where(tuple_(history.due_date, history.id) > last)
+        rows = db.execute(
+            query.order_by(history.due_date, history.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+
+        changes = []
+        for row in rows:
+            fine = loan_fine_cents(row.due_date, now)
+            if fine != row.fine_cents:
+                changes.append({"loan_id": row.id, "fine": fine})
+        if changes:
+            db.execute(write_fines, changes)
+        db.commit()
+
+        stats["scanned"] += len(rows)
+        stats["updated"] += len(changes)
+        stats["chunks"] += 1
+        last = tuple_(rows[-1].due_date, rows[-1].id)
+
+    elapsed = time.perf_counter() - start
+    stats["duration_ms"] = round(elapsed * 1000, 2)
+    stats["rows_per_second"] = round(stats["scanned"] / elapsed) \
+        if elapsed else 0
+    return stats
+
+
+def assess_fines_job() -> dict:
+    with SessionLocal() as db:
+        return assess_fines(db)
@@ -0,0 +1,58 @@
+import json
+from datetime import date, datetime
+from typing import Any, Iterable, Optional, Type
+
+from fastapi import HTTPException, Query
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError:  # in requirements.txt; answered with 406 without it
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def response_format(
+    format: str = Query("json", pattern="^(json|columnar|msgpack)$")
+) -> str:
+    """
+    Representation of a list response: json (default), columnar JSON with
+    one array per field, or msgpack records.
+    """
+    if format == "msgpack" and msgpack is None:
+        raise HTTPException(
+            status_code=406, detail="msgpack support is not installed")
+    return format
+
+
+def _encode_value(value: Any):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, BaseModel):  # embedded author/publisher
+        return value.model_dump()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def render_list(rows: Iterable[Any], schema: Type[BaseModel],
+                format: str) -> Optional[Response]:
+    """
+    Encode rows in a compact format, reading the schema's fields straight
+    off the ORM objects or result rows instead of building a model per row.
+    Returns None for plain json, which goes through the response model.
+    """
+    if format == "json":
+        return None
+    fields = list(schema.model_fields)
+    rows = list(rows)
+    if format == "columnar":
+        columns = {field: [getattr(row, field) for row in rows]
+                   for field in fields}
+        body = json.dumps(columns, default=_encode_value,
+                          separators=(",", ":"))
+        return Response(body, media_type="application/json")
+    records = [{field: getattr(row, field) for field in fields}
+               for row in rows]
+    return Response(msgpack.packb(records, default=_encode_value),
+                    media_type=MSGPACK_MEDIA_TYPE)
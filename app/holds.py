@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, UTC
+from typing import Optional
+
+from sqlalchemy.orm import Session, selectinload
+
+from . import config, models
+from .copies import shelve_copy
+from .database import SessionLocal
+from .events import availability_broker
+
+WAITING = "waiting"
+READY = "ready"
+FULFILLED = "fulfilled"
+EXPIRED = "expired"
+
+
+def next_waiting_hold(db: Session, book_id: int) -> Optional[models.Hold]:
+    return db.query(models.Hold).filter(
+        models.Hold.book_id == book_id,
+        models.Hold.status == WAITING
+    ).order_by(models.Hold.id).first()
+
+
+def queue_position(db: Session, hold: models.Hold) -> int:
+    return db.query(models.Hold.id).filter(
+        models.Hold.book_id == hold.book_id,
+        models.Hold.status == WAITING,
+        models.Hold.id <= hold.id
+    ).count()
+
+
+def release_copy(db: Session, book_id: int,
+                 copy: Optional[models.BookCopy] = None,
+                 now: Optional[datetime] = None) -> Optional[models.Hold]:
+    """
+    Hand a freed copy to the head of the book's hold queue, or shelve it.
+
+    Does not commit; returns the hold that now reserves the copy, if any.
+    """
+    now = now or datetime.now(UTC)
+    hold = next_waiting_hold(db, book_id)
+    if hold is None:
+        shelve_copy(db, book_id, copy)
+        return None
+    hold.status = READY
+    hold.ready_at = now
+    hold.expires_at = now + timedelta(hours=config.HOLD_PICKUP_HOURS)
+    hold.copy_id = copy.id if copy is not None else None
+    # Later lookups in the same transaction must see it leave the queue
+    db.flush()
+    return hold
+
+
+def ready_hold_for(db: Session, book_id: int,
+                   borrower_name: str) -> Optional[models.Hold]:
+    return db.query(models.Hold).filter(
+        models.Hold.book_id == book_id,
+        models.Hold.status == READY,
+        models.Hold.borrower_name == borrower_name
+    ).first()
+
+
+def expire_holds(db: Session, batch_size: Optional[int] = None,
+                 now: Optional[datetime] = None) -> int:
+    """
+    Expire ready holds past their pickup deadline, one batch per commit.
+
+    Each batch is a range read on ix_holds_status_expires_at, so the cost
+    follows the number of expired holds, not the size of the table.
+    Returns the number of holds expired.
+    """
+    batch_size = batch_size or config.HOLD_EXPIRY_BATCH_SIZE
+    now = now or datetime.now(UTC)
+    expired = 0
+    while True:
+        holds = db.query(models.Hold).options(
+            selectinload(models.Hold.book), selectinload(models.Hold.copy)
+        ).filter(
+            models.Hold.status == READY,
+            models.Hold.expires_at <= now
+        ).order_by(models.Hold.expires_at).limit(batch_size).all()
+        if not holds:
+            return expired
+
+        was_available = {hold.book_id: hold.book.is_available
+                         for hold in holds}
+        for hold in holds:
+            hold.status = EXPIRED
+        db.flush()
+        released = set()
+        for hold in holds:
+            if release_copy(db, hold.book_id, hold.copy, now) is None \
+                    and not was_available[hold.book_id]:
+                released.add(hold.book_id)
+        db.commit()
+        for book_id in released:
+            availability_broker.publish(book_id, True)
+        expired += len(holds)
+
+
+def expire_holds_job() -> int:
+    with SessionLocal() as db:
+        return expire_holds(db)
@@ -0,0 +1,189 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, UTC
+from typing import Callable, Optional
+
+from fastapi import Depends, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import config, models
+from .database import SessionLocal, get_db
+from .auth.utils import get_current_user
+from .auth.schemas import User
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotentReplay(Exception):
+    """Raised by the dependency to answer with a stored response"""
+
+    def __init__(self, record: models.IdempotencyRecord):
+        self.record = record
+
+
+async def body_hash(request: Request) -> str:
+    """SHA-256 of the request body, which can only be read on the loop"""
+    return hashlib.sha256(await request.body()).hexdigest()
+
+
+def idempotency(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    request_hash: str = Depends(body_hash),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Look up the Idempotency-Key of a POST before its handler runs.
+
+    A completed key replays its stored response (one indexed lookup, no
+    handler queries). A new key is claimed with a placeholder row that
+    IdempotentRoute fills in with the response. Reusing a key for a
+    different body is rejected, as is a retry while the first attempt is
+    still running. A plain function, so FastAPI runs its queries and commit
+    in the threadpool rather than on the event loop.
+    """
+    if idempotency_key is None:
+        return
+    scope = f"{current_user.username} {request.method} {request.url.path}"
+    now = datetime.now(UTC)
+
+    record = db.execute(select(models.IdempotencyRecord).where(
+        models.IdempotencyRecord.scope == scope,
+        models.IdempotencyRecord.key == idempotency_key
+    )).scalar_one_or_none()
+    if record is not None and record.expires_at.replace(tzinfo=UTC) <= now:
+        db.delete(record)
+        db.flush()
+        record = None
+    if record is not None:
+        if record.request_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was used with a different request")
+        if record.status_code is None:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is in progress")
+        raise IdempotentReplay(record)
+
+    record = models.IdempotencyRecord(
+        scope=scope, key=idempotency_key, request_hash=request_hash,
+        expires_at=now + timedelta(hours=config.IDEMPOTENCY_TTL_HOURS))
+    db.add(record)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is in progress")
+    request.state.idempotency = (db, record.id)
+
+
+class IdempotentRoute(APIRoute):
+    """
+    Route class giving POST endpoints Idempotency-Key support.
+
+    POST routes get the idempotency dependency; the handler wrapper
+    replays stored responses and records the outcome of first attempts.
+    Server errors release the key so the request can be retried.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        methods = kwargs.get("methods") or []
+        if "POST" in methods:
+            kwargs["dependencies"] = [
+                *(kwargs.get("dependencies") or []), Depends(idempotency)]
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def idempotent_handler(request: Request) -> Response:
+            try:
+                response = await handler(request)
+            except IdempotentReplay as replay:
+                return Response(
+                    content=replay.record.response_body,
+                    status_code=replay.record.status_code,
+                    media_type="application/json",
+                    headers={REPLAYED_HEADER: "true"})
+            except HTTPException as exc:
+                if exc.status_code < 500:
+                    await _finish(request, exc.status_code,
+                                  json.dumps({"detail": exc.detail}).encode())
+                else:
+                    await _release(request)
+                raise
+            except Exception:
+                await _release(request)
+                raise
+            if response.status_code < 500:
+                await _finish(request, response.status_code, response.body)
+            else:
+                await _release(request)
+            return response
+
+        return idempotent_handler
+
+
+def _claimed(request: Request):
+    return getattr(request.state, "idempotency", None)
+
+
+# Requests without a claimed key, including every GET, return straight away;
+# the others update the record in the threadpool, off the event loop.
+async def _finish(request: Request, status_code: int, body: bytes):
+    if claimed := _claimed(request):
+        await run_in_threadpool(_store_response, *claimed, status_code,
+                                body.decode())
+
+
+async def _release(request: Request):
+    if claimed := _claimed(request):
+        await run_in_threadpool(_delete_record, *claimed)
+
+
+# By the time the wrapper runs, get_db has closed the handler's session,
+# discarding anything it left uncommitted; the record is updated in a fresh
+# transaction on the same session.
+def _store_response(db: Session, record_id: int, status_code: int,
+                    body: str):
+    record = db.get(models.IdempotencyRecord, record_id)
+    record.status_code = status_code
+    record.response_body = body
+    db.commit()
+
+
+def _delete_record(db: Session, record_id: int):
+    db.execute(delete(models.IdempotencyRecord)
+               .where(models.IdempotencyRecord.id == record_id))
+    db.commit()
+
+
+def purge_expired_keys(db: Session, batch_size: int = 1000) -> int:
+    """Delete expired keys in batches along the expires_at index"""
+    purged = 0
+    now = datetime.now(UTC)
+    while True:
+        ids = db.execute(
+            select(models.IdempotencyRecord.id)
+            .where(models.IdempotencyRecord.expires_at <= now)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return purged
+        db.execute(delete(models.IdempotencyRecord)
+                   .where(models.IdempotencyRecord.id.in_(ids)))
+        db.commit()
+        purged += len(ids)
+
+
+def purge_expired_keys_job() -> int:
+    with SessionLocal() as db:
+        return purge_expired_keys(db)
@@ -1,17 +1,103 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from functools import partial
+
 from fastapi import FastAPI
-from .database import engine
-from . import models
-from .routers import books, authors, borrowings, genres, publishers
+from fastapi.middleware.gzip import GZipMiddleware
+from .database import SessionLocal
+from . import config
+from .catalog import catalog_index
+from .migrations import upgrade_schema
+from .archive import archive_history_job
+from .fines import assess_fines_job
+from .holds import expire_holds_job
+from .idempotency import purge_expired_keys_job
+from .outbox import OutboxRelay, relay_outbox_job, sink_from_url
+from .scheduler import scheduler
+from .singleflight import SingleFlightMiddleware
+from .profiling import ProfilingMiddleware
+from .auth.passwords import configure_work_factor
+from .routers import (
+    books, authors, borrowers, borrowings, genres, publishers, holds, jobs,
+    health
+)
 from .auth.router import router as auth_router
 
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+upgrade_schema()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_work_factor()
+    relay = None
+    if config.CATALOG_IN_MEMORY:
+        with SessionLocal() as db:
+            catalog_index.ensure_fresh(db)
+        usage = catalog_index.memory_usage()
+        logger.info(
+            "Catalog index loaded: %d books, %.1f MiB, %.0f bytes per book",
+            usage["books"], usage["total"] / 2**20, usage["per_book"]
+        )
+    if config.SCHEDULER_ENABLED and (
+        not config.SCHEDULER_LOCK_FILE
+        or scheduler.acquire_lock(config.SCHEDULER_LOCK_FILE)
+    ):
+        scheduler.add_job("expire_holds", expire_holds_job,
+                          config.HOLD_EXPIRY_INTERVAL_SECONDS)
+        scheduler.add_job("assess_fines", assess_fines_job,
+                          config.FINE_JOB_INTERVAL_SECONDS)
+        scheduler.add_job("archive_history", archive_history_job,
+                          config.ARCHIVE_INTERVAL_SECONDS)
+        scheduler.add_job("purge_idempotency_keys", purge_expired_keys_job,
+                          config.IDEMPOTENCY_PURGE_INTERVAL_SECONDS)
+        if sink := sink_from_url(config.OUTBOX_SINK):
+            relay = OutboxRelay(sink)
+            scheduler.add_job("relay_outbox",
+                              partial(relay_outbox_job, relay),
+                              config.OUTBOX_INTERVAL_SECONDS)
+        scheduler.start()
+    yield
+    await scheduler.stop()
+    if relay is not None:
+        # A relay run cancelled by stop() may still be sending in its thread
+        await asyncio.to_thread(relay.close)
+
+
+app = FastAPI(title="Library Management System API", lifespan=lifespan)
+
+if config.SINGLE_FLIGHT_PATHS:
+    app.add_middleware(SingleFlightMiddleware,
+                       prefixes=config.SINGLE_FLIGHT_PATHS,
+                       vary_headers=config.SINGLE_FLIGHT_VARY_HEADERS,
+                       exclude=config.SINGLE_FLIGHT_EXCLUDE_PATHS)
+
+# Outside single-flight, which runs profiled requests on their own
+if config.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware,
+                       users=config.PROFILE_USERS,
+                       per_minute=config.PROFILE_PER_MINUTE,
+                       burst=config.PROFILE_BURST,
+                       interval=config.PROFILE_SAMPLE_INTERVAL_MS / 1000)
 
-app = FastAPI(title="Library Management System API")
+# Added last so it is outermost: single-flight shares the uncompressed body
+# and each client gets it encoded per its Accept-Encoding; bodies under the
+# minimum size are sent as is
+if config.GZIP_MINIMUM_SIZE:
+    app.add_middleware(GZipMiddleware,
+                       minimum_size=config.GZIP_MINIMUM_SIZE,
+                       compresslevel=config.GZIP_LEVEL)
 
+app.include_router(health.router, tags=["health"])
 app.include_router(auth_router, tags=["authentication"])
 app.include_router(books.router, prefix="/books", tags=["books"])
 app.include_router(authors.router, prefix="/authors", tags=["authors"])
 app.include_router(borrowings.router, tags=["borrowings"])
+app.include_router(borrowers.router, prefix="/borrowers", tags=["borrowers"])
+app.include_router(holds.router, tags=["holds"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
 app.include_router(genres.router, prefix="/genres", tags=["genres"])
 app.include_router(publishers.router, prefix="/publishers",
                    tags=["publishers"])
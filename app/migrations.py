@@ -0,0 +1,145 @@
+"""
+Bring a database created by an earlier version up to the current models.
+
+    python -m app.migrations
+
+Runs at startup as well. Every step is idempotent: missing tables are
+created, columns added since a table was created are ALTERed in, missing or
+changed indexes are (re)built and the new columns are filled in from the
+data already there.
+"""
+from datetime import timedelta
+
+from sqlalchemy import Engine, bindparam, inspect, insert, select, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+
+from . import config, models
+from .borrowers import migrate_borrowers
+from .bulk import backfill_sort_keys
+from .database import Base, engine
+
+
+def add_missing_columns(db: Session) -> list[str]:
+    """ALTER in model columns missing from existing tables"""
+    bind = db.connection()
+    inspector = inspect(bind)
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"]
+                    for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            definition = CreateColumn(column).compile(dialect=bind.dialect)
+            references = "".join(
+                f" REFERENCES {fk.column.table.name} ({fk.column.name})"
+                for fk in column.foreign_keys)
+            bind.execute(text(
+                f"ALTER TABLE {table.name} ADD COLUMN {definition}"
+                f"{references}"))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def sync_indexes(db: Session) -> list[str]:
+    """Create missing model indexes and rebuild those whose columns changed"""
+    bind = db.connection()
+    inspector = inspect(bind)
+    synced = []
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"]: index["column_names"]
+                    for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            columns = [column.name for column in index.columns]
+            if existing.get(index.name) == columns:
+                continue
+            if index.name in existing:
+                index.drop(bind)
+            index.create(bind)
+            synced.append(index.name)
+    return synced
+
+
+def _backfill_copies(db: Session) -> int:
+    """
+    Give books from before copies were tracked their one copy.
+
+    Those books got the column defaults of one copy, on the shelf; a book
+    that was out has its counter zeroed and its copy handed to the active
+    loan. Returns the number of copies created.
+    """
+    if db.scalar(select(models.BookCopy.id).limit(1)) is not None:
+        return 0
+    books = models.Book.__table__
+    copies = models.BookCopy.__table__
+    loans = models.BorrowingHistory.__table__
+    db.execute(
+        update(books)
+        .where(books.c.is_available == False, books.c.available_copies > 0)
+        .values(available_copies=0)
+    )
+    created = db.execute(
+        insert(copies).from_select(
+            ["book_id", "is_available"],
+            select(books.c.id, books.c.available_copies > 0)
+            .where(books.c.total_copies == 1)
+        )
+    ).rowcount
+    db.execute(
+        update(loans)
+        .where(loans.c.return_date == None, loans.c.copy_id == None)
+        .values(copy_id=select(copies.c.id).where(
+            copies.c.book_id == loans.c.book_id,
+            copies.c.is_available == False).scalar_subquery())
+    )
+    return created
+
+
+def _backfill_due_dates(db: Session) -> int:
+    """
+    Due dates for loans made before loans had one, so the fines job sees
+    them. Returned loans are left alone; their fines were never owed.
+    """
+    loans = models.BorrowingHistory.__table__
+    rows = db.execute(
+        select(loans.c.id, loans.c.borrow_date)
+        .where(loans.c.due_date == None, loans.c.return_date == None,
+               loans.c.borrow_date != None)
+    ).all()
+    if rows:
+        period = timedelta(days=config.LOAN_PERIOD_DAYS)
+        db.execute(
+            update(loans).where(loans.c.id == bindparam("loan_id"))
+            .values(due_date=bindparam("due")),
+            [{"loan_id": loan_id, "due": borrow_date + period}
+             for loan_id, borrow_date in rows]
+        )
+    return len(rows)
+
+
+def upgrade_schema(bind: Engine = engine) -> dict:
+    """Create and ALTER the schema to the current models, then backfill"""
+    Base.metadata.create_all(bind=bind)
+    with Session(bind) as db:
+        stats = {
+            "columns_added": add_missing_columns(db),
+            "indexes_synced": sync_indexes(db),
+        }
+        db.commit()
+        stats["copies_created"] = _backfill_copies(db)
+        stats["due_dates_set"] = _backfill_due_dates(db)
+        # Books from before sort keys existed would sort first
+        stats["sort_keys_set"] = backfill_sort_keys(db)
+        db.commit()
+        # Loans from before borrowers would not count towards their limit
+        borrowers = migrate_borrowers(db)
+        stats["borrowers_created"] = borrowers["borrowers_created"]
+        stats["loans_linked"] = borrowers["loans_updated"]
+    return stats
+
+
+if __name__ == "__main__":
+    print(upgrade_schema())
@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Boolean, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Date, ForeignKey, Boolean, DateTime,
+    DDL, Index, JSON, Text, event, text, update
+)
+from sqlalchemy.orm import Session, attributes, relationship
 from datetime import datetime, UTC
 from .database import Base
+from .sortkeys import author_sort_key, title_sort_key
 from .auth.models import User  # Import User model
 
 
@@ -19,16 +23,42 @@ class Book(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
-    isbn = Column(Integer, unique=True, index=True)
+    # Denormalized sort keys (see app.sortkeys), kept current on flush
+    title_sort_key = Column(String)
+    author_sort_key = Column(String)
+    # 13 digits overflow a 32-bit INTEGER on PostgreSQL
+    isbn = Column(BigInteger, unique=True, index=True)
     publish_date = Column(Date)
     author_id = Column(Integer, ForeignKey("authors.id"))
     genres = relationship("BookGenre", back_populates="book")
     publisher_id = Column(Integer, ForeignKey("publishers.id"))
+    # Maintained as available_copies > 0 so filters stay a plain column test
     is_available = Column(Boolean, default=True)
+    total_copies = Column(Integer, default=1, server_default="1")
+    # Only changed with conditional UPDATEs; see app.holds.claim_copy
+    available_copies = Column(Integer, default=1, server_default="1")
 
     author = relationship("Author", back_populates="books")
     publisher = relationship("Publisher", back_populates="books")
     borrowing_history = relationship("BorrowingHistory", back_populates="book")
+    copies = relationship("BookCopy", back_populates="book")
+
+    # Composite indexes backing the filter combinations and sort modes of
+    # GET /books/; the trailing id is the tie-breaker of every sort
+    __table_args__ = (
+        Index("ix_books_title_sort_key", "title_sort_key", "id"),
+        Index("ix_books_author_sort_key", "author_sort_key", "id"),
+        Index("ix_books_publish_date_id", "publish_date", "id"),
+        Index("ix_books_available_title", "is_available", "title_sort_key",
+              "id"),
+        Index("ix_books_available_author", "is_available", "author_sort_key",
+              "id"),
+        Index("ix_books_available_publish_date", "is_available",
+              "publish_date", "id"),
+        Index("ix_books_author_publish_date", "author_id", "publish_date"),
+        Index("ix_books_publisher_title", "publisher_id", "title_sort_key",
+              "id"),
+    )
 
     @property
     def genre_ids(self) -> list[int]:
@@ -44,6 +74,11 @@ class BookGenre(Base):
     book = relationship("Book", back_populates="genres")
     genre = relationship("Genre", back_populates="books")
 
+    # The primary key only covers lookups by book; this one serves genre filters
+    __table_args__ = (
+        Index("ix_book_genres_genre_book", "genre_id", "book_id"),
+    )
+
 
 class Genre(Base):
     __tablename__ = "genres"
@@ -62,13 +97,184 @@ class Publisher(Base):
     books = relationship("Book", back_populates="publisher")
 
 
+class BookCopy(Base):
+    __tablename__ = "book_copies"
+
+    id = Column(Integer, primary_key=True, index=True)
+    book_id = Column(Integer, ForeignKey("books.id"))
+    # On the shelf; false while borrowed or reserved for a ready hold
+    is_available = Column(Boolean, default=True)
+
+    book = relationship("Book", back_populates="copies")
+
+    __table_args__ = (
+        Index("ix_book_copies_book_available", "book_id", "is_available"),
+    )
+
+
+class Borrower(Base):
+    __tablename__ = "borrowers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+
+    loans = relationship("BorrowingHistory", back_populates="borrower")
+
+
 class BorrowingHistory(Base):
     __tablename__ = "borrowing_history"
 
     id = Column(Integer, primary_key=True, index=True)
     book_id = Column(Integer, ForeignKey("books.id"))
+    copy_id = Column(Integer, ForeignKey("book_copies.id"), nullable=True)
+    # NULL only for loans written before borrowers existed; see
+    # app.borrowers.migrate_borrowers, run by app.migrations
+    borrower_id = Column(Integer, ForeignKey("borrowers.id"), nullable=True)
+    # Kept as given, so older clients and events still see the name
     borrower_name = Column(String)
     borrow_date = Column(DateTime, default=lambda: datetime.now(UTC))
+    due_date = Column(DateTime, nullable=True)
     return_date = Column(DateTime, nullable=True)
+    fine_cents = Column(Integer, default=0, server_default="0")
+    fine_assessed_at = Column(DateTime, nullable=True)
 
     book = relationship("Book", back_populates="borrowing_history")
+    copy = relationship("BookCopy")
+    borrower = relationship("Borrower", back_populates="loans")
+
+    __table_args__ = (
+        Index("ix_borrowing_history_book_borrow_date", "book_id",
+              "borrow_date"),
+        # A borrower's active (return_date IS NULL) or returned loans, newest
+        # first; id is explicit so PostgreSQL can walk it for the cursor too
+        Index("ix_borrowing_history_borrower_return_date", "borrower_id",
+              "return_date", "id"),
+        # Returned loans by age, for the archiver (partial, so active-loan
+        # lookups keep using the overdue index below)
+        Index("ix_borrowing_history_return_date", "return_date",
+              sqlite_where=text("return_date IS NOT NULL"),
+              postgresql_where=text("return_date IS NOT NULL")),
+        # Partial index: only active loans, in due order, for the fines job;
+        # fine_cents is covered so capped loans are skipped without lookups
+        Index("ix_borrowing_history_overdue", "due_date", "id", "fine_cents",
+              sqlite_where=text("return_date IS NULL"),
+              postgresql_where=text("return_date IS NULL")),
+        # Without AUTOINCREMENT SQLite hands the highest id out again once
+        # that loan is archived, and it would collide in the archive
+        {"sqlite_autoincrement": True},
+    )
+
+
+class BorrowingHistoryArchive(Base):
+    """Returned loans moved out of borrowing_history, same ids and columns"""
+    __tablename__ = "borrowing_history_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    book_id = Column(Integer, ForeignKey("books.id"))
+    copy_id = Column(Integer, ForeignKey("book_copies.id"), nullable=True)
+    borrower_id = Column(Integer, ForeignKey("borrowers.id"), nullable=True)
+    borrower_name = Column(String)
+    borrow_date = Column(DateTime)
+    due_date = Column(DateTime, nullable=True)
+    return_date = Column(DateTime)
+    fine_cents = Column(Integer, default=0, server_default="0")
+    fine_assessed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_borrowing_history_archive_book_borrow_date", "book_id",
+              "borrow_date"),
+    )
+
+
+class Hold(Base):
+    __tablename__ = "holds"
+
+    id = Column(Integer, primary_key=True, index=True)
+    book_id = Column(Integer, ForeignKey("books.id"))
+    borrower_name = Column(String)
+    # waiting -> ready (book reserved) -> fulfilled | expired
+    status = Column(String, default="waiting")
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    ready_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+    # Copy set aside for a ready hold
+    copy_id = Column(Integer, ForeignKey("book_copies.id"), nullable=True)
+
+    book = relationship("Book")
+    copy = relationship("BookCopy")
+
+    __table_args__ = (
+        # Head of a book's queue: first id among its waiting holds
+        Index("ix_holds_book_status_id", "book_id", "status", "id"),
+        # Ready holds ordered by pickup deadline, for batched expiry
+        Index("ix_holds_status_expires_at", "status", "expires_at"),
+    )
+
+
+class OutboxEvent(Base):
+    """Event awaiting delivery; deleted once the sink accepted it"""
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    topic = Column(String)
+    payload = Column(JSON)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    attempts = Column(Integer, default=0, server_default="0")
+    last_error = Column(String, nullable=True)
+
+
+class IdempotencyRecord(Base):
+    """Stored response of a POST made with an Idempotency-Key header"""
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # "<username> <METHOD> <path>", so keys never collide across routes/users
+    scope = Column(String)
+    key = Column(String(255))
+    request_hash = Column(String(64))
+    # NULL while the first request with the key is still running
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    expires_at = Column(DateTime, index=True)
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_scope_key", "scope", "key", unique=True),
+    )
+
+
+class CacheGeneration(Base):
+    """Change counter of a per-process cache, shared by all workers"""
+    __tablename__ = "cache_generations"
+
+    name = Column(String(64), primary_key=True)
+    generation = Column(BigInteger, default=0, nullable=False)
+
+
+event.listen(CacheGeneration.__table__, "after_create", DDL(
+    "INSERT INTO cache_generations (name, generation) VALUES ('catalog', 0)"))
+
+
+@event.listens_for(Session, "before_flush")
+def _sync_sort_keys(session, flush_context, instances):
+    with session.no_autoflush:
+        for obj in (*session.new, *session.dirty):
+            if isinstance(obj, Book):
+                new = obj in session.new
+                if new or attributes.get_history(obj, "title").has_changes():
+                    obj.title_sort_key = title_sort_key(obj.title)
+                if new or attributes.get_history(
+                        obj, "author_id").has_changes():
+                    author = session.get(Author, obj.author_id) \
+                        if obj.author_id is not None else None
+                    obj.author_sort_key = author_sort_key(
+                        author.name if author else None)
+            elif isinstance(obj, Author) and obj not in session.new \
+                    and attributes.get_history(obj, "name").has_changes():
+                # A rename re-keys all of the author's books in one statement
+                session.execute(
+                    update(Book.__table__)
+                    .where(Book.__table__.c.author_id == obj.id)
+                    .values(author_sort_key=author_sort_key(obj.name))
+                )
@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, UTC
+from typing import Optional
+
+import httpx
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from . import config, models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(db: Session, topic: str, payload: dict) -> models.OutboxEvent:
+    """
+    Add an event to the outbox in the caller's transaction.
+
+    It becomes visible to the relay only if the caller commits, so
+    downstream systems never see an event for a rolled back change.
+    """
+    event = models.OutboxEvent(topic=topic, payload=payload)
+    db.add(event)
+    return event
+
+
+class OutboxSink(ABC):
+    """Destination of relayed events; send() raises if delivery failed"""
+
+    @abstractmethod
+    def send(self, events: list[dict]):
+        """Deliver one batch, in order"""
+
+    def close(self):
+        """Release what send() keeps open; nothing by default"""
+
+
+class FileSink(OutboxSink):
+    """Appends events as JSON lines, synced to disk before acknowledging"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, events):
+        with open(self.path, "a", encoding="utf-8") as file:
+            for event in events:
+                file.write(json.dumps(event) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+
+class HttpSink(OutboxSink):
+    """POSTs each batch as a JSON array; any non-2xx response is a failure"""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.client = httpx.Client(timeout=timeout)
+
+    def send(self, events):
+        self.client.post(self.url, json=events).raise_for_status()
+
+    def close(self):
+        self.client.close()
+
+
+def sink_from_url(url: str) -> Optional[OutboxSink]:
+    if not url:
+        return None
+    if url.startswith("file:"):
+        return FileSink(url[len("file:"):])
+    if url.startswith(("http://", "https://")):
+        return HttpSink(url)
+    raise ValueError(f"Unsupported OUTBOX_SINK: {url}")
+
+
+class OutboxRelay:
+    """
+    Drains the outbox to a sink, oldest events first, in batches.
+
+    Delivery is at least once: a batch is deleted only after the sink
+    accepted it, so a crash in between sends it again. After a failure the
+    relay waits with exponential backoff before retrying the same batch,
+    keeping events in order.
+    """
+
+    def __init__(self, sink: OutboxSink, batch_size: Optional[int] = None):
+        self.sink = sink
+        self.batch_size = batch_size or config.OUTBOX_BATCH_SIZE
+        self.failures = 0
+        self.retry_at = 0.0
+        self.delivered = 0
+        self.failed_batches = 0
+        self.lag_seconds = 0.0
+        self.last_batch_ms: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Close the sink once a batch being sent has finished"""
+        with self._lock:
+            self.sink.close()
+
+    def backoff_seconds(self) -> float:
+        return min(config.OUTBOX_RETRY_BASE_SECONDS * 2 ** (self.failures - 1),
+                   config.OUTBOX_RETRY_MAX_SECONDS)
+
+    def run_once(self, db: Session, now: Optional[float] = None) -> dict:
+        """Deliver pending batches until the outbox is empty or a send fails"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now < self.retry_at:
+                return self.metrics(db)
+            while self._deliver_batch(db, now):
+                pass
+            return self.metrics(db)
+
+    def _deliver_batch(self, db: Session, now: float) -> bool:
+        events = db.execute(
+            select(models.OutboxEvent)
+            .order_by(models.OutboxEvent.id).limit(self.batch_size)
+        ).scalars().all()
+        if not events:
+            return False
+        ids = [event.id for event in events]
+        start = time.perf_counter()
+        try:
+            self.sink.send([{
+                "id": event.id,
+                "topic": event.topic,
+                "payload": event.payload,
+                "created_at": event.created_at.isoformat(),
+            } for event in events])
+        except Exception as exc:
+            db.execute(
+                update(models.OutboxEvent)
+                .where(models.OutboxEvent.id.in_(ids))
+                .values(attempts=models.OutboxEvent.attempts + 1,
+                        last_error=repr(exc)[:500])
+            )
+            db.commit()
+            self.failures += 1
+            self.failed_batches += 1
+            self.retry_at = now + self.backoff_seconds()
+            logger.warning("Outbox delivery failed, retrying in %.1f s: %r",
+                           self.backoff_seconds(), exc)
+            return False
+
+        db.execute(delete(models.OutboxEvent)
+                   .where(models.OutboxEvent.id.in_(ids)))
+        db.commit()
+        self.failures = 0
+        self.retry_at = 0.0
+        self.delivered += len(events)
+        self.last_batch_ms = round((time.perf_counter() - start) * 1000, 2)
+        return len(events) == self.batch_size
+
+    def metrics(self, db: Session) -> dict:
+        pending, oldest = db.execute(select(
+            func.count(models.OutboxEvent.id),
+            func.min(models.OutboxEvent.created_at)
+        )).one()
+        if oldest is not None:
+            oldest = oldest.replace(tzinfo=UTC) if oldest.tzinfo is None \
+                else oldest
+            self.lag_seconds = (datetime.now(UTC) - oldest).total_seconds()
+        else:
+            self.lag_seconds = 0.0
+        return {
+            "pending": pending,
+            "lag_seconds": round(self.lag_seconds, 3),
+            "delivered": self.delivered,
+            "failed_batches": self.failed_batches,
+            "consecutive_failures": self.failures,
+            "last_batch_ms": self.last_batch_ms,
+        }
+
+
+def relay_outbox_job(relay: OutboxRelay) -> dict:
+    with SessionLocal() as db:
+        return relay.run_once(db)
@@ -0,0 +1,224 @@
+"""
+Opt-in sampling profiles of single requests.
+
+A request with ?profile=1 (or an X-Profile: 1 header) from an allowed user
+is answered with the collapsed stacks of its own code instead of its usual
+body, one "frame;frame;frame count" line per distinct stack. Pipe it into
+flamegraph.pl or drop it on speedscope.app to get a flame graph.
+"""
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Optional, Sequence
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import MutableHeaders
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .auth.ratelimit import MemoryRateLimitStore, RateLimitStore
+from .auth.tokens import token_service
+
+# Set to a per-request marker while a request is profiled. Threadpool calls
+# copy the context, so worker threads running its sync code carry it too.
+_profiled: contextvars.ContextVar[Optional[object]] = contextvars.ContextVar(
+    "profiled", default=None)
+
+_TRUE = {"1", "true", "yes"}
+
+
+@lru_cache(maxsize=4096)
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    for path in sorted(filter(None, sys.path), key=len, reverse=True):
+        if filename.startswith(path + os.sep):
+            filename = filename[len(path) + 1:]
+            break
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """
+    Sample the stacks of one request every interval seconds.
+
+    Counts the event loop thread only while the request's task is the one
+    running, and worker threads only while they run a call made from it, so
+    concurrent requests don't show up in the profile.
+    """
+
+    def __init__(self, task: asyncio.Task, loop_thread: int, marker: object,
+                 interval: float):
+        self.task = task
+        self.loop_thread = loop_thread
+        self.marker = marker
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+            self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        loop = self.task.get_loop()
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(frame)
+                    frame = frame.f_back
+                frames.reverse()
+                if thread_id == self.loop_thread:
+                    if asyncio.current_task(loop) is not self.task:
+                        continue
+                else:
+                    start = self._worker_start(frames)
+                    if start is None:
+                        continue
+                    frames = frames[start:]
+                if frames:
+                    self.stacks[";".join(
+                        _frame_label(frame.f_code) for frame in frames)] += 1
+                    self.samples += 1
+
+    def _worker_start(self, frames) -> Optional[int]:
+        # Threadpool workers run each call through context.run() near the
+        # bottom of their stack; the call's frames start above that one
+        for depth, frame in enumerate(frames[:4]):
+            for value in frame.f_locals.values():
+                if isinstance(value, contextvars.Context) \
+                        and value.get(_profiled) is self.marker:
+                    return depth + 1
+        return None
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n"
+                       for stack, count in self.stacks.most_common())
+
+
+def _wants_profile(scope: Scope) -> bool:
+    headers = dict(scope.get("headers") or [])
+    if headers.get(b"x-profile", b"").decode().lower() in _TRUE:
+        return True
+    query = parse_qsl(scope.get("query_string", b"").decode())
+    return any(name == "profile" and value.lower() in _TRUE
+               for name, value in query)
+
+
+class ProfilingMiddleware:
+    """
+    Answer requests that ask for it with their own sampling profile.
+
+    Only bearers of a valid token for an active user in `users` (any user
+    when empty) get one, at most `burst` in a row and `per_minute` after
+    that across the process. Other requests asking for a profile are served
+    normally with an X-Profile-Skipped header saying why. Event streams are
+    never buffered: sampling stops and the stream passes through.
+    """
+
+    def __init__(self, app: ASGIApp, users: Sequence[str] = (),
+                 per_minute: float = 6, burst: int = 2,
+                 interval: float = 0.002,
+                 store: Optional[RateLimitStore] = None):
+        self.app = app
+        self.users = set(users)
+        self.per_minute = per_minute
+        self.burst = burst
+        self.interval = interval
+        self.store = store or MemoryRateLimitStore()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        refusal = self._refusal(scope)
+        if refusal is not None:
+            async def mark_skipped(message: Message):
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers["X-Profile-Skipped"] = refusal
+                await send(message)
+
+            await self.app(scope, receive, mark_skipped)
+            return
+
+        # Single-flight must not hand this request someone else's response
+        scope.setdefault("state", {})["profiling"] = True
+        marker = object()
+        sampler = Sampler(asyncio.current_task(), threading.get_ident(),
+                          marker, self.interval)
+        status = None
+        streaming = False
+
+        async def capture(message: Message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if headers.get("content-type", "").startswith(
+                        "text/event-stream"):
+                    streaming = True
+                    sampler.stop()
+                    headers["X-Profile-Skipped"] = "streaming"
+                    await send(message)
+                    return
+                status = message["status"]
+            elif streaming:
+                await send(message)
+
+        token = _profiled.set(marker)
+        sampler.start()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            sampler.stop()
+            _profiled.reset(token)
+        if streaming:
+            return
+
+        response = PlainTextResponse(sampler.collapsed(), headers={
+            "Cache-Control": "no-store",
+            "X-Profile-Status": str(status),
+            "X-Profile-Samples": str(sampler.samples),
+            "X-Profile-Duration-Ms": f"{sampler.duration * 1000:.2f}",
+            "X-Profile-Interval-Ms": f"{self.interval * 1000:g}",
+        })
+        await response(scope, receive, send)
+
+    def _refusal(self, scope: Scope) -> Optional[str]:
+        """Why this request can't be profiled, None when it can"""
+        headers = dict(scope.get("headers") or [])
+        scheme, _, token = headers.get(b"authorization", b"").decode(
+            "latin-1").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return "unauthenticated"
+        try:
+            payload = token_service.decode(token)
+        except Exception:  # JWTError, or anything a garbled token trips
+            return "unauthenticated"
+        username = payload.get("sub")
+        if username is None or not payload.get("active", True):
+            return "unauthenticated"
+        if self.users and username not in self.users:
+            return "forbidden"
+        if self.store.take("profile", self.burst, self.per_minute / 60,
+                           time.monotonic()):
+            return "rate-limited"
+        return None
@@ -1,14 +1,112 @@
+import sys
+
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased, selectinload
 
-from typing import List
+from typing import List, Optional
 
 from .. import models, schemas
 from ..database import get_db
+from ..batch import batch_ids, load_by_ids, ordered_batch
+from ..idempotency import IdempotentRoute
 from ..auth.utils import get_current_user
 from ..auth.schemas import User
 
-router = APIRouter()
+router = APIRouter(route_class=IdempotentRoute)
+
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """
+    Smallest string above all strings starting with prefix, None if no
+    such string exists. name >= prefix AND name < bound is an index range,
+    unlike LIKE 'prefix%'.
+    """
+    # The highest code point can't be incremented; carry into the previous
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return None
+    following = ord(stem[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        # Surrogates can't be encoded, skip to the next character
+        following = 0xE000
+    return stem[:-1] + chr(following)
+
+
+@router.get("/", response_model=List[schemas.AuthorWithBookCount],
+            summary="Get all authors",
+            description="""
+## ✍️ Get a list of authors ordered by name:
+
+- #### 🔎 **name_prefix**: Only authors whose name starts with this (case-sensitive);
+- #### ⏭️ **after**: Name of the last author of the previous page (keyset pagination);
+- #### 📖 **limit**: Maximum number of records to return (default: 10, max: 100);
+- #### 📚 **book_count**: Number of books written by each author.
+
+### No authentication required.
+""",
+            response_description="List of authors with their book counts"
+            )
+def get_authors(
+    db: Session = Depends(get_db),
+    name_prefix: Optional[str] = Query(None, min_length=1),
+    after: Optional[str] = Query(None),
+    limit: int = Query(10, ge=1, le=100)
+):
+    page = select(models.Author)
+    if name_prefix is not None:
+        page = page.where(models.Author.name >= name_prefix)
+        bound = prefix_upper_bound(name_prefix)
+        if bound is not None:
+            page = page.where(models.Author.name < bound)
+    if after is not None:
+        page = page.where(models.Author.name > after)
+    page = page.order_by(models.Author.name).limit(limit).cte("author_page")
+    author = aliased(models.Author, page)
+
+    # Counts are grouped for the authors of this page only
+    book_counts = select(
+        models.Book.author_id,
+        func.count(models.Book.id).label("book_count")
+    ).where(
+        models.Book.author_id.in_(select(page.c.id))
+    ).group_by(models.Book.author_id).subquery()
+
+    rows = db.query(
+        author, func.coalesce(book_counts.c.book_count, 0)
+    ).outerjoin(
+        book_counts, book_counts.c.author_id == author.id
+    ).order_by(author.name).all()
+
+    return [
+        schemas.AuthorWithBookCount(
+            id=row.id,
+            name=row.name,
+            birthdate=row.birthdate,
+            book_count=book_count
+        )
+        for row, book_count in rows
+    ]
+
+
+@router.get("/batch", response_model=schemas.AuthorBatch,
+            summary="Get authors by ID",
+            description="""
+## ✍️ Look up many authors at once:
+
+- #### 🔢 **ids**: Comma separated author IDs, at most 1000;
+- #### 📋 **items**: Found authors, in the order of `ids` (duplicates once);
+- #### ❓ **missing**: IDs that matched no author.
+
+### ⚡ One `IN` query for all IDs.
+""",
+            response_description="Found authors and missing IDs"
+            )
+def get_authors_batch(
+    ids: List[int] = Depends(batch_ids),
+    db: Session = Depends(get_db)
+):
+    return ordered_batch(load_by_ids(db, models.Author, ids), ids)
 
 
 @router.post("/", response_model=schemas.Author,
@@ -49,18 +147,28 @@ async def create_author(
 
 - #### 📖 Returns full book details;
 - #### 📅 Ordered by publication date;
-- #### ✅ Includes availability status.
+- #### ✅ Includes availability status;
+- #### 📄 Supports pagination (offset, limit).
 
 ### 🔑 Requires a valid author ID.
 """,
             response_description="List of author's books"
             )
-async def get_author_books(
+def get_author_books(
     author_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100)
 ):
-    author = db.query(models.Author).filter(
-        models.Author.id == author_id).first()
+    author = db.get(models.Author, author_id)
     if not author:
         raise HTTPException(status_code=404, detail="Author not found")
-    return author.books
+
+    # Walks ix_books_author_publish_date, which also yields the id tie-breaker
+    return db.query(models.Book).options(
+        selectinload(models.Book.genres)
+    ).filter(
+        models.Book.author_id == author_id
+    ).order_by(
+        models.Book.publish_date, models.Book.id
+    ).offset(offset).limit(limit).all()
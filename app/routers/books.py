@@ -1,28 +1,72 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import insert, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
 
-from typing import List
+from typing import List, Optional
 
-from datetime import datetime
+from datetime import date, datetime
 
-from .. import models, schemas
+from .. import config, models, schemas
 from ..database import get_db
+from ..batch import batch_ids, load_by_ids, ordered_batch
+from ..idempotency import IdempotentRoute
+from ..catalog import catalog_index, touch_books
+from ..copies import add_copies
+from ..holds import release_copy
+from ..outbox import enqueue
+from ..events import availability_broker, availability_stream
+from ..formats import render_list, response_format
 from ..auth.utils import get_current_user
 from ..auth.schemas import User
 
-router = APIRouter()
+router = APIRouter(route_class=IdempotentRoute)
+
+
+def book_filters(
+    available: Optional[bool] = Query(None),
+    genre_id: Optional[int] = Query(None),
+    author_id: Optional[int] = Query(None),
+    publisher_id: Optional[int] = Query(None),
+    published_from: Optional[date] = Query(None),
+    published_to: Optional[date] = Query(None)
+) -> schemas.BookFilters:
+    if published_from and published_to and published_from > published_to:
+        raise HTTPException(
+            status_code=400,
+            detail="published_from cannot be after published_to"
+        )
+    return schemas.BookFilters(
+        available=available,
+        genre_id=genre_id,
+        author_id=author_id,
+        publisher_id=publisher_id,
+        published_from=published_from,
+        published_to=published_to
+    )
 
 
 @router.get("/", response_model=List[schemas.Book],
             summary="Get all books",
             description="""
-## 📚 Get a list of books with pagination and sorting options:
+## 📚 Get a list of books with pagination, sorting and filtering options:
 
 #### 📖 **skip**: Number of records to skip (default: 0);
 #### 📖 **limit**: Maximum number of records to return (default: 10, max: 100);
-#### 📖 **sort_by**: Sort by field (title, author, or publish_date).
+#### 📖 **sort_by**: Sort by field (title, author, or publish_date); titles
+sort case- and accent-insensitively, ignoring a leading "The", "A" or "An";
+#### ✅ **available**: Only available (true) or borrowed (false) books;
+#### 🏷️ **genre_id**, ✍️ **author_id**, 🏢 **publisher_id**: Filter by related entity;
+#### 📅 **published_from** / **published_to**: Publish date range (inclusive);
+#### 📦 **format**: `json` (default), `columnar` (one array per field) or
+`msgpack` (msgpack records);
+#### 🧩 **include**: `author`, `publisher` or both (comma separated) embeds
+those objects in every book, one query per entity for the whole page.
 
-### 🔍 Returns a list of books ordered by the specified field.
+### 🔍 Filters can be combined and each is served by an index; with
+`genre_id` the genre's books are sorted for the page.
 """,
             response_description="List of books"
             )
@@ -30,18 +74,173 @@ def get_books(
     db: Session = Depends(get_db),
     offset: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
-    sort_by: str = Query("title", pattern="^(title|author|publish_date)$")
+    sort_by: str = Query("title", pattern="^(title|author|publish_date)$"),
+    filters: schemas.BookFilters = Depends(book_filters),
+    format: str = Depends(response_format),
+    include: Optional[str] = Query(
+        None, pattern="^(author|publisher)(,(author|publisher))?$")
 ):
-    query = db.query(models.Book)
+    if config.CATALOG_IN_MEMORY:
+        books = get_books_from_index(db, offset, limit, sort_by, filters)
+        return render_books(db, books, format, include)
+
+    # Genre ids for the whole page in one query, not one per row
+    query = db.query(models.Book).options(selectinload(models.Book.genres))
 
+    if filters.available is not None:
+        query = query.filter(models.Book.is_available == filters.available)
+    if filters.genre_id is not None:
+        query = query.join(models.BookGenre).filter(
+            models.BookGenre.genre_id == filters.genre_id)
+    if filters.author_id is not None:
+        query = query.filter(models.Book.author_id == filters.author_id)
+    if filters.publisher_id is not None:
+        query = query.filter(models.Book.publisher_id == filters.publisher_id)
+    if filters.published_from is not None:
+        query = query.filter(
+            models.Book.publish_date >= filters.published_from)
+    if filters.published_to is not None:
+        query = query.filter(models.Book.publish_date <= filters.published_to)
+
+    # Sort keys are denormalized onto books and ties broken by id, so every
+    # mode walks an index in a stable order without joining authors
     if sort_by == "title":
-        query = query.order_by(models.Book.title)
+        query = query.order_by(models.Book.title_sort_key, models.Book.id)
     elif sort_by == "author":
-        query = query.join(models.Author).order_by(models.Author.name)
+        query = query.order_by(models.Book.author_sort_key, models.Book.id)
     elif sort_by == "publish_date":
-        query = query.order_by(models.Book.publish_date)
+        query = query.order_by(models.Book.publish_date, models.Book.id)
+
+    books = query.offset(offset).limit(limit).all()
+    return render_books(db, books, format, include)
+
+
+def render_books(db: Session, books: list, format: str,
+                 include: Optional[str]):
+    if not include:
+        return render_list(books, schemas.Book, format) or books
+    expanded = expand_books(db, books, set(include.split(",")))
+    return (render_list(expanded, schemas.BookExpanded, format)
+            or JSONResponse(jsonable_encoder(expanded)))
+
+
+def expand_books(db: Session, books: list,
+                 include: set[str]) -> list[schemas.BookExpanded]:
+    # One IN query per embedded entity, whatever the page size
+    authors = publishers = {}
+    if "author" in include:
+        authors = load_by_ids(
+            db, models.Author, {book.author_id for book in books})
+    if "publisher" in include:
+        publishers = load_by_ids(
+            db, models.Publisher, {book.publisher_id for book in books})
+    expanded = []
+    for book in books:
+        author = authors.get(book.author_id)
+        publisher = publishers.get(book.publisher_id)
+        expanded.append(schemas.BookExpanded(
+            **schemas.Book.model_validate(book).model_dump(),
+            author=author and schemas.Author.model_validate(author),
+            publisher=publisher and schemas.Publisher.model_validate(publisher)
+        ))
+    return expanded
+
+
+def get_books_from_index(
+    db: Session,
+    offset: int,
+    limit: int,
+    sort_by: str,
+    filters: schemas.BookFilters
+):
+    # The index picks the page; the rows themselves are one primary key lookup
+    catalog_index.ensure_fresh(db)
+    ids = catalog_index.page(sort_by, offset, limit, **filters.model_dump())
+    books = load_by_ids(db, models.Book, ids, selectinload(models.Book.genres))
+    return ordered_batch(books, ids)["items"]
+
+
+@router.get("/batch", response_model=schemas.BookBatch,
+            summary="Get books by ID",
+            description="""
+## 📚 Look up many books at once:
+
+#### 🔢 **ids**: Comma separated book IDs, at most 1000;
+#### 📋 **items**: Found books, in the order of `ids` (duplicates once);
+#### ❓ **missing**: IDs that matched no book.
+
+### ⚡ One `IN` query for all IDs instead of a request per book.
+""",
+            response_description="Found books and missing IDs"
+            )
+def get_books_batch(
+    ids: List[int] = Depends(batch_ids),
+    db: Session = Depends(get_db)
+):
+    books = load_by_ids(db, models.Book, ids, selectinload(models.Book.genres))
+    return ordered_batch(books, ids)
+
+
+@router.get("/facets", response_model=schemas.BookFacets,
+            summary="Get catalog facet counts",
+            description="""
+## 🗂️ Get facet counts for a filtered set of books:
+
+#### 🔢 **total**, ✅ **available**, ⛔ **unavailable**: Book counts;
+#### 🏷️ **genres**, ✍️ **authors**, 🏢 **publishers**: Counts per related entity.
+
+### 🔍 Accepts the same filters as `GET /books/`.
+### ⚡ Served from an in-memory bitmap index, all facets in one pass.
+""",
+            response_description="Facet counts for the filtered books"
+            )
+def get_book_facets(
+    db: Session = Depends(get_db),
+    filters: schemas.BookFilters = Depends(book_filters)
+):
+    catalog_index.ensure_fresh(db)
+    return catalog_index.facets(**filters.model_dump())
+
+
+@router.get("/availability/stream",
+            response_class=StreamingResponse,
+            summary="Stream availability changes",
+            description="""
+## 📡 Server-Sent Events feed of book availability changes:
+
+#### 📚 Every borrow and return pushes `{"book_id": ..., "is_available": ...}`;
+#### 💓 A comment line is sent every 15 seconds to keep the connection open;
+#### 🐢 Slow clients lose the oldest pending events instead of blocking others.
+
+### 🔁 Replaces polling `GET /books/` for availability.
+""",
+            response_description="text/event-stream of availability events"
+            )
+async def stream_availability():
+    return StreamingResponse(
+        availability_stream(availability_broker),
+        media_type="text/event-stream",
+        # identity keeps GZipMiddleware from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+                 "Content-Encoding": "identity"}
+    )
 
-    return query.offset(offset).limit(limit).all()
+
+def _missing_reference(db: Session, book: schemas.BookCreate,
+                       genre_ids: List[int]) -> Optional[HTTPException]:
+    """404 for the book's author, publisher or genre that doesn't exist"""
+    if not db.get(models.Author, book.author_id):
+        return HTTPException(status_code=404, detail="Author not found")
+    if not db.get(models.Publisher, book.publisher_id):
+        return HTTPException(status_code=404, detail="Publisher not found")
+    # All genres with one query
+    found = set(db.scalars(
+        select(models.Genre.id).where(models.Genre.id.in_(genre_ids))))
+    missing = [genre_id for genre_id in genre_ids if genre_id not in found]
+    if missing:
+        return HTTPException(
+            status_code=404, detail=f"Genre {missing[0]} not found")
+    return None
 
 
 @router.post("/", response_model=schemas.Book,
@@ -54,7 +253,8 @@ def get_books(
 #### 📖 **publish_date**: Publication date (YYYY-MM-DD);
 #### 📖 **author_id**: ID of the existing author;
 #### 📖 **genre_ids**: List of genre IDs;
-#### 📖 **publisher_id**: ID of the existing publisher.
+#### 📖 **publisher_id**: ID of the existing publisher;
+#### 📖 **copies**: Number of physical copies (default 1).
 
 ### ⚠️ The publish date cannot be in the future.
 """,
@@ -65,55 +265,88 @@ def create_book(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    # Validate ISBN uniqueness
-    existing_isbn = db.query(models.Book).filter(
-        models.Book.isbn == book.isbn).first()
-    if existing_isbn:
-        raise HTTPException(
-            status_code=400, detail="Book with this ISBN already exists"
-        )
-
     # Validate Publish Date
     if book.publish_date > datetime.now().date():
         raise HTTPException(
             status_code=400, detail="Publish date cannot be in the future"
         )
 
-    # Validate author exists
-    author = db.query(models.Author).filter(
-        models.Author.id == book.author_id).first()
-    if not author:
-        raise HTTPException(status_code=404, detail="Author not found")
-
-    # Validate publisher exists
-    publisher = db.query(models.Publisher).filter(
-        models.Publisher.id == book.publisher_id).first()
-    if not publisher:
-        raise HTTPException(status_code=404, detail="Publisher not found")
-
-    # Create book without genres first
-    book_data = book.model_dump(exclude={'genre_ids'})
-    db_book = models.Book(**book_data)
-    db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
+    genre_ids = list(dict.fromkeys(book.genre_ids))
+    error = _missing_reference(db, book, genre_ids)
+    if error is not None:
+        raise error
 
-    # Add genres
-    for genre_id in book.genre_ids:
-        genre = db.query(models.Genre).filter(
-            models.Genre.id == genre_id).first()
-        if not genre:
+    # Book, genres, copies and the outbox event commit together; the unique
+    # index on isbn rejects duplicates without a pre-check query
+    book_data = book.model_dump(exclude={'genre_ids', 'copies'})
+    db_book = models.Book(**book_data, total_copies=book.copies,
+                          available_copies=book.copies)
+    db.add(db_book)
+    try:
+        db.flush()
+        if genre_ids:
+            db.execute(insert(models.BookGenre), [
+                {"book_id": db_book.id, "genre_id": genre_id}
+                for genre_id in genre_ids
+            ])
+            touch_books(db, db_book.id, genres=True)
+        db.add_all([models.BookCopy(book_id=db_book.id)
+                    for _ in range(book.copies)])
+        enqueue(db, "book.created", {
+            "book_id": db_book.id,
+            "title": db_book.title,
+            "isbn": db_book.isbn,
+            "copies": book.copies,
+        })
+        db.commit()
+    except IntegrityError as exc:
+        db.rollback()
+        # The unique index names isbn; anything else is a reference that
+        # went away since it was validated
+        if "isbn" in str(exc.orig):
             raise HTTPException(
-                status_code=404, detail=f"Genre {genre_id} not found")
-        book_genre = models.BookGenre(book_id=db_book.id, genre_id=genre_id)
-        db.add(book_genre)
-
-    db.commit()
-    db.refresh(db_book)
+                status_code=400, detail="Book with this ISBN already exists"
+            )
+        error = _missing_reference(db, book, genre_ids)
+        if error is None:
+            raise
+        raise error
 
     return db_book
 
 
+@router.post("/{book_id}/copies", response_model=schemas.Book,
+             summary="Add copies of a book",
+             description="""
+## 📚 Add physical copies of an existing book:
+
+#### 🔢 **count**: Number of copies to add (default 1);
+#### 📌 New copies go to waiting holds first, the rest to the shelf.
+
+### 🔐 Requires authentication.
+""",
+             response_description="The book with updated copy counts"
+             )
+def add_book_copies(
+    book_id: int,
+    count: int = Query(1, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    book = db.get(models.Book, book_id)
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+
+    was_available = book.is_available
+    for copy in add_copies(db, book_id, count):
+        release_copy(db, book_id, copy)
+    db.commit()
+    db.refresh(book)
+    if book.is_available and not was_available:
+        availability_broker.publish(book_id, True)
+    return book
+
+
 @router.get("/{book_id}/history", response_model=List[schemas.Borrowing],
             summary="Get book borrowing history",
             description="""
@@ -121,14 +354,35 @@ def create_book(
 
 #### 📅 Shows all past and current borrowings;
 #### 👤 Includes borrower names and dates;
-#### 🔄 Ordered by borrow date.
+#### 🔄 Ordered by borrow date;
+#### 🗄️ **include_archived**: Also return old loans moved to the archive;
+#### 📦 **format**: `json` (default), `columnar` or `msgpack`.
 
 ### 🔐 Requires authentication.
 """,
             response_description="List of borrowing records"
             )
-def get_book_history(book_id: int, db: Session = Depends(get_db)):
+def get_book_history(
+    book_id: int,
+    include_archived: bool = Query(False),
+    db: Session = Depends(get_db),
+    format: str = Depends(response_format)
+):
     book = db.query(models.Book).filter(models.Book.id == book_id).first()
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
-    return book.borrowing_history
+
+    sources = [models.BorrowingHistory.__table__]
+    if include_archived:
+        sources.append(models.BorrowingHistoryArchive.__table__)
+    columns = [column.name for column in
+               models.BorrowingHistoryArchive.__table__.columns]
+    query = union_all(*[
+        select(*[table.c[name] for name in columns])
+        .where(table.c.book_id == book_id)
+        for table in sources
+    ]).subquery()
+    history = db.execute(
+        select(query).order_by(query.c.borrow_date, query.c.id)
+    ).all()
+    return render_list(history, schemas.Borrowing, format) or history
@@ -0,0 +1,108 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+
+from typing import Optional
+
+from .. import models, schemas
+from ..database import get_db
+from ..auth.utils import get_current_user
+from ..auth.schemas import User
+
+router = APIRouter()
+
+
+def get_borrower_or_404(db: Session, borrower_id: int) -> models.Borrower:
+    borrower = db.get(models.Borrower, borrower_id)
+    if not borrower:
+        raise HTTPException(status_code=404, detail="Borrower not found")
+    return borrower
+
+
+@router.get("/{borrower_id}", response_model=schemas.Borrower,
+            summary="Get a borrower",
+            description="""
+## 👤 Borrower profile:
+
+- #### 🪪 **id**, **name** and when the borrower first borrowed;
+- #### 📚 **active_loans**: Books currently borrowed.
+
+### 🔐 Requires authentication.
+""",
+            response_description="The borrower"
+            )
+def get_borrower(
+    borrower_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    borrower = get_borrower_or_404(db, borrower_id)
+    active_loans = db.scalar(
+        select(func.count()).select_from(models.BorrowingHistory).where(
+            models.BorrowingHistory.borrower_id == borrower_id,
+            models.BorrowingHistory.return_date == None))
+    return schemas.Borrower(
+        id=borrower.id, name=borrower.name,
+        created_at=borrower.created_at, active_loans=active_loans)
+
+
+@router.get("/{borrower_id}/loans", response_model=schemas.LoanPage,
+            summary="Get a borrower's loans",
+            description="""
+## 📖 Loans of a borrower, newest first:
+
+- #### 🔎 **status**: `active` (not returned), `returned` or `all` (default);
+- #### 📖 **limit**: Maximum number of loans per page (default: 20, max: 100);
+- #### ⏭️ **cursor**: `next_cursor` of the previous page.
+
+### ⚡ `active` and `returned` pages walk
+ix_borrowing_history_borrower_return_date in order; `all` sorts the
+borrower's loans found through it.
+### 🔐 Requires authentication.
+""",
+            response_description="A page of loans and the next cursor"
+            )
+def get_borrower_loans(
+    borrower_id: int,
+    status: str = Query("all", pattern="^(all|active|returned)$"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    get_borrower_or_404(db, borrower_id)
+    loan = models.BorrowingHistory
+    query = select(loan).where(loan.borrower_id == borrower_id)
+
+    # Returned loans page by (return_date, id); the others by id alone
+    if status == "returned":
+        query = query.where(loan.return_date != None).order_by(
+            loan.return_date.desc(), loan.id.desc())
+    else:
+        if status == "active":
+            query = query.where(loan.return_date == None)
+        query = query.order_by(loan.id.desc())
+
+    if cursor is not None:
+        try:
+            if status == "returned":
+                returned_at, _, last_id = cursor.rpartition(",")
+                last = (datetime.fromisoformat(returned_at), int(last_id))
+                query = query.where(
+                    tuple_(loan.return_date, loan.id) < tuple_(*last))
+            else:
+                query = query.where(loan.id < int(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # One extra row tells whether there is a next page
+    loans = db.scalars(query.limit(limit + 1)).all()
+    next_cursor = None
+    if len(loans) > limit:
+        loans = loans[:limit]
+        last = loans[-1]
+        next_cursor = (f"{last.return_date.isoformat()},{last.id}"
+                       if status == "returned" else str(last.id))
+    return {"items": loans, "next_cursor": next_cursor}
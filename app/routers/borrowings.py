@@ -1,12 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from .. import models, schemas
+from .. import config, models, schemas
 from ..database import get_db
-from datetime import datetime, UTC
+from ..idempotency import IdempotentRoute
+from ..borrowers import borrower_id_for
+from ..copies import claim_copy, take_shelf_copy
+from ..fines import loan_fine_cents
+from ..holds import FULFILLED, ready_hold_for, release_copy
+from ..outbox import enqueue
+from ..events import availability_broker
+from datetime import datetime, timedelta, UTC
 from ..auth.utils import get_current_user
 from ..auth.schemas import User
 
-router = APIRouter()
+router = APIRouter(route_class=IdempotentRoute)
 
 MAX_BOOKS_PER_BORROWER = 3  # Configure as needed
 
@@ -19,8 +26,12 @@ MAX_BOOKS_PER_BORROWER = 3  # Configure as needed
 - #### 📚 **book_id**: ID of the book to borrow;
 - #### 👤 **borrower_name**: Name of the person borrowing the book.
 
+#### 📅 The loan is due after the configured loan period; late returns are
+fined per started day.
+
 ### ⚠️ Conditions:
-- #### 📌 Book must be available (not currently borrowed)
+- #### 📌 A copy of the book must be on the shelf, or reserved for this
+  borrower by a ready hold
 - #### 📌 Borrower cannot have more than 3 books at a time
 
 ### 🔐 Requires authentication.
@@ -32,17 +43,16 @@ async def borrow_book(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    # Check if book exists and is available
-    book = db.query(models.Book).filter(
-        models.Book.id == borrowing.book_id).first()
+    book = db.get(models.Book, borrowing.book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
-    if not book.is_available:
-        raise HTTPException(status_code=400, detail="Book is not available")
+    hold = ready_hold_for(db, book.id, borrowing.borrower_name)
+    borrower_id = borrower_id_for(db, borrowing.borrower_name)
 
     # Check borrower's current borrowed books
+    # (ix_borrowing_history_borrower_return_date)
     active_borrows = db.query(models.BorrowingHistory).filter(
-        models.BorrowingHistory.borrower_name == borrowing.borrower_name,
+        models.BorrowingHistory.borrower_id == borrower_id,
         models.BorrowingHistory.return_date == None
     ).count()
 
@@ -52,12 +62,34 @@ async def borrow_book(
             detail=f"Cannot borrow more than {MAX_BOOKS_PER_BORROWER} books"
         )
 
-    # Create borrowing record
-    db_borrowing = models.BorrowingHistory(**borrowing.model_dump())
-    book.is_available = False
+    if hold is not None:
+        # The copy was set aside for this borrower when it came back
+        copy = hold.copy
+        hold.status = FULFILLED
+    elif claim_copy(db, book.id):
+        copy = take_shelf_copy(db, book.id)
+    else:
+        raise HTTPException(status_code=400, detail="Book is not available")
 
+    # Create borrowing record
+    now = datetime.now(UTC)
+    db_borrowing = models.BorrowingHistory(
+        **borrowing.model_dump(), borrower_id=borrower_id,
+        copy_id=copy.id if copy else None, borrow_date=now,
+        due_date=now + timedelta(days=config.LOAN_PERIOD_DAYS))
     db.add(db_borrowing)
+    db.flush()
+    enqueue(db, "book.borrowed", {
+        "borrowing_id": db_borrowing.id,
+        "book_id": book.id,
+        "copy_id": db_borrowing.copy_id,
+        "borrower_id": borrower_id,
+        "borrower_name": db_borrowing.borrower_name,
+        "due_date": db_borrowing.due_date.isoformat(),
+    })
     db.commit()
+    if hold is None and not book.is_available:
+        availability_broker.publish(book.id, False)
     db.refresh(db_borrowing)
     return db_borrowing
 
@@ -67,8 +99,9 @@ async def borrow_book(
              description="""
 ## 📚 Return a borrowed book:
 
-- #### 📅 Updates the return date;
-- #### ✅ Makes the book available for new borrowings.
+- #### 📅 Updates the return date and settles any late fine;
+- #### ✅ Puts the copy back on the shelf, or reserves it for the first
+  waiting hold in the book's queue.
 
 ### ⚠️ Requires:
 - #### 🔑 Valid borrowing ID
@@ -85,7 +118,7 @@ async def return_book(
 ):
     borrowing = db.query(models.BorrowingHistory).filter(
         models.BorrowingHistory.id == borrowing_id
-    ).first()
+    ).with_for_update().first()
 
     if not borrowing:
         raise HTTPException(
@@ -94,8 +127,23 @@ async def return_book(
         raise HTTPException(status_code=400, detail="Book already returned")
 
     borrowing.return_date = datetime.now(UTC)
-    borrowing.book.is_available = True
+    # Settle the fine now; the fines job only revisits active loans
+    borrowing.fine_cents = loan_fine_cents(
+        borrowing.due_date, borrowing.return_date)
+    was_available = borrowing.book.is_available
+    hold = release_copy(db, borrowing.book_id, borrowing.copy)
+    enqueue(db, "book.returned", {
+        "borrowing_id": borrowing.id,
+        "book_id": borrowing.book_id,
+        "copy_id": borrowing.copy_id,
+        "borrower_id": borrowing.borrower_id,
+        "borrower_name": borrowing.borrower_name,
+        "fine_cents": borrowing.fine_cents,
+        "reserved_for_hold": hold.id if hold is not None else None,
+    })
 
     db.commit()
+    if hold is None and not was_available:
+        availability_broker.publish(borrowing.book_id, True)
     db.refresh(borrowing)
     return borrowing
@@ -3,10 +3,11 @@ from sqlalchemy.orm import Session
 from typing import List
 from .. import models, schemas
 from ..database import get_db
+from ..idempotency import IdempotentRoute
 from ..auth.utils import get_current_user
 from ..auth.schemas import User
 
-router = APIRouter()
+router = APIRouter(route_class=IdempotentRoute)
 
 
 @router.get("/", response_model=List[schemas.Genre],
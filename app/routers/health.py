@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+
+router = APIRouter()
+
+
+@router.get("/healthz",
+            summary="Liveness probe",
+            description="""
+## 💓 Answers as long as the worker process serves requests.
+
+### ⚡ Touches nothing else, so a slow database never restarts workers.
+""",
+            response_description="Process is alive"
+            )
+def healthz():
+    return {"status": "ok"}
+
+
+@router.get("/readyz",
+            summary="Readiness probe",
+            description="""
+## 🚦 Ready when the database answers a `SELECT 1`.
+
+### ⚠️ Returns 503 while the database is unreachable.
+""",
+            response_description="Worker can serve traffic"
+            )
+def readyz(db: Session = Depends(get_db)):
+    try:
+        db.execute(text("SELECT 1"))
+    except SQLAlchemyError:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ready"}
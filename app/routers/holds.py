@@ -0,0 +1,96 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List
+from .. import models, schemas
+from ..database import get_db
+from ..idempotency import IdempotentRoute
+from ..holds import READY, WAITING, queue_position
+from ..auth.utils import get_current_user
+from ..auth.schemas import User
+
+router = APIRouter(route_class=IdempotentRoute)
+
+
+@router.post("/books/{book_id}/holds", response_model=schemas.Hold,
+             summary="Place a hold on a book",
+             description="""
+## 📌 Join the hold queue of a borrowed book:
+
+- #### 📚 **book_id**: ID of the book to reserve;
+- #### 👤 **borrower_name**: Name of the person placing the hold.
+
+### ⚙️ Behaviour:
+- #### 🔢 Holds are served first come, first served;
+- #### 📖 When the book is returned it is reserved for the first hold in
+  the queue, which then has a limited time to borrow it;
+- #### ⏰ Unclaimed holds expire and the book moves to the next hold.
+
+### ⚠️ Conditions:
+- #### 📌 Book must not be available (borrow it directly instead)
+- #### 📌 Borrower cannot hold the same book twice
+
+### 🔐 Requires authentication.
+""",
+             response_description="The created hold with its queue position"
+             )
+def place_hold(
+    book_id: int,
+    hold: schemas.HoldCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    book = db.get(models.Book, book_id)
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    if book.is_available:
+        raise HTTPException(
+            status_code=400, detail="Book is available, borrow it instead")
+
+    duplicate = db.query(models.Hold.id).filter(
+        models.Hold.book_id == book_id,
+        models.Hold.status.in_([WAITING, READY]),
+        models.Hold.borrower_name == hold.borrower_name
+    ).first()
+    if duplicate:
+        raise HTTPException(
+            status_code=400, detail="Borrower already holds this book")
+
+    db_hold = models.Hold(book_id=book_id, borrower_name=hold.borrower_name)
+    db.add(db_hold)
+    db.commit()
+    db.refresh(db_hold)
+    db_hold.position = queue_position(db, db_hold)
+    return db_hold
+
+
+@router.get("/books/{book_id}/holds", response_model=List[schemas.Hold],
+            summary="Get the hold queue of a book",
+            description="""
+## 📋 List the active holds on a book:
+
+- #### ✅ The ready hold (if any) comes first;
+- #### 🔢 Waiting holds follow in queue order with their position.
+
+### 🔐 Requires authentication.
+""",
+            response_description="Active holds in queue order"
+            )
+def get_holds(
+    book_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if not db.get(models.Book, book_id):
+        raise HTTPException(status_code=404, detail="Book not found")
+
+    ready = db.query(models.Hold).filter(
+        models.Hold.book_id == book_id,
+        models.Hold.status == READY
+    ).all()
+    waiting = db.query(models.Hold).filter(
+        models.Hold.book_id == book_id,
+        models.Hold.status == WAITING
+    ).order_by(models.Hold.id).all()
+    for position, hold in enumerate(waiting, start=1):
+        hold.position = position
+    return ready + waiting
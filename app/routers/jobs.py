@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+from typing import Dict
+from .. import schemas
+from ..scheduler import scheduler
+from ..auth.utils import get_current_user
+from ..auth.schemas import User
+
+router = APIRouter()
+
+
+@router.get("/", response_model=Dict[str, schemas.JobStats],
+            summary="Get background job statistics",
+            description="""
+## ⏱️ Statistics of the scheduled background jobs:
+
+- #### 🔢 Run and error counts;
+- #### ⏱️ Duration of the last run;
+- #### 📊 Result of the last run (e.g. rows scanned and updated per run).
+
+### 🔐 Requires authentication.
+""",
+            response_description="Statistics per job name"
+            )
+def get_jobs(current_user: User = Depends(get_current_user)):
+    return scheduler.stats()
@@ -3,10 +3,12 @@ from sqlalchemy.orm import Session
 from typing import List
 from .. import models, schemas
 from ..database import get_db
+from ..batch import batch_ids, load_by_ids, ordered_batch
+from ..idempotency import IdempotentRoute
 from ..auth.utils import get_current_user
 from ..auth.schemas import User
 
-router = APIRouter()
+router = APIRouter(route_class=IdempotentRoute)
 
 
 @router.get("/", response_model=List[schemas.Publisher],
@@ -30,6 +32,26 @@ def get_publishers(
     return db.query(models.Publisher).offset(skip).limit(limit).all()
 
 
+@router.get("/batch", response_model=schemas.PublisherBatch,
+            summary="Get publishers by ID",
+            description="""
+## 🏢 Look up many publishers at once:
+
+- #### 🔢 **ids**: Comma separated publisher IDs, at most 1000;
+- #### 📋 **items**: Found publishers, in the order of `ids` (duplicates once);
+- #### ❓ **missing**: IDs that matched no publisher.
+
+### ⚡ One `IN` query for all IDs.
+""",
+            response_description="Found publishers and missing IDs"
+            )
+def get_publishers_batch(
+    ids: List[int] = Depends(batch_ids),
+    db: Session = Depends(get_db)
+):
+    return ordered_batch(load_by_ids(db, models.Publisher, ids), ids)
+
+
 @router.post("/", response_model=schemas.Publisher,
              summary="Create a new publisher",
              description="""
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, every process runs jobs
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], Any]
+    interval: float
+    runs: int = 0
+    errors: int = 0
+    last_result: Any = None
+    last_duration_ms: Optional[float] = None
+    last_error: Optional[str] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+
+class Scheduler:
+    """
+    Runs blocking maintenance jobs periodically off the event loop.
+
+    Each job runs in a worker thread every `interval` seconds (first run
+    after one interval), so a slow batch never stalls request handling.
+    A failing run is logged and counted; the job keeps its schedule.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self._lock_file = None
+
+    def acquire_lock(self, path: str) -> bool:
+        """
+        Try to become the one process running jobs among workers sharing
+        `path`. The lock is held until stop() or process exit, so when the
+        holder dies the worker started to replace it takes over.
+        """
+        if fcntl is None or self._lock_file is not None:
+            return True
+        lock_file = open(path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def add_job(self, name: str, func: Callable[[], Any],
+                interval: float) -> Job:
+        job = Job(name, func, interval)
+        self.jobs[name] = job
+        return job
+
+    def run_job(self, name: str) -> Any:
+        """Run a job once in the calling thread and record its stats."""
+        job = self.jobs[name]
+        start = time.perf_counter()
+        try:
+            job.last_result = job.func()
+            job.last_error = None
+            return job.last_result
+        except Exception as exc:
+            job.errors += 1
+            job.last_error = repr(exc)
+            logger.exception("Scheduled job %s failed", name)
+        finally:
+            job.runs += 1
+            job.last_duration_ms = (time.perf_counter() - start) * 1000
+
+    async def _loop(self, job: Job):
+        while True:
+            await asyncio.sleep(job.interval)
+            await asyncio.to_thread(self.run_job, job.name)
+
+    def start(self):
+        for job in self.jobs.values():
+            if job.task is None:
+                job.task = asyncio.create_task(self._loop(job))
+
+    async def stop(self):
+        tasks: List[asyncio.Task] = []
+        for job in self.jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+                tasks.append(job.task)
+                job.task = None
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            job.name: {
+                "interval": job.interval,
+                "runs": job.runs,
+                "errors": job.errors,
+                "last_result": job.last_result,
+                "last_duration_ms": job.last_duration_ms,
+                "last_error": job.last_error,
+            }
+            for job in self.jobs.values()
+        }
+
+
+scheduler = Scheduler()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, field_validator, ConfigDict
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Any, Optional, List
 
 
 class AuthorBase(BaseModel):
@@ -23,6 +23,10 @@ class Author(AuthorBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class AuthorWithBookCount(Author):
+    book_count: int
+
+
 class BookBase(BaseModel):
     title: str
     # Must be exactly 13 digits
@@ -46,12 +50,15 @@ class BookBase(BaseModel):
 
 
 class BookCreate(BookBase):
-    pass
+    # Physical copies on the shelf
+    copies: int = Field(1, ge=1, le=1000)
 
 
 class Book(BookBase):
     id: int
     is_available: bool
+    total_copies: int = 1
+    available_copies: int = 1
 
     @classmethod
     def model_validate(cls, obj):
@@ -64,6 +71,8 @@ class Book(BookBase):
             "author_id": obj.author_id,
             "publisher_id": obj.publisher_id,
             "is_available": obj.is_available,
+            "total_copies": obj.total_copies,
+            "available_copies": obj.available_copies,
             "genre_ids": obj.genre_ids
         }
         return cls(**data)
@@ -71,6 +80,34 @@ class Book(BookBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class BookBatch(BaseModel):
+    items: List[Book]
+    missing: List[int]
+
+
+class BookFilters(BaseModel):
+    available: Optional[bool] = None
+    genre_id: Optional[int] = None
+    author_id: Optional[int] = None
+    publisher_id: Optional[int] = None
+    published_from: Optional[date] = None
+    published_to: Optional[date] = None
+
+
+class FacetCount(BaseModel):
+    id: int
+    count: int
+
+
+class BookFacets(BaseModel):
+    total: int
+    available: int
+    unavailable: int
+    genres: List[FacetCount]
+    authors: List[FacetCount]
+    publishers: List[FacetCount]
+
+
 class GenreBase(BaseModel):
     name: str
 
@@ -104,6 +141,22 @@ class Publisher(PublisherBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class AuthorBatch(BaseModel):
+    items: List[Author]
+    missing: List[int]
+
+
+class PublisherBatch(BaseModel):
+    items: List[Publisher]
+    missing: List[int]
+
+
+class BookExpanded(Book):
+    # Embedded with GET /books/?include=author,publisher
+    author: Optional[Author] = None
+    publisher: Optional[Publisher] = None
+
+
 class BorrowingBase(BaseModel):
     book_id: int
     borrower_name: str
@@ -115,6 +168,49 @@ class BorrowingCreate(BorrowingBase):
 
 class Borrowing(BorrowingBase):
     id: int
+    copy_id: Optional[int] = None
+    borrower_id: Optional[int] = None
     borrow_date: datetime
+    due_date: Optional[datetime] = None
     return_date: Optional[datetime]
+    fine_cents: int = 0
     model_config = ConfigDict(from_attributes=True)
+
+
+class Borrower(BaseModel):
+    id: int
+    name: str
+    created_at: datetime
+    active_loans: int = 0
+    model_config = ConfigDict(from_attributes=True)
+
+
+class LoanPage(BaseModel):
+    items: List[Borrowing]
+    # Pass back as ?cursor= for the next page; null on the last page
+    next_cursor: Optional[str] = None
+
+
+class HoldCreate(BaseModel):
+    borrower_name: str
+
+
+class Hold(HoldCreate):
+    id: int
+    book_id: int
+    status: str
+    created_at: datetime
+    ready_at: Optional[datetime]
+    expires_at: Optional[datetime]
+    # 1-based place in the book's queue while waiting
+    position: Optional[int] = None
+    model_config = ConfigDict(from_attributes=True)
+
+
+class JobStats(BaseModel):
+    interval: float
+    runs: int
+    errors: int
+    last_result: Any = None
+    last_duration_ms: Optional[float] = None
+    last_error: Optional[str] = None
@@ -0,0 +1,70 @@
+"""
+Run the API with one uvicorn worker per CPU core.
+
+    python -m app.serve [--host 0.0.0.0] [--port 8000] [--workers N]
+
+With more than one worker, cross-worker cache invalidation is switched on
+and only one worker runs the background jobs (see the README). The bcrypt
+cost for BCRYPT_TARGET_MS is measured here, once, and handed to the workers.
+"""
+import argparse
+import os
+import tempfile
+
+import uvicorn
+
+from . import config
+from .auth.passwords import calibrate_rounds
+
+
+def worker_count(cpu_count: int | None = None) -> int:
+    """WEB_CONCURRENCY if set, else one worker per core"""
+    if config.WEB_CONCURRENCY > 0:
+        return config.WEB_CONCURRENCY
+    return max(1, cpu_count or os.cpu_count() or 1)
+
+
+def worker_environment(workers: int, port: int) -> dict[str, str]:
+    """Settings the workers need to share one database safely"""
+    if workers <= 1:
+        return {}
+    return {
+        "CACHE_SYNC_INTERVAL_SECONDS": "1",
+        "SCHEDULER_LOCK_FILE": os.path.join(
+            tempfile.gettempdir(), f"library-scheduler-{port}.lock"),
+    }
+
+
+def pinned_work_factor() -> dict[str, str]:
+    """
+    Calibrate BCRYPT_TARGET_MS once, for every worker: workers measuring on
+    their own can pick different costs and rehash each other's hashes.
+    """
+    if config.BCRYPT_TARGET_MS <= 0:
+        return {}
+    rounds = calibrate_rounds(config.BCRYPT_TARGET_MS)
+    return {"BCRYPT_ROUNDS": str(rounds), "BCRYPT_TARGET_MS": "0"}
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=worker_count())
+    args = parser.parse_args(argv)
+
+    # Workers inherit the environment; explicit settings win
+    for name, value in worker_environment(args.workers, args.port).items():
+        os.environ.setdefault(name, value)
+    os.environ.update(pinned_work_factor())
+
+    # Upgrade the schema once, before workers race to import the app
+    from .migrations import upgrade_schema
+    upgrade_schema()
+
+    uvicorn.run("app.main:app", host=args.host, port=args.port,
+                workers=args.workers, proxy_headers=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import asyncio
+from typing import Callable, Hashable, Optional, Sequence
+from urllib.parse import parse_qsl
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+def request_key(scope: Scope,
+                vary_headers: Sequence[str] = ()) -> Hashable:
+    """Path, query parameters in sorted order and the listed header values"""
+    query = tuple(sorted(parse_qsl(scope.get("query_string", b"").decode(),
+                                   keep_blank_values=True)))
+    headers = dict(scope.get("headers") or [])
+    varies = tuple(headers.get(name.encode()) for name in vary_headers)
+    return scope["path"], query, varies
+
+
+class SingleFlightMiddleware:
+    """
+    Coalesce concurrent identical GET requests into one execution.
+
+    The first request for a key (the leader) runs normally and its response
+    is recorded as it streams out. Requests with the same key arriving
+    while it runs wait for it and get the recorded status, headers and
+    body, without touching the database or serializing again. Nothing is
+    kept once the leader finishes, so responses are never staler than a
+    request that started at the same moment.
+
+    Event streams are never shared: paths under `exclude` skip coalescing,
+    and when a leader turns out to be a stream anyway, or fails, the waiting
+    requests run on their own and the stream is no longer recorded. Neither
+    are profiled requests, whose response is their own profile.
+    """
+
+    def __init__(self, app: ASGIApp, prefixes: Sequence[str],
+                 key_func: Optional[Callable[[Scope], Hashable]] = None,
+                 vary_headers: Sequence[str] = (),
+                 exclude: Sequence[str] = ()):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+        self.exclude = tuple(exclude)
+        self.key_func = key_func or (
+            lambda scope: request_key(scope, vary_headers))
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "GET" \
+                or not scope["path"].startswith(self.prefixes) \
+                or scope["path"].startswith(self.exclude) \
+                or scope.get("state", {}).get("profiling"):
+            await self.app(scope, receive, send)
+            return
+
+        key = self.key_func(scope)
+        flight = self._inflight.get(key)
+        if flight is not None:
+            response = await asyncio.shield(flight)
+            if response is not None:
+                self.coalesced += 1
+                start, body = response
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+            await self.app(scope, receive, send)
+            return
+
+        flight = asyncio.get_running_loop().create_future()
+        self._inflight[key] = flight
+        start: Optional[Message] = None
+        body: list[bytes] = []
+        recording = True
+
+        def release(response):
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+            if not flight.done():
+                flight.set_result(response)
+
+        async def record(message: Message):
+            nonlocal start, recording
+            if message["type"] == "http.response.start":
+                headers = dict(message.get("headers") or [])
+                if headers.get(b"content-type", b"").startswith(
+                        b"text/event-stream"):
+                    # Streams run until the client leaves; keep none of it
+                    recording = False
+                    release(None)
+                start = message
+            elif recording and message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, record)
+        except BaseException:
+            release(None)
+            raise
+        if recording:
+            release((start, b"".join(body)) if start is not None else None)
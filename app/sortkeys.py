@@ -0,0 +1,29 @@
+import unicodedata
+from typing import Optional
+
+# Ignored at the start of titles, "The Hobbit" sorts under H
+LEADING_ARTICLES = ("the ", "a ", "an ")
+
+
+def _fold(text: str) -> str:
+    # Case- and accent-insensitive with collapsed whitespace, so a plain
+    # binary index on the key orders like a collation would
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+def title_sort_key(title: Optional[str]) -> Optional[str]:
+    if title is None:
+        return None
+    key = _fold(title)
+    for article in LEADING_ARTICLES:
+        if key.startswith(article) and len(key) > len(article):
+            return key[len(article):]
+    return key
+
+
+def author_sort_key(name: Optional[str]) -> Optional[str]:
+    if name is None:
+        return None
+    return _fold(name)
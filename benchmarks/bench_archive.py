@@ -0,0 +1,79 @@
+"""
+Hot borrowing_history query latency before and after archiving.
+
+Seeds a throwaway SQLite file with ten years of loans (see bench_fines),
+times the queries the borrowing endpoints run against the hot table, moves
+loans returned more than --after-days ago to the archive and times them
+again.
+
+    python -m benchmarks.bench_archive --rows 2000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.archive import archive_history
+from app.database import Base
+from app.routers.books import get_book_history
+
+from .bench_fines import NOW, seed
+
+
+def measure(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--books", type=int, default=10_000)
+    parser.add_argument("--after-days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_archive.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    seed(engine, args.rows, 0.02, args.books)
+    db = sessionmaker(bind=engine)()
+
+    history = models.BorrowingHistory
+    cases = {
+        # borrow_book: active loans of a borrower
+        "active loans of borrower": lambda: db.query(history).filter(
+            history.borrower_name == "Reader 12345",
+            history.return_date == None).count(),
+        "GET /books/{id}/history": lambda: get_book_history(
+            book_id=42, include_archived=False, db=db),
+        "... include_archived": lambda: get_book_history(
+            book_id=42, include_archived=True, db=db),
+        "count(*)": lambda: db.scalar(
+            select(func.count()).select_from(history)),
+    }
+
+    before = {label: measure(fn, args.repeat) for label, fn in cases.items()}
+    stats = archive_history(db, older_than_days=args.after_days, now=NOW)
+    print(f"archived {stats['archived']} of {args.rows} loans in "
+          f"{stats['batches']} batches, {stats['duration_ms'] / 1000:.1f} s")
+    db.execute(select(func.count()).select_from(history))
+    db.connection().exec_driver_sql("ANALYZE")
+    after = {label: measure(fn, args.repeat) for label, fn in cases.items()}
+
+    print(f"{'query':<30} {'before':>10} {'after':>10}")
+    for label in cases:
+        print(f"{label:<30} {before[label]:8.2f}ms {after[label]:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
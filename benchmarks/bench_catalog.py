@@ -0,0 +1,131 @@
+"""
+GET /books/ served by SQL versus the in-memory catalog index.
+
+Seeds a throwaway SQLite file, then times the get_books handler with
+CATALOG_IN_MEMORY off and on, and reports the index memory per book.
+
+    python -m benchmarks.bench_catalog --books 200000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import config, models, schemas
+from app.bulk import backfill_sort_keys
+from app.catalog import catalog_index
+from app.database import Base
+from app.routers.books import get_books
+
+
+def seed(engine, books: int, authors: int, publishers: int, genres: int):
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Author), [
+            {"id": i, "name": f"Author {i:06d}", "birthdate": date(1950, 1, 1)}
+            for i in range(1, authors + 1)
+        ])
+        conn.execute(insert(models.Publisher), [
+            {"id": i, "name": f"Publisher {i}", "established_year": 1900}
+            for i in range(1, publishers + 1)
+        ])
+        conn.execute(insert(models.Genre), [
+            {"id": i, "name": f"Genre {i}"} for i in range(1, genres + 1)
+        ])
+        conn.execute(insert(models.Book), [
+            {
+                "id": i,
+                "title": f"Title {rng.randrange(10**9):09d}",
+                "isbn": 9780000000000 + i,
+                "publish_date": date.fromordinal(
+                    date(1950, 1, 1).toordinal() + rng.randrange(27000)),
+                "author_id": rng.randrange(1, authors + 1),
+                "publisher_id": rng.randrange(1, publishers + 1),
+                "is_available": rng.random() < 0.7,
+            }
+            for i in range(1, books + 1)
+        ])
+        conn.execute(insert(models.BookGenre), [
+            {"book_id": i, "genre_id": g}
+            for i in range(1, books + 1)
+            for g in rng.sample(range(1, genres + 1), 2)
+        ])
+        conn.exec_driver_sql("ANALYZE")
+
+
+def measure(label: str, fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--authors", type=int, default=2_000)
+    parser.add_argument("--publishers", type=int, default=50)
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_catalog.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    seed(engine, args.books, args.authors, args.publishers, args.genres)
+    db = sessionmaker(bind=engine)()
+    backfill_sort_keys(db)
+    db.connection().exec_driver_sql("ANALYZE")
+    db.commit()
+
+    start = time.perf_counter()
+    catalog_index.ensure_fresh(db)
+    print(f"index built for {args.books} books in "
+          f"{time.perf_counter() - start:.2f} s")
+    usage = catalog_index.memory_usage()
+    print(f"index memory: {usage['total'] / 2**20:.1f} MiB, "
+          f"{usage['per_book']:.0f} bytes per book "
+          f"(bitmaps {usage['bitmaps'] / 2**20:.1f} MiB, "
+          f"columns {usage['columns'] / 2**20:.1f} MiB, "
+          f"sort orders {usage['sort_orders'] / 2**20:.1f} MiB)")
+
+    cases = {
+        "title, no filter": ("title", {}),
+        "title, offset 5000": ("title", {"_offset": 5000}),
+        "author, available": ("author", {"available": True}),
+        "publish_date, genre": ("publish_date", {"genre_id": 3}),
+        "title, available + genre + publisher": (
+            "title", {"available": True, "genre_id": 3, "publisher_id": 7}),
+        "title, date range": ("title", {
+            "published_from": date(1990, 1, 1),
+            "published_to": date(1999, 12, 31)}),
+    }
+    print(f"{'case':<40} {'sql':>10} {'index':>10}")
+    for label, (sort_by, filters) in cases.items():
+        filters = dict(filters)
+        offset = filters.pop("_offset", 0)
+
+        def run():
+            db.expunge_all()
+            books = get_books(db=db, offset=offset, limit=20, sort_by=sort_by,
+                              filters=schemas.BookFilters(**filters))
+            # Serialising reads genre_ids, as the response model does
+            [schemas.Book.model_validate(book) for book in books]
+
+        config.CATALOG_IN_MEMORY = False
+        sql = measure(label, run, args.repeat)
+        config.CATALOG_IN_MEMORY = True
+        index = measure(label, run, args.repeat)
+        print(f"{label:<40} {sql:8.2f}ms {index:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Facet counts over a synthetic catalog.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_facets --books 1000000
+"""
+import argparse
+import random
+import time
+from datetime import date
+
+from app.catalog import CatalogIndex
+
+
+def build(books: int, authors: int, publishers: int, genres: int) -> CatalogIndex:
+    rng = random.Random(42)
+    rows = [
+        (
+            book_id,
+            rng.randrange(authors),
+            rng.randrange(publishers),
+            rng.random() < 0.7,
+            date.fromordinal(date(1950, 1, 1).toordinal() + rng.randrange(27000)),
+        )
+        for book_id in range(1, books + 1)
+    ]
+    book_genres = [
+        (book_id, genre_id)
+        for book_id in range(1, books + 1)
+        for genre_id in rng.sample(range(genres), 2)
+    ]
+    index = CatalogIndex()
+    index.load(rows, book_genres)
+    return index
+
+
+def measure(label: str, fn, repeat: int, before=None):
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<40} p50 {timings[len(timings) // 2]:8.2f} ms"
+          f"   max {timings[-1]:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--authors", type=int, default=200)
+    parser.add_argument("--publishers", type=int, default=50)
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = build(args.books, args.authors, args.publishers, args.genres)
+    print(f"built index for {args.books} books in "
+          f"{time.perf_counter() - start:.2f} s")
+
+    cases = {
+        "no filter": {},
+        "available": {"available": True},
+        "available + genre + publisher": {
+            "available": True, "genre_id": 3, "publisher_id": 7},
+        "date range": {
+            "published_from": date(1990, 1, 1),
+            "published_to": date(1999, 12, 31)},
+    }
+    for label, filters in cases.items():
+        # Cold: drop memoised results so every run recomputes the bitmaps
+        measure(f"{label} (cold)", lambda: index.facets(**filters),
+                args.repeat, before=index._results.clear)
+        measure(f"{label} (cached)", lambda: index.facets(**filters),
+                args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Overdue fine assessment over a large borrowing history.
+
+Seeds a throwaway SQLite file with mostly returned loans and a share of
+active ones, then times assess_fines (first run writes every fine, the
+second finds nothing to change) and the overdue lookup with and without
+the partial ix_borrowing_history_overdue index.
+
+    python -m benchmarks.bench_fines --rows 10000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.database import Base
+from app.fines import assess_fines
+
+NOW = datetime(2024, 6, 1)
+OVERDUE_SQL = (
+    "SELECT count(*) FROM borrowing_history {hint} "
+    "WHERE return_date IS NULL AND due_date < ?"
+)
+
+
+def sqlite_datetime(value: datetime) -> str:
+    # The storage format SQLAlchemy uses, so keyset comparisons line up
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def seed(engine, rows: int, active_share: float, books: int):
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Author), [
+            {"id": 1, "name": "Author", "birthdate": date(1950, 1, 1)}])
+        conn.execute(insert(models.Publisher), [
+            {"id": 1, "name": "Publisher", "established_year": 1900}])
+        conn.execute(insert(models.Book), [
+            {"id": i, "title": f"Title {i}", "isbn": 9780000000000 + i,
+             "publish_date": date(2000, 1, 1), "author_id": 1,
+             "publisher_id": 1}
+            for i in range(1, books + 1)
+        ])
+
+    raw = engine.raw_connection()
+    cursor = raw.cursor()
+    chunk = 200_000
+    for offset in range(0, rows, chunk):
+        batch = []
+        for i in range(offset, min(offset + chunk, rows)):
+            borrowed = NOW - timedelta(minutes=rng.randrange(10 * 365 * 1440))
+            due = borrowed + timedelta(days=14)
+            active = rng.random() < active_share
+            returned = None if active else (
+                borrowed + timedelta(days=rng.randrange(1, 30)))
+            batch.append((i + 1, rng.randrange(1, books + 1), f"Reader {i}",
+                          sqlite_datetime(borrowed), sqlite_datetime(due),
+                          returned and sqlite_datetime(returned), 0))
+        cursor.executemany(
+            "INSERT INTO borrowing_history (id, book_id, borrower_name, "
+            "borrow_date, due_date, return_date, fine_cents) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+        raw.commit()
+    cursor.execute("ANALYZE")
+    raw.commit()
+    raw.close()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--active-share", type=float, default=0.02)
+    parser.add_argument("--books", type=int, default=10_000)
+    parser.add_argument("--chunk-size", type=int, default=5_000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_fines.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    _, seed_ms = timed(lambda: seed(
+        engine, args.rows, args.active_share, args.books))
+    print(f"seeded {args.rows} loans in {seed_ms / 1000:.1f} s")
+
+    with engine.connect() as conn:
+        cutoff = sqlite_datetime(NOW)
+        for label, hint in (("partial index", ""),
+                            ("full scan", "NOT INDEXED")):
+            (count,), ms = timed(lambda: conn.exec_driver_sql(
+                OVERDUE_SQL.format(hint=hint), (cutoff,)).one())
+            print(f"overdue lookup ({label}): {count} loans in {ms:.1f} ms")
+
+    db = sessionmaker(bind=engine)()
+    for run in ("first run", "second run"):
+        stats = assess_fines(db, chunk_size=args.chunk_size, now=NOW)
+        print(f"assess_fines {run}: {stats['scanned']} scanned, "
+              f"{stats['updated']} updated in {stats['chunks']} chunks, "
+              f"{stats['duration_ms']:.0f} ms "
+              f"({stats['rows_per_second']} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
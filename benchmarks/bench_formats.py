@@ -0,0 +1,105 @@
+"""
+Encode time and payload size of a GET /books/ page per response format.
+
+Builds in-memory books (no database), then for json, columnar and msgpack
+(when installed) reports the encode CPU per page and the body size raw and
+gzipped at a few levels.
+
+    python -m benchmarks.bench_formats --rows 100
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+
+from app import schemas
+from app.formats import msgpack, render_list
+
+
+def make_books(rows: int) -> list:
+    rng = random.Random(42)
+    return [
+        SimpleNamespace(
+            id=i,
+            title=f"Title {rng.randrange(10**9):09d}",
+            isbn=9780000000000 + i,
+            publish_date=date(1950, 1, 1) + timedelta(days=rng.randrange(27000)),
+            author_id=rng.randrange(1, 5000),
+            publisher_id=rng.randrange(1, 200),
+            genre_ids=rng.sample(range(1, 50), 2),
+            is_available=rng.random() < 0.7,
+            total_copies=2,
+            available_copies=1,
+        )
+        for i in range(1, rows + 1)
+    ]
+
+
+def make_history(rows: int) -> list:
+    start = datetime(2020, 1, 1)
+    return [
+        SimpleNamespace(
+            id=i, book_id=1, copy_id=i % 3 + 1,
+            borrower_name=f"Borrower {i % 500}",
+            borrow_date=start + timedelta(days=i),
+            due_date=start + timedelta(days=i + 14),
+            return_date=start + timedelta(days=i + 10),
+            fine_cents=0,
+        )
+        for i in range(1, rows + 1)
+    ]
+
+
+def encode_json(rows, schema) -> bytes:
+    # What FastAPI does for a response_model: validate, serialize, dump
+    models = [schema.model_validate(row) for row in rows]
+    return json.dumps(jsonable_encoder(models), separators=(",", ":")).encode()
+
+
+def timed(func, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = func()
+    return (time.perf_counter() - start) / repeat, body
+
+
+def report(name: str, rows: list, schema, repeat: int):
+    encoders = {
+        "json": lambda: encode_json(rows, schema),
+        "columnar": lambda: render_list(rows, schema, "columnar").body,
+    }
+    if msgpack is not None:
+        encoders["msgpack"] = lambda: render_list(rows, schema, "msgpack").body
+
+    print(f"\n{name}: {len(rows)} rows per page")
+    print(f"{'format':10} {'encode ms':>10} {'raw B':>8} "
+          f"{'gzip1 B':>8} {'gzip5 B':>8} {'gzip9 B':>8} {'gzip5 ms':>9}")
+    for fmt, encode in encoders.items():
+        seconds, body = timed(encode, repeat)
+        sizes = [len(gzip.compress(body, level)) for level in (1, 5, 9)]
+        gzip_seconds, _ = timed(lambda: gzip.compress(body, 5), repeat)
+        print(f"{fmt:10} {seconds * 1000:10.3f} {len(body):8} "
+              f"{sizes[0]:8} {sizes[1]:8} {sizes[2]:8} "
+              f"{gzip_seconds * 1000:9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    if msgpack is None:
+        print("msgpack is not installed, skipping that format")
+
+    report("GET /books/", make_books(args.rows), schemas.Book, args.repeat)
+    report("GET /books/{id}/history", make_history(args.rows),
+           schemas.Borrowing, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
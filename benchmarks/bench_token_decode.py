@@ -0,0 +1,50 @@
+"""
+Access token verification cost per request.
+
+Compares python-jose called the way get_current_user used to (raw secret,
+key parsed on every call) with the TokenService backends.
+
+    python -m benchmarks.bench_token_decode
+"""
+import argparse
+import time
+
+from jose import jwt
+
+from app.auth.tokens import ALGORITHM, TokenService
+
+SECRET = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
+
+
+def measure(label: str, fn, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call = (time.perf_counter() - start) / iterations * 1e6
+    print(f"{label:<36} {per_call:8.2f} us/token")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    args = parser.parse_args()
+
+    claims = {"sub": "testuser", "uid": 1, "active": True,
+              "exp": int(time.time()) + 3600}
+    services = {
+        backend: TokenService({"default": SECRET}, "default", backend)
+        for backend in ("jose", "stdlib")
+    }
+    token = services["stdlib"].encode(claims)
+
+    measure("python-jose, raw secret",
+            lambda: jwt.decode(token, SECRET, algorithms=[ALGORITHM]),
+            args.iterations)
+    measure("TokenService jose, cached key",
+            lambda: services["jose"].decode(token), args.iterations)
+    measure("TokenService stdlib, cached HMAC",
+            lambda: services["stdlib"].decode(token), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,10 @@
+import os
+
+# Cheapest bcrypt cost for tests; must be set before the app is imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# Jobs would run against the on-disk database, not the test engine
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+
 from fastapi.testclient import TestClient
 from datetime import date
 from sqlalchemy import create_engine, event
@@ -9,6 +16,8 @@ import pytest
 from app.database import Base, get_db
 from app.main import app
 from app import models
+from app.catalog import catalog_index
+from app.auth.ratelimit import login_limiter
 from app.auth.utils import get_password_hash
 from app.auth.models import User
 
@@ -48,7 +57,9 @@ def db_session(engine):
     yield session
 
     session.close()
-    transaction.rollback()
+    # A handler's rollback (e.g. after an IntegrityError) already ended it
+    if transaction.is_active:
+        transaction.rollback()
     connection.close()
 
 
@@ -96,6 +107,9 @@ def client(db_session, test_user, test_data):
             pass
 
     app.dependency_overrides[get_db] = override_get_db
+    # Tables are wiped between tests behind the ORM's back
+    catalog_index.invalidate()
+    login_limiter.reset()
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -0,0 +1,117 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select
+
+from app import models
+from app.archive import archive_history
+from .utils import get_auth_headers, explain_query_plan
+
+NOW = datetime(2024, 6, 1)
+
+
+def seed_history(db_session, test_data):
+    book = models.Book(
+        title="Old Favourite", isbn=9786177171960,
+        publish_date=date(2000, 1, 1),
+        author_id=test_data["author"].id,
+        publisher_id=test_data["publisher"].id
+    )
+    db_session.add(book)
+    db_session.flush()
+    # Borrowed 1000, 800, ... 200 and 10 days ago; the last one still out
+    for i, days in enumerate([1000, 800, 600, 400, 200, 10]):
+        borrowed = NOW - timedelta(days=days)
+        db_session.add(models.BorrowingHistory(
+            book_id=book.id, borrower_name=f"Reader {i}",
+            borrow_date=borrowed, due_date=borrowed + timedelta(days=14),
+            return_date=borrowed + timedelta(days=7) if days > 10 else None
+        ))
+    db_session.commit()
+    return book.id
+
+
+def count(db_session, model):
+    return db_session.scalar(select(func.count()).select_from(model))
+
+
+def test_archive_moves_old_returned_loans(db_session, test_data):
+    seed_history(db_session, test_data)
+
+    stats = archive_history(db_session, older_than_days=365, batch_size=2,
+                            now=NOW)
+    assert (stats["archived"], stats["batches"]) == (4, 2)
+    assert count(db_session, models.BorrowingHistory) == 2
+    assert count(db_session, models.BorrowingHistoryArchive) == 4
+
+    assert archive_history(db_session, older_than_days=365,
+                           now=NOW)["archived"] == 0
+    # Active loans are never archived, however old the cutoff
+    archive_history(db_session, older_than_days=0, now=NOW)
+    assert [loan.return_date for loan in
+            db_session.query(models.BorrowingHistory)] == [None]
+
+
+def test_archive_skips_reused_ids(db_session, test_data):
+    seed_history(db_session, test_data)
+    oldest = db_session.query(models.BorrowingHistory).order_by(
+        models.BorrowingHistory.id).first()
+    # An archived loan whose id SQLite handed out again
+    db_session.add(models.BorrowingHistoryArchive(
+        id=oldest.id, book_id=oldest.book_id, borrower_name="Earlier Reader",
+        borrow_date=NOW - timedelta(days=2000),
+        return_date=NOW - timedelta(days=1990)))
+    db_session.commit()
+
+    stats = archive_history(db_session, older_than_days=365, batch_size=1,
+                            now=NOW)
+    assert (stats["archived"], stats["skipped"]) == (3, 1)
+    assert db_session.get(models.BorrowingHistory, oldest.id) is not None
+    assert db_session.get(
+        models.BorrowingHistoryArchive, oldest.id).borrower_name == \
+        "Earlier Reader"
+
+
+def test_archived_ids_are_not_reused(db_session, test_data):
+    book_id = seed_history(db_session, test_data)
+    returned = models.BorrowingHistory(
+        book_id=book_id, borrower_name="Last Reader",
+        borrow_date=NOW - timedelta(days=900),
+        return_date=NOW - timedelta(days=890))
+    db_session.add(returned)
+    db_session.commit()
+    # The highest id so far, returned long ago
+    returned_id = returned.id
+    archive_history(db_session, older_than_days=365, now=NOW)
+    assert db_session.get(models.BorrowingHistoryArchive, returned_id)
+
+    loan = models.BorrowingHistory(book_id=book_id, borrower_name="Next")
+    db_session.add(loan)
+    db_session.commit()
+    assert loan.id > returned_id
+
+
+def test_archive_batch_query_uses_index(db_session):
+    plan = explain_query_plan(
+        db_session,
+        "SELECT id FROM borrowing_history WHERE return_date < ? "
+        "ORDER BY return_date LIMIT 100",
+        (NOW,)
+    )
+    assert any("ix_borrowing_history_return_date" in detail
+               for detail in plan), plan
+
+
+def test_history_includes_archive_on_request(client, db_session, test_data):
+    headers = get_auth_headers(client)
+    book_id = seed_history(db_session, test_data)
+    archive_history(db_session, older_than_days=365, now=NOW)
+
+    hot = client.get(f"/books/{book_id}/history", headers=headers).json()
+    assert [loan["borrower_name"] for loan in hot] == ["Reader 4", "Reader 5"]
+
+    full = client.get(f"/books/{book_id}/history",
+                      params={"include_archived": True},
+                      headers=headers).json()
+    assert [loan["borrower_name"] for loan in full] == [
+        f"Reader {i}" for i in range(6)]
+    assert full[0]["due_date"] is not None
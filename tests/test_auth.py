@@ -1,5 +1,24 @@
+import math
+import time
+from datetime import datetime, UTC
+
+import bcrypt
+import pytest
 from fastapi.testclient import TestClient
+from jose import JWTError, jwt
+from sqlalchemy import update
+
+from app import config
+from app.auth import passwords, utils
+from app.auth.passwords import get_password_hash, hash_rounds, needs_rehash
+from app.auth.models import RefreshSession, User
+from app.auth.ratelimit import MemoryRateLimitStore, login_limiter
+from app.auth.sessions import (
+    InvalidRefreshToken, hash_refresh_token, rotate_refresh_token,
+    sweep_expired_sessions)
+from app.auth.tokens import TokenService, token_service
 from app.main import app
+from .utils import get_auth_headers
 
 
 def test_create_user(client):
@@ -27,3 +46,286 @@ def test_login_invalid_credentials(client):
         data={"username": "wronguser", "password": "wrongpass"}
     )
     assert response.status_code == 401
+
+
+@pytest.fixture
+def tokens():
+    keys, active_kid = token_service.keys, token_service.active_kid
+    yield token_service
+    token_service.keys, token_service.active_kid = keys, active_kid
+
+
+def test_token_claims_and_kid(client):
+    token = client.post(
+        "/token", data={"username": "testuser", "password": "testpass"}
+    ).json()["access_token"]
+    assert jwt.get_unverified_header(token)["kid"] == token_service.active_kid
+    claims = jwt.get_unverified_claims(token)
+    assert claims["sub"] == "testuser"
+    assert claims["active"] is True
+    assert isinstance(claims["uid"], int)
+
+
+@pytest.mark.parametrize("backend", ["stdlib", "jose"])
+def test_token_service_verification(backend):
+    service = TokenService({"a": "secret-a"}, "a", backend)
+    token = service.encode({"sub": "reader", "exp": int(time.time()) + 60})
+    assert service.decode(token)["sub"] == "reader"
+
+    header, payload, signature = token.split(".")
+    forged = jwt.encode({"sub": "admin"}, "secret-a", algorithm="HS256")
+    with pytest.raises(JWTError):
+        service.decode(f"{header}.{forged.split('.')[1]}.{signature}")
+    with pytest.raises(JWTError):
+        service.decode(jwt.encode({"sub": "reader"}, "wrong", algorithm="HS256"))
+    with pytest.raises(JWTError):
+        service.decode(service.encode({"sub": "reader", "exp": 1}))
+    with pytest.raises(JWTError):
+        service.decode("not-a-token")
+    with pytest.raises(JWTError):
+        service.decode(f"{header}.{payload}\u00e9.{signature}")
+
+
+def test_token_service_rotation():
+    service = TokenService({"old": "secret-old"}, "old")
+    old_token = service.encode({"sub": "reader"})
+
+    service.rotate("new", "secret-new")
+    new_token = service.encode({"sub": "reader"})
+    assert jwt.get_unverified_header(new_token)["kid"] == "new"
+    assert service.decode(old_token)["sub"] == "reader"
+    assert service.decode(new_token)["sub"] == "reader"
+
+    service.retire("old")
+    with pytest.raises(JWTError):
+        service.decode(old_token)
+    assert service.decode(new_token)["sub"] == "reader"
+
+
+@pytest.mark.parametrize("backend", ["stdlib", "jose"])
+def test_token_service_rekey_same_kid(backend):
+    service = TokenService({"main": "secret-1"}, "main", backend)
+    old_token = service.encode({"sub": "reader"})
+    assert service.decode(old_token)["sub"] == "reader"
+
+    # Same kid, new secret: only tokens signed with the new one verify
+    service.rotate("main", "secret-2")
+    new_token = service.encode({"sub": "reader"})
+    assert service.decode(new_token)["sub"] == "reader"
+    with pytest.raises(JWTError):
+        service.decode(old_token)
+
+
+def test_non_ascii_token_rejected_by_api(client):
+    token = get_auth_headers(client)["Authorization"].encode("latin-1")
+    header, payload, signature = token.split(b".")
+    response = client.post(
+        "/genres/", json={"name": "Accented"},
+        headers={"Authorization": header + b"." + payload + b"\xe9."
+                 + signature})
+    assert response.status_code == 401
+
+
+def test_rotated_key_accepted_by_api(client, tokens):
+    headers = get_auth_headers(client)
+    tokens.rotate("rotated", "another-secret")
+    response = client.post("/genres/", json={"name": "Rotation"},
+                           headers=headers)
+    assert response.status_code == 200
+
+
+def test_stateless_auth_skips_user_lookup(client, db_session, monkeypatch):
+    headers = get_auth_headers(client)
+    db_session.query(User).delete()
+    db_session.commit()
+
+    response = client.post("/genres/", json={"name": "Stateful"},
+                           headers=headers)
+    assert response.status_code == 401
+
+    monkeypatch.setattr(config, "AUTH_STATELESS", True)
+    response = client.post("/genres/", json={"name": "Stateless"},
+                           headers=headers)
+    assert response.status_code == 200
+
+
+def login(client):
+    return client.post(
+        "/token", data={"username": "testuser", "password": "testpass"}
+    ).json()
+
+
+def test_refresh_token(client):
+    refresh_token = login(client)["refresh_token"]
+    assert refresh_token
+
+    response = client.post("/token/refresh",
+                           json={"refresh_token": refresh_token})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["refresh_token"] != refresh_token
+
+    headers = {"Authorization": f"Bearer {body['access_token']}"}
+    response = client.post("/genres/", json={"name": "Refreshed"},
+                           headers=headers)
+    assert response.status_code == 200
+
+    response = client.post("/token/refresh",
+                           json={"refresh_token": "unknown"})
+    assert response.status_code == 401
+
+
+def test_refresh_token_reuse_revokes_sessions(client):
+    first = login(client)["refresh_token"]
+    second = client.post(
+        "/token/refresh", json={"refresh_token": first}
+    ).json()["refresh_token"]
+
+    # The rotated-out token is presented again
+    response = client.post("/token/refresh", json={"refresh_token": first})
+    assert response.status_code == 401
+    response = client.post("/token/refresh", json={"refresh_token": second})
+    assert response.status_code == 401
+
+
+def test_refresh_token_lost_race_revokes_sessions(client, db_session):
+    first = login(client)["refresh_token"]
+    other = login(client)["refresh_token"]
+    session = db_session.query(RefreshSession).filter(
+        RefreshSession.token_hash == hash_refresh_token(first)).one()
+    # A concurrent refresh rotates the token after this one has read it
+    db_session.execute(
+        update(RefreshSession).where(RefreshSession.id == session.id)
+        .values(revoked_at=datetime.now(UTC)),
+        execution_options={"synchronize_session": False})
+    assert session.revoked_at is None
+
+    with pytest.raises(InvalidRefreshToken):
+        rotate_refresh_token(db_session, first)
+    response = client.post("/token/refresh", json={"refresh_token": other})
+    assert response.status_code == 401
+
+
+def test_revoke_refresh_token(client):
+    refresh_token = login(client)["refresh_token"]
+    response = client.post("/token/revoke",
+                           json={"refresh_token": refresh_token})
+    assert response.status_code == 204
+    response = client.post("/token/refresh",
+                           json={"refresh_token": refresh_token})
+    assert response.status_code == 401
+
+
+def test_sweep_expired_sessions(client, db_session):
+    login(client)
+    login(client)
+    db_session.query(RefreshSession).update(
+        {"expires_at": datetime(2000, 1, 1)})
+    db_session.commit()
+    assert sweep_expired_sessions(db_session, batch_size=1) == 2
+    assert db_session.query(RefreshSession).count() == 0
+
+
+def test_login_rate_limited_per_username(client, monkeypatch):
+    checks = []
+    real_verify = utils.verify_password
+    monkeypatch.setattr(utils, "verify_password",
+                        lambda *args: checks.append(1) or real_verify(*args))
+
+    for _ in range(config.LOGIN_USERNAME_BURST):
+        response = client.post(
+            "/token", data={"username": "testuser", "password": "wrong"})
+        assert response.status_code == 401
+
+    response = client.post(
+        "/token", data={"username": "testuser", "password": "testpass"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    # The rejected attempt never reached bcrypt
+    assert len(checks) == config.LOGIN_USERNAME_BURST
+    assert login_limiter.metrics["rejected_username"] == 1
+
+    # Other accounts from the same client are unaffected
+    response = client.post(
+        "/token", data={"username": "someoneelse", "password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_login_success_refills_username_bucket(client):
+    for _ in range(config.LOGIN_USERNAME_BURST * 2):
+        response = client.post(
+            "/token", data={"username": "testuser", "password": "testpass"})
+        assert response.status_code == 200
+
+
+def test_login_rate_limited_per_ip(client, monkeypatch):
+    monkeypatch.setattr(config, "LOGIN_IP_BURST", 3)
+    for i in range(3):
+        response = client.post(
+            "/token", data={"username": f"user{i}", "password": "wrong"})
+        assert response.status_code == 401
+    response = client.post(
+        "/token", data={"username": "testuser", "password": "testpass"})
+    assert response.status_code == 429
+    assert login_limiter.metrics["rejected_ip"] == 1
+
+
+def test_memory_rate_limit_store_refills():
+    store = MemoryRateLimitStore()
+    assert store.take("k", 2, 1.0, now=0.0) == 0
+    assert store.take("k", 2, 1.0, now=0.0) == 0
+    assert store.take("k", 2, 1.0, now=0.0) == pytest.approx(1.0)
+    assert store.take("k", 2, 1.0, now=1.5) == 0
+
+
+def test_memory_rate_limit_store_without_refill():
+    store = MemoryRateLimitStore()
+    assert store.take("k", 1, 0, now=0.0) == 0
+    assert store.take("k", 1, 0, now=0.0) == math.inf
+    assert store.take("k", 1, 0, now=3600.0) == math.inf
+
+
+def test_login_limit_without_refill(client, monkeypatch):
+    monkeypatch.setattr(config, "LOGIN_USERNAME_PER_MINUTE", 0)
+    for _ in range(config.LOGIN_USERNAME_BURST):
+        client.post("/token", data={"username": "testuser", "password": "x"})
+    response = client.post(
+        "/token", data={"username": "testuser", "password": "testpass"})
+    assert response.status_code == 429
+    assert "Retry-After" not in response.headers
+
+
+def test_memory_rate_limit_store_evicts_oldest_keys():
+    store = MemoryRateLimitStore(max_keys=2)
+    for key in ("a", "b", "c"):
+        store.take(key, 1, 0.001, now=0.0)
+    # "a" was evicted and starts with a full bucket again
+    assert store.take("a", 1, 0.001, now=0.0) == 0
+
+
+def test_login_rehashes_password_with_configured_cost(client, db_session):
+    user = db_session.query(User).filter(User.username == "testuser").one()
+    user.hashed_password = bcrypt.hashpw(
+        b"testpass", bcrypt.gensalt(rounds=5)).decode()
+    db_session.commit()
+    assert needs_rehash(user.hashed_password)
+
+    response = client.post(
+        "/token", data={"username": "testuser", "password": "testpass"})
+    assert response.status_code == 200
+    db_session.refresh(user)
+    assert hash_rounds(user.hashed_password) == passwords.bcrypt_rounds
+    assert not needs_rehash(user.hashed_password)
+
+
+def test_configure_work_factor(monkeypatch):
+    monkeypatch.setattr(passwords, "bcrypt_rounds", passwords.bcrypt_rounds)
+    monkeypatch.setattr(config, "BCRYPT_TARGET_MS", 0.001)
+    passwords.configure_work_factor()
+    # Nothing fits a microsecond budget, so the floor is used
+    assert passwords.bcrypt_rounds == passwords.MIN_ROUNDS
+
+    monkeypatch.setattr(config, "BCRYPT_TARGET_MS", 0)
+    monkeypatch.setattr(config, "BCRYPT_ROUNDS", 6)
+    passwords.configure_work_factor()
+    assert hash_rounds(get_password_hash("secret")) == 6
@@ -3,6 +3,7 @@ from fastapi.testclient import TestClient
 from datetime import date
 
 from app.main import app
+from app.routers.authors import prefix_upper_bound
 from .utils import get_auth_headers
 
 client = TestClient(app)
@@ -69,3 +70,78 @@ def test_get_author_books(client):
     assert response.status_code == 200
     assert len(response.json()) > 0
     assert response.json()[0]["title"] == "Author's Book"
+
+
+def test_get_authors(client):
+    headers = get_auth_headers(client)
+    for name in ["Brontë", "Austen", "Borges", "Bulgakov"]:
+        client.post("/authors/", json={
+            "name": name, "birthdate": str(date(1900, 1, 1))
+        }, headers=headers)
+    borges_id = client.get("/authors/?name_prefix=Borges").json()[0]["id"]
+    for i in range(2):
+        client.post("/books/", json={
+            "title": f"Ficciones {i}",
+            "isbn": int(f"978617717184{i}"),
+            "publish_date": str(date(1944, 1, 1)),
+            "author_id": borges_id,
+            "genre_ids": [1],
+            "publisher_id": 1
+        }, headers=headers)
+
+    response = client.get("/authors/?name_prefix=B")
+    assert response.status_code == 200
+    authors = response.json()
+    assert [a["name"] for a in authors] == ["Borges", "Brontë", "Bulgakov"]
+    assert [a["book_count"] for a in authors] == [2, 0, 0]
+
+    # Keyset pagination continues after the last name of the previous page
+    first_page = client.get("/authors/?limit=2").json()
+    assert [a["name"] for a in first_page] == ["Austen", "Borges"]
+    second_page = client.get(
+        f"/authors/?limit=2&after={first_page[-1]['name']}").json()
+    assert [a["name"] for a in second_page] == ["Brontë", "Bulgakov"]
+
+
+def test_prefix_upper_bound():
+    assert prefix_upper_bound("Bor") == "Bos"
+    # Carries past the highest code point and skips the surrogates
+    assert prefix_upper_bound("B\U0010ffff") == "C"
+    assert prefix_upper_bound("\U0010ffff\U0010ffff") is None
+    assert prefix_upper_bound("B\ud7ff") == "B\ue000"
+
+
+def test_get_authors_prefix_edge_characters(client):
+    headers = get_auth_headers(client)
+    for name in ["\ud7ffa", "\ue000", "\U0010ffffz"]:
+        client.post("/authors/", json={
+            "name": name, "birthdate": str(date(1900, 1, 1))
+        }, headers=headers)
+    for prefix, expected in [("\ud7ff", ["\ud7ffa"]),
+                             ("\U0010ffff", ["\U0010ffffz"])]:
+        response = client.get("/authors/", params={"name_prefix": prefix})
+        assert response.status_code == 200
+        assert [a["name"] for a in response.json()] == expected
+
+
+def test_get_author_books_ordered_and_paginated(client):
+    headers = get_auth_headers(client)
+    for i, year in enumerate([2005, 1999, 2012]):
+        client.post("/books/", json={
+            "title": f"Book from {year}",
+            "isbn": int(f"978617717185{i}"),
+            "publish_date": str(date(year, 1, 1)),
+            "author_id": 1,
+            "genre_ids": [1],
+            "publisher_id": 1
+        }, headers=headers)
+
+    response = client.get("/authors/1/books")
+    assert [b["title"] for b in response.json()] == [
+        "Book from 1999", "Book from 2005", "Book from 2012"]
+
+    response = client.get("/authors/1/books?offset=1&limit=1")
+    assert [b["title"] for b in response.json()] == ["Book from 2005"]
+
+    response = client.get("/authors/999/books")
+    assert response.status_code == 404
@@ -0,0 +1,69 @@
+from .utils import get_auth_headers, capture_queries, create_books
+
+
+def test_books_batch_keeps_request_order(client, engine):
+    headers = get_auth_headers(client)
+    books = create_books(client, headers, 3)
+    ids = [books[2]["id"], 999, books[0]["id"], books[2]["id"]]
+
+    with capture_queries(engine) as statements:
+        response = client.get(
+            "/books/batch", params={"ids": ",".join(map(str, ids))})
+    assert response.status_code == 200
+    body = response.json()
+    assert [book["id"] for book in body["items"]] == [
+        books[2]["id"], books[0]["id"]]
+    assert body["items"][0] == books[2]
+    assert body["missing"] == [999]
+    # One IN query for the books, one for their genres
+    assert len([s for s, _ in statements if s.startswith("SELECT")]) == 2
+
+
+def test_authors_and_publishers_batch(client, test_data):
+    author_id = test_data["author"].id
+    publisher_id = test_data["publisher"].id
+
+    authors = client.get(
+        "/authors/batch", params={"ids": f"5,{author_id}"}).json()
+    assert [a["name"] for a in authors["items"]] == ["Test Author"]
+    assert authors["missing"] == [5]
+
+    publishers = client.get(
+        "/publishers/batch", params={"ids": str(publisher_id)}).json()
+    assert publishers == {"items": [{
+        "id": publisher_id, "name": "Test Publisher",
+        "established_year": 2000}], "missing": []}
+
+
+def test_batch_rejects_bad_ids(client):
+    too_many = ",".join(str(i) for i in range(1001))
+    for ids in ["1,x", ",", too_many]:
+        response = client.get("/authors/batch", params={"ids": ids})
+        assert response.status_code == 400
+    assert client.get("/authors/batch").status_code == 422
+
+
+def test_get_books_include_embeds_relations(client, engine):
+    headers = get_auth_headers(client)
+    create_books(client, headers, 5)
+
+    with capture_queries(engine) as statements:
+        books = client.get(
+            "/books/", params={"include": "author,publisher"}).json()
+    assert len(books) == 5
+    assert all(book["author"]["name"] == "Test Author" for book in books)
+    assert all(book["publisher"]["name"] == "Test Publisher"
+               for book in books)
+    author_selects = [s for s, _ in statements if "FROM authors" in s]
+    assert len(author_selects) == 1
+
+    books = client.get("/books/", params={"include": "author"}).json()
+    assert books[0]["author"]["id"] == 1 and books[0]["publisher"] is None
+    assert "author" not in client.get("/books/").json()[0]
+
+    columns = client.get("/books/", params={
+        "include": "publisher", "format": "columnar"}).json()
+    assert columns["publisher"][0]["name"] == "Test Publisher"
+
+    assert client.get(
+        "/books/", params={"include": "genres"}).status_code == 422
@@ -1,11 +1,15 @@
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, delete, event, insert
 from sqlalchemy.orm import sessionmaker
 from datetime import date
 
-from app.database import get_db
+import pytest
+
+from app import config, models
+from app.catalog import CatalogIndex, catalog_index
+from app.database import Base, get_db
 from app.main import app
-from .utils import get_auth_headers
+from .utils import get_auth_headers, capture_queries, explain_query_plan
 
 # Use SQLite in-memory database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -58,6 +62,78 @@ def test_create_book(client):
     assert response.json()["isbn"] == 9786177171804
 
 
+def test_create_book_in_one_transaction(client, engine, db_session):
+    headers = get_auth_headers(client)
+    client.post("/genres/", json={"name": "Second Genre"}, headers=headers)
+    book_data = {
+        "title": "Atomic Book",
+        "isbn": 9786177171805,
+        "publish_date": str(date(2020, 1, 1)),
+        "author_id": 1,
+        "genre_ids": [1, 2, 1],
+        "publisher_id": 1
+    }
+    with capture_queries(engine) as statements:
+        response = client.post("/books/", json=book_data, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["genre_ids"] == [1, 2]
+    genre_selects = [s for s, _ in statements if s.startswith("SELECT")
+                     and "FROM genres" in s]
+    assert len(genre_selects) == 1
+    assert not any("books.isbn = " in s for s, _ in statements)
+
+    # A missing genre leaves nothing behind
+    response = client.post("/books/", json={
+        **book_data, "isbn": 9786177171806, "genre_ids": [1, 99]
+    }, headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Genre 99 not found"
+    assert db_session.query(models.Book).count() == 1
+
+    response = client.post("/books/", json=book_data, headers=headers)
+    assert response.status_code == 400
+    assert "ISBN already exists" in response.json()["detail"]
+
+
+
+def test_create_book_reference_removed_concurrently(
+        client, monkeypatch, tmp_path):
+    headers = get_auth_headers(client)
+    monkeypatch.setattr(config, "AUTH_STATELESS", True)
+    race_engine = create_engine(f"sqlite:///{tmp_path / 'race.db'}")
+    event.listen(race_engine, "connect", lambda dbapi_connection, _:
+                 dbapi_connection.execute("PRAGMA foreign_keys=ON"))
+    Base.metadata.create_all(race_engine)
+    with race_engine.begin() as conn:
+        conn.execute(insert(models.Author), [{"id": 1, "name": "Gone"}])
+        conn.execute(insert(models.Publisher), [{"id": 1, "name": "Kept"}])
+
+    def remove_author(session, flush_context, instances):
+        # Another request deletes the author after it was validated
+        with race_engine.begin() as conn:
+            conn.execute(delete(models.Author))
+
+    def race_db():
+        db = sessionmaker(bind=race_engine)()
+        event.listen(db, "before_flush", remove_author, once=True)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = race_db
+    response = client.post("/books/", json={
+        "title": "Orphan",
+        "isbn": 9786177171809,
+        "publish_date": str(date(2020, 1, 1)),
+        "author_id": 1,
+        "genre_ids": [],
+        "publisher_id": 1
+    }, headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Author not found"
+
+
 def test_create_book_invalid_isbn(client):
     headers = get_auth_headers(client)
     book_data = {
@@ -138,3 +214,211 @@ def test_create_book_future_date(client):
     }
     response = client.post("/books/", json=book_data, headers=headers)
     assert response.status_code == 422
+
+
+def test_get_books_filters(client):
+    headers = get_auth_headers(client)
+    books_data = [
+        {
+            "title": f"Filter Book {i}",
+            "isbn": int(f"978617717181{i}"),
+            "publish_date": str(date(2000 + i, 1, 1)),
+            "author_id": 1,
+            "genre_ids": [1],
+            "publisher_id": 1
+        } for i in range(4)
+    ]
+    for book in books_data:
+        client.post("/books/", json=book, headers=headers)
+    client.post("/borrow", json={"book_id": 1, "borrower_name": "Reader"},
+                headers=headers)
+
+    response = client.get("/books/?available=true&genre_id=1&publisher_id=1")
+    assert response.status_code == 200
+    assert [b["title"] for b in response.json()] == [
+        "Filter Book 1", "Filter Book 2", "Filter Book 3"]
+
+    response = client.get(
+        "/books/?published_from=2001-01-01&published_to=2002-12-31"
+        "&sort_by=publish_date")
+    assert [b["title"] for b in response.json()] == [
+        "Filter Book 1", "Filter Book 2"]
+
+    response = client.get("/books/?available=false&author_id=1")
+    assert [b["title"] for b in response.json()] == ["Filter Book 0"]
+
+    response = client.get("/books/?genre_id=999")
+    assert response.json() == []
+
+    response = client.get(
+        "/books/?published_from=2005-01-01&published_to=2001-01-01")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("sort_by", ["title", "author", "publish_date"])
+@pytest.mark.parametrize("filters", [
+    "available=true",
+    "genre_id=1",
+    "author_id=1",
+    "publisher_id=1",
+    "published_from=2000-01-01&published_to=2010-01-01",
+    "available=true&genre_id=1",
+    "available=true&author_id=1",
+    "available=true&publisher_id=1",
+    "available=false&genre_id=1&publisher_id=1",
+    "author_id=1&published_from=2000-01-01",
+])
+def test_get_books_filters_use_indexes(client, engine, db_session,
+                                       sort_by, filters):
+    with capture_queries(engine) as statements:
+        response = client.get(f"/books/?sort_by={sort_by}&{filters}")
+    assert response.status_code == 200
+
+    statement, parameters = statements[0]
+    plan = explain_query_plan(db_session, statement, parameters)
+    for detail in plan:
+        assert not detail.startswith("SCAN books"), plan
+        assert not detail.startswith("SCAN book_genres"), plan
+    assert any(detail.startswith("SEARCH books") for detail in plan), plan
+
+
+@pytest.mark.parametrize("sort_by", ["title", "author", "publish_date"])
+@pytest.mark.parametrize("filters", ["", "available=true"])
+def test_get_books_sorts_walk_an_index(client, engine, db_session,
+                                       sort_by, filters):
+    with capture_queries(engine) as statements:
+        client.get(f"/books/?sort_by={sort_by}&{filters}")
+
+    statement, parameters = statements[0]
+    plan = explain_query_plan(db_session, statement, parameters)
+    assert not any("TEMP B-TREE" in detail for detail in plan), plan
+    assert "JOIN" not in statement
+
+
+def test_get_book_facets(client):
+    headers = get_auth_headers(client)
+    client.post("/genres/", json={"name": "Second Genre"}, headers=headers)
+    books_data = [
+        {
+            "title": f"Facet Book {i}",
+            "isbn": int(f"978617717182{i}"),
+            "publish_date": str(date(2000 + i, 1, 1)),
+            "author_id": 1,
+            "genre_ids": [1, 2] if i % 2 else [1],
+            "publisher_id": 1
+        } for i in range(4)
+    ]
+    for book in books_data:
+        client.post("/books/", json=book, headers=headers)
+
+    response = client.get("/books/facets")
+    assert response.status_code == 200
+    facets = response.json()
+    assert facets["total"] == 4
+    assert facets["available"] == 4
+    assert facets["genres"] == [
+        {"id": 1, "count": 4}, {"id": 2, "count": 2}]
+    assert facets["authors"] == [{"id": 1, "count": 4}]
+    assert facets["publishers"] == [{"id": 1, "count": 4}]
+
+    # Borrowing invalidates the cached bitmaps
+    client.post("/borrow", json={"book_id": 2, "borrower_name": "Reader"},
+                headers=headers)
+    facets = client.get("/books/facets?genre_id=2").json()
+    assert facets["total"] == 2
+    assert facets["available"] == 1
+    assert facets["unavailable"] == 1
+
+    facets = client.get(
+        "/books/facets?available=true&published_from=2002-01-01").json()
+    assert facets["total"] == 2
+    assert facets["genres"] == [
+        {"id": 1, "count": 2}, {"id": 2, "count": 1}]
+
+
+def test_get_books_from_catalog_index(client, monkeypatch):
+    headers = get_auth_headers(client)
+    client.post("/genres/", json={"name": "Index Genre"}, headers=headers)
+    titles = ["Delta", "alpha", "Charlie", "Bravo", "Echo"]
+    for i, title in enumerate(titles):
+        client.post("/books/", json={
+            "title": title,
+            "isbn": int(f"978617717183{i}"),
+            "publish_date": str(date(2010 - i, 6, 1)),
+            "author_id": 1,
+            "genre_ids": [1, 2] if i % 2 else [1],
+            "publisher_id": 1
+        }, headers=headers)
+    client.post("/borrow", json={"book_id": 2, "borrower_name": "Reader"},
+                headers=headers)
+
+    queries = [
+        "sort_by=title",
+        "sort_by=publish_date&limit=3&offset=1",
+        "sort_by=title&available=true",
+        "sort_by=author&limit=3&offset=1",
+        "available=false",
+        "genre_id=2&sort_by=publish_date",
+        "published_from=2007-01-01&published_to=2009-12-31",
+        "publisher_id=1&author_id=1&offset=2&limit=2",
+    ]
+    from_sql = [client.get(f"/books/?{q}").json() for q in queries]
+
+    monkeypatch.setattr(config, "CATALOG_IN_MEMORY", True)
+    from_index = [client.get(f"/books/?{q}").json() for q in queries]
+    assert from_index == from_sql
+
+    # Changes after the index was built are applied on commit
+    client.post("/books/", json={
+        "title": "Aardvark",
+        "isbn": 9786177171839,
+        "publish_date": str(date(2001, 1, 1)),
+        "author_id": 1,
+        "genre_ids": [2],
+        "publisher_id": 1
+    }, headers=headers)
+    client.post("/return/1", headers=headers)
+    response = client.get("/books/?genre_id=2&available=true")
+    assert [b["title"] for b in response.json()] == [
+        "Aardvark", "alpha", "Bravo"]
+    assert catalog_index.memory_usage()["books"] == 6
+
+
+@pytest.mark.parametrize("sort_by", ["title", "author", "publish_date"])
+def test_catalog_index_dense_pages(sort_by):
+    # Newer books have higher ids and only the older ones are available,
+    # so the sort orders hold ids above the highest matching one
+    books = [
+        (book_id, f"title {book_id % 7}", book_id % 3 + 1, 1, book_id <= 60,
+         date(1900 + book_id, 1, 1))
+        for book_id in range(1, 101)
+    ]
+    authors = [(1, "Carol"), (2, "Alice"), (3, "Bob")]
+    sparse = CatalogIndex()
+    sparse.load(books, [], authors)
+    dense = CatalogIndex()
+    dense.SPARSE_LIMIT = 0
+    dense.load(books, [], authors)
+
+    for offset, limit in [(0, 10), (50, 20), (55, 10), (200, 10)]:
+        for available in (True, False):
+            expected = sparse.page(sort_by, offset, limit, available=available)
+            assert dense.page(
+                sort_by, offset, limit, available=available) == expected
+
+
+def test_catalog_index_retries_failed_rebuild(db_session, monkeypatch):
+    index = CatalogIndex()
+    refresh = index.refresh
+
+    def failing_refresh(db):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(index, "refresh", failing_refresh)
+    with pytest.raises(RuntimeError):
+        index.ensure_fresh(db_session)
+    assert index._stale
+
+    monkeypatch.setattr(index, "refresh", refresh)
+    index.ensure_fresh(db_session)
+    assert not index._stale
@@ -0,0 +1,138 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, insert, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import models
+from app.borrowers import borrower_id_for, migrate_borrowers
+from app.database import Base
+from app.migrations import add_missing_columns, sync_indexes
+from .utils import get_auth_headers, capture_queries, explain_query_plan
+
+
+def create_book(client, headers, isbn):
+    return client.post("/books/", json={
+        "title": f"Loan Book {isbn}",
+        "isbn": isbn,
+        "publish_date": str(date(2020, 1, 1)),
+        "author_id": 1,
+        "genre_ids": [1],
+        "publisher_id": 1
+    }, headers=headers).json()["id"]
+
+
+def test_borrowing_links_a_borrower(client):
+    headers = get_auth_headers(client)
+    first = client.post("/borrow", json={
+        "book_id": create_book(client, headers, 9786177172300),
+        "borrower_name": "Profile Reader"
+    }, headers=headers).json()
+    second = client.post("/borrow", json={
+        "book_id": create_book(client, headers, 9786177172301),
+        "borrower_name": "Profile Reader"
+    }, headers=headers).json()
+    assert first["borrower_id"] is not None
+    assert first["borrower_id"] == second["borrower_id"]
+
+    client.post(f"/return/{first['id']}", headers=headers)
+    profile = client.get(f"/borrowers/{first['borrower_id']}",
+                         headers=headers).json()
+    assert (profile["name"], profile["active_loans"]) == ("Profile Reader", 1)
+    assert client.get("/borrowers/999", headers=headers).status_code == 404
+    assert client.get(
+        f"/borrowers/{first['borrower_id']}").status_code == 401
+
+
+def test_borrower_id_for_reuses_rows(db_session):
+    first = borrower_id_for(db_session, "Same Name")
+    assert borrower_id_for(db_session, "Same Name") == first
+    assert borrower_id_for(db_session, "Other Name") != first
+
+
+def test_borrower_loans_filters_and_cursor(client, db_session):
+    headers = get_auth_headers(client)
+    borrower_id = borrower_id_for(db_session, "Paged Reader")
+    start = datetime(2024, 1, 1)
+    db_session.execute(insert(models.BorrowingHistory), [
+        {"id": i, "book_id": 1, "borrower_id": borrower_id,
+         "borrower_name": "Paged Reader",
+         "borrow_date": start + timedelta(days=i),
+         # Loans 1-5 returned (4 and 5 at the same instant), 6-7 active
+         "return_date": (start + timedelta(days=min(i, 4) + 20)
+                         if i <= 5 else None)}
+        for i in range(1, 8)
+    ])
+    db_session.commit()
+
+    def pages(status):
+        ids, cursor = [], None
+        while True:
+            params = {"status": status, "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            page = client.get(f"/borrowers/{borrower_id}/loans",
+                              params=params, headers=headers).json()
+            ids.append([loan["id"] for loan in page["items"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return ids
+
+    assert pages("all") == [[7, 6], [5, 4], [3, 2], [1]]
+    assert pages("active") == [[7, 6]]
+    assert pages("returned") == [[5, 4], [3, 2], [1]]
+
+    response = client.get(f"/borrowers/{borrower_id}/loans",
+                          params={"status": "returned", "cursor": "x"},
+                          headers=headers)
+    assert response.status_code == 400
+
+
+def test_borrower_loans_walk_the_index(client, engine, db_session):
+    headers = get_auth_headers(client)
+    borrower_id = borrower_id_for(db_session, "Indexed Reader")
+    db_session.commit()
+    for status in ("active", "returned"):
+        with capture_queries(engine) as statements:
+            client.get(f"/borrowers/{borrower_id}/loans",
+                       params={"status": status}, headers=headers)
+        statement, parameters = next(
+            (s, p) for s, p in statements if "FROM borrowing_history" in s
+            and "ORDER BY" in s)
+        plan = " ".join(explain_query_plan(db_session, statement, parameters))
+        assert "ix_borrowing_history_borrower_return_date" in plan
+        assert "TEMP B-TREE" not in plan
+
+
+def test_migrate_borrowers_from_names():
+    # A database created before borrowers existed
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE borrowing_history (id INTEGER PRIMARY KEY, "
+            "book_id INTEGER, borrower_name VARCHAR, "
+            "borrow_date DATETIME, return_date DATETIME)"))
+        conn.execute(text(
+            "INSERT INTO borrowing_history (id, book_id, borrower_name) "
+            "VALUES (1, 1, 'Ann'), (2, 1, 'Bob'), (3, 2, 'Ann'), "
+            "(4, 2, NULL)"))
+
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        assert add_missing_columns(db) and sync_indexes(db)
+        db.commit()
+        stats = migrate_borrowers(db, batch_size=2)
+        assert stats["borrowers_created"] == 2
+        assert stats["loans_updated"] == 3
+        rows = db.execute(text(
+            "SELECT h.id, b.name FROM borrowing_history h "
+            "LEFT JOIN borrowers b ON b.id = h.borrower_id ORDER BY h.id"
+        )).all()
+        assert rows == [(1, "Ann"), (2, "Bob"), (3, "Ann"), (4, None)]
+        assert "ix_borrowing_history_borrower_return_date" in {
+            index["name"]
+            for index in inspect(engine).get_indexes("borrowing_history")}
+
+        # A second run finds nothing left to do
+        again = migrate_borrowers(db)
+        assert again == {"borrowers_created": 0, "loans_updated": 0}
@@ -1,5 +1,7 @@
 from fastapi.testclient import TestClient
 from datetime import date
+from app import models
+from app.copies import claim_copy
 from app.main import app
 from .utils import get_auth_headers
 
@@ -110,3 +112,54 @@ def test_return_book(client):
     response = client.post(f"/return/{borrowing_id}", headers=headers)
     assert response.status_code == 200
     assert response.json()["return_date"] is not None
+
+
+def test_borrow_copies_until_none_left(client):
+    headers = get_auth_headers(client)
+    author_id = client.post("/authors/", json={
+        "name": "Copies Author", "birthdate": str(date(1990, 1, 1))
+    }, headers=headers).json()["id"]
+    book = client.post("/books/", json={
+        "title": "Popular Book",
+        "isbn": 9786177171810,
+        "publish_date": str(date(2020, 1, 1)),
+        "author_id": author_id,
+        "genre_ids": [1],
+        "publisher_id": 1,
+        "copies": 2
+    }, headers=headers).json()
+    assert (book["total_copies"], book["available_copies"]) == (2, 2)
+
+    borrowings = [
+        client.post("/borrow", json={"book_id": book["id"],
+                                     "borrower_name": name},
+                    headers=headers)
+        for name in ("First", "Second", "Third")
+    ]
+    assert [r.status_code for r in borrowings] == [200, 200, 400]
+    assert borrowings[0].json()["copy_id"] != borrowings[1].json()["copy_id"]
+    response = client.get("/books/", params={"available": False})
+    assert [(b["id"], b["available_copies"]) for b in response.json()] == [
+        (book["id"], 0)]
+
+    client.post(f"/return/{borrowings[0].json()['id']}", headers=headers)
+    response = client.get("/books/", params={"available": True})
+    assert [(b["id"], b["available_copies"]) for b in response.json()] == [
+        (book["id"], 1)]
+
+
+def test_claim_copy_never_oversells(db_session, test_data):
+    book = models.Book(
+        title="Last Copy", isbn=9786177171811,
+        publish_date=date(2020, 1, 1),
+        author_id=test_data["author"].id,
+        publisher_id=test_data["publisher"].id
+    )
+    db_session.add(book)
+    db_session.commit()
+
+    assert claim_copy(db_session, book.id) is True
+    assert claim_copy(db_session, book.id) is False
+    db_session.commit()
+    db_session.refresh(book)
+    assert (book.available_copies, book.is_available) == (0, False)
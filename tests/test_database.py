@@ -0,0 +1,73 @@
+from datetime import date
+
+from app import config, models
+from app.bulk import bulk_insert, load_csv
+from app.copies import claim_copy
+from app.catalog import catalog_index
+from app.database import engine_options
+
+
+def test_engine_options_sqlite():
+    options = engine_options("sqlite:///./library.db")
+    assert options["connect_args"]["check_same_thread"] is False
+    assert "poolclass" not in options
+
+
+def test_engine_options_postgresql():
+    options = engine_options("postgresql+psycopg2://user:pass@db/library")
+    assert options["pool_pre_ping"] is True
+    assert options["pool_size"] == config.DB_POOL_SIZE
+    assert options["max_overflow"] == config.DB_MAX_OVERFLOW
+    assert options["connect_args"]["options"] == (
+        f"-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}")
+
+
+def test_bulk_insert(db_session, test_data):
+    bulk_insert(db_session, models.Book.__table__, [
+        {
+            "title": f"Bulk Book {i}",
+            "isbn": 9786177171900 + i,
+            "publish_date": date(2020, 1, 1),
+            "author_id": test_data["author"].id,
+            "publisher_id": test_data["publisher"].id,
+            "is_available": True,
+        } for i in range(50)
+    ])
+    db_session.commit()
+    assert db_session.query(models.Book).count() == 50
+
+
+def test_load_csv(db_session, tmp_path):
+    path = tmp_path / "genres.csv"
+    path.write_text("id,name\n10,Poetry\n11,Drama\n")
+    assert load_csv(db_session, "genres", str(path)) == 2
+    db_session.commit()
+    assert db_session.get(models.Genre, 11).name == "Drama"
+
+
+def test_load_csv_books(db_session, test_data, tmp_path):
+    catalog_index.ensure_fresh(db_session)
+    path = tmp_path / "books.csv"
+    path.write_text(
+        "id,title,isbn,publish_date,author_id,publisher_id,is_available\n"
+        f"20,The Hobbit,9780261102217,1937-09-21,{test_data['author'].id},"
+        f"{test_data['publisher'].id},true\n"
+        "21,Untitled,9780261102218,,,,false\n")
+    assert load_csv(db_session, "books", str(path)) == 2
+    db_session.commit()
+
+    hobbit = db_session.get(models.Book, 20)
+    assert hobbit.publish_date == date(1937, 9, 21)
+    assert hobbit.isbn == 9780261102217
+    assert hobbit.is_available is True
+    assert hobbit.title_sort_key == "hobbit"
+    untitled = db_session.get(models.Book, 21)
+    assert (untitled.publish_date, untitled.author_id,
+            untitled.is_available) == (None, None, False)
+    # The counters follow is_available, so an unavailable book can't be lent
+    assert (hobbit.available_copies, untitled.available_copies) == (1, 0)
+    assert not claim_copy(db_session, 21)
+
+    # Core inserts bypass the catalog hooks; the load rebuilds it instead
+    assert catalog_index._stale
+    assert db_session.get(models.CacheGeneration, "catalog").generation >= 1
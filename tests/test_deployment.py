@@ -0,0 +1,81 @@
+from sqlalchemy import update
+
+from app import config, models, serve
+from app.cachesync import cache_sync
+from app.catalog import catalog_index
+from app.scheduler import Scheduler
+from .utils import get_auth_headers
+
+
+def test_health_endpoints(client):
+    assert client.get("/healthz").json() == {"status": "ok"}
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready"}
+
+
+def test_worker_count_defaults_to_cores(monkeypatch):
+    monkeypatch.setattr(config, "WEB_CONCURRENCY", 0)
+    assert serve.worker_count(8) == 8
+    monkeypatch.setattr(config, "WEB_CONCURRENCY", 3)
+    assert serve.worker_count(8) == 3
+
+
+def test_worker_environment_enables_sharing():
+    assert serve.worker_environment(1, 8000) == {}
+    env = serve.worker_environment(4, 8000)
+    assert float(env["CACHE_SYNC_INTERVAL_SECONDS"]) > 0
+    assert env["SCHEDULER_LOCK_FILE"].endswith("library-scheduler-8000.lock")
+
+
+def test_work_factor_calibrated_once_for_all_workers(monkeypatch):
+    monkeypatch.setattr(config, "BCRYPT_TARGET_MS", 0)
+    assert serve.pinned_work_factor() == {}
+    monkeypatch.setattr(config, "BCRYPT_TARGET_MS", 50)
+    monkeypatch.setattr(serve, "calibrate_rounds", lambda target_ms: 11)
+    assert serve.pinned_work_factor() == {
+        "BCRYPT_ROUNDS": "11", "BCRYPT_TARGET_MS": "0"}
+
+
+def test_only_one_scheduler_holds_the_lock(tmp_path):
+    path = str(tmp_path / "scheduler.lock")
+    first, second = Scheduler(), Scheduler()
+    assert first.acquire_lock(path) is True
+    assert second.acquire_lock(path) is False
+
+    first._lock_file.close()
+    first._lock_file = None
+    assert second.acquire_lock(path) is True
+    second._lock_file.close()
+
+
+def test_other_workers_commits_invalidate_catalog(client, db_session,
+                                                  monkeypatch):
+    monkeypatch.setattr(config, "CACHE_SYNC_INTERVAL_SECONDS", 1e-9)
+    cache_sync.reset()
+    headers = get_auth_headers(client)
+    try:
+        for i in range(2):
+            client.post("/books/", json={
+                "title": f"Synced Book {i}",
+                "isbn": 9786177172100 + i,
+                "publish_date": "2020-01-01",
+                "author_id": 1,
+                "genre_ids": [1],
+                "publisher_id": 1
+            }, headers=headers)
+            # Our own commits update the index in place and stay in step
+            assert i == 0 or not catalog_index._stale
+            catalog_index.ensure_fresh(db_session)
+        assert db_session.get(models.CacheGeneration, "catalog").generation == 2
+        assert not catalog_index._stale
+
+        # Another worker's commit only shows up as a new generation
+        generation = models.CacheGeneration.generation
+        db_session.execute(update(models.CacheGeneration).values(
+            generation=generation + 1))
+        db_session.commit()
+        cache_sync.poll(db_session)
+        assert catalog_index._stale
+    finally:
+        cache_sync.reset()
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import date
+
+from app.events import AvailabilityBroker, availability_stream, availability_broker
+from .utils import get_auth_headers
+
+
+def test_broker_fans_out_to_many_subscribers():
+    async def scenario():
+        broker = AvailabilityBroker()
+        subscriptions = [broker.subscribe() for _ in range(500)]
+
+        async def consume(subscription):
+            return [await subscription.get() for _ in range(3)]
+
+        consumers = [asyncio.create_task(consume(s)) for s in subscriptions]
+        await asyncio.sleep(0)
+        for book_id in range(3):
+            broker.publish(book_id, book_id % 2 == 0)
+        results = await asyncio.wait_for(asyncio.gather(*consumers), 5)
+
+        assert all([e["book_id"] for e in events] == [0, 1, 2]
+                   for events in results)
+        assert all(s.dropped == 0 for s in subscriptions)
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_drops_oldest_events():
+    async def scenario():
+        broker = AvailabilityBroker(queue_size=3)
+        subscription = broker.subscribe()
+        for book_id in range(10):
+            broker.publish(book_id, False)
+
+        assert subscription.dropped == 7
+        events = [await subscription.get() for _ in range(3)]
+        assert [e["book_id"] for e in events] == [7, 8, 9]
+
+    asyncio.run(scenario())
+
+
+def test_availability_stream_formats_events_and_unsubscribes():
+    async def scenario():
+        broker = AvailabilityBroker()
+        stream = availability_stream(broker, heartbeat_seconds=0.05)
+        assert await anext(stream) == ": connected\n\n"
+        assert broker.subscriber_count == 1
+
+        assert await anext(stream) == ": keep-alive\n\n"
+        broker.publish(42, True)
+        message = await anext(stream)
+        assert message.startswith("id: 1\nevent: availability\n")
+        assert 'data: {"book_id": 42, "is_available": true}' in message
+
+        await stream.aclose()
+        assert broker.subscriber_count == 0
+
+    asyncio.run(scenario())
+
+
+def test_borrow_and_return_publish_availability(client):
+    headers = get_auth_headers(client)
+    book_id = client.post("/books/", json={
+        "title": "Streamed Book",
+        "isbn": 9786177171860,
+        "publish_date": str(date(2020, 1, 1)),
+        "author_id": 1,
+        "genre_ids": [1],
+        "publisher_id": 1
+    }, headers=headers).json()["id"]
+
+    async def scenario():
+        subscription = availability_broker.subscribe()
+        try:
+            borrowing = await asyncio.to_thread(
+                client.post, "/borrow",
+                json={"book_id": book_id, "borrower_name": "Streamer"},
+                headers=headers)
+            await asyncio.to_thread(
+                client.post, f"/return/{borrowing.json()['id']}",
+                headers=headers)
+            return [
+                await asyncio.wait_for(subscription.get(), 5)
+                for _ in range(2)
+            ]
+        finally:
+            availability_broker.unsubscribe(subscription)
+
+    events = asyncio.run(scenario())
+    assert [(e["book_id"], e["is_available"]) for e in events] == [
+        (book_id, False), (book_id, True)]
@@ -0,0 +1,107 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from app import config, models
+from app.fines import assess_fines, loan_fine_cents
+from app.scheduler import scheduler
+from .utils import get_auth_headers, explain_query_plan
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+def create_loans(db_session, test_data, due_dates, returned=()):
+    book = models.Book(
+        title="Fined Book", isbn=9786177171950,
+        publish_date=date(2020, 1, 1),
+        author_id=test_data["author"].id,
+        publisher_id=test_data["publisher"].id
+    )
+    db_session.add(book)
+    db_session.flush()
+    loans = [
+        models.BorrowingHistory(
+            book_id=book.id, borrower_name=f"Reader {i}",
+            borrow_date=due - timedelta(days=14), due_date=due,
+            return_date=due if i in returned else None)
+        for i, due in enumerate(due_dates)
+    ]
+    db_session.add_all(loans)
+    db_session.commit()
+    return loans
+
+
+def test_loan_fine_cents():
+    due = NOW - timedelta(days=2, hours=1)
+    assert loan_fine_cents(None, NOW) == 0
+    assert loan_fine_cents(NOW + timedelta(days=1), NOW) == 0
+    # Every started day counts
+    assert loan_fine_cents(due, NOW) == 3 * config.FINE_PER_DAY_CENTS
+    assert loan_fine_cents(NOW - timedelta(days=3650), NOW) == \
+        config.FINE_MAX_CENTS
+
+
+def test_assess_fines_in_chunks(db_session, test_data):
+    loans = create_loans(db_session, test_data, [
+        NOW - timedelta(days=1),
+        NOW - timedelta(days=5),
+        NOW - timedelta(days=400),
+        NOW + timedelta(days=3),   # not due yet
+        NOW - timedelta(days=10),  # returned
+    ], returned={4})
+
+    stats = assess_fines(db_session, chunk_size=2, now=NOW)
+    assert (stats["scanned"], stats["updated"], stats["chunks"]) == (3, 3, 2)
+    fines = dict(db_session.execute(
+        select(models.BorrowingHistory.id, models.BorrowingHistory.fine_cents)
+    ).all())
+    assert [fines[loan.id] for loan in loans] == [
+        config.FINE_PER_DAY_CENTS, 5 * config.FINE_PER_DAY_CENTS,
+        config.FINE_MAX_CENTS, 0, 0]
+
+    # Capped loans drop out; unchanged fines aren't rewritten
+    stats = assess_fines(db_session, chunk_size=2, now=NOW)
+    assert (stats["scanned"], stats["updated"]) == (2, 0)
+
+
+def test_overdue_query_uses_partial_index(db_session):
+    plan = explain_query_plan(
+        db_session,
+        "SELECT id, due_date, fine_cents FROM borrowing_history "
+        "WHERE return_date IS NULL AND due_date < ? AND fine_cents < ? "
+        "ORDER BY due_date, id LIMIT 100",
+        (NOW, 2000)
+    )
+    assert any("ix_borrowing_history_overdue" in detail
+               for detail in plan), plan
+
+
+def test_return_settles_fine(client, db_session, test_data):
+    headers = get_auth_headers(client)
+    (loan,) = create_loans(db_session, test_data,
+                           [datetime.now() - timedelta(days=2, hours=1)])
+    response = client.post(f"/return/{loan.id}", headers=headers)
+    assert response.json()["fine_cents"] == 3 * config.FINE_PER_DAY_CENTS
+
+    response = client.post("/borrow", json={"book_id": loan.book_id,
+                                            "borrower_name": "Next"},
+                           headers=headers)
+    borrowed = response.json()
+    assert borrowed["fine_cents"] == 0
+    assert datetime.fromisoformat(borrowed["due_date"]) - \
+        datetime.fromisoformat(borrowed["borrow_date"]) == \
+        timedelta(days=config.LOAN_PERIOD_DAYS)
+
+
+def test_job_stats_endpoint(client):
+    headers = get_auth_headers(client)
+    scheduler.add_job("noop", lambda: {"scanned": 0}, interval=60)
+    try:
+        scheduler.run_job("noop")
+        response = client.get("/jobs/", headers=headers)
+    finally:
+        scheduler.jobs.pop("noop")
+    assert response.status_code == 200
+    assert response.json()["noop"]["runs"] == 1
+    assert response.json()["noop"]["last_result"] == {"scanned": 0}
+    assert client.get("/jobs/").status_code == 401
@@ -0,0 +1,88 @@
+import gzip
+
+from app import formats
+from .utils import capture_queries, create_books, get_auth_headers
+
+
+def test_get_books_columnar_matches_json(client):
+    headers = get_auth_headers(client)
+    create_books(client, headers, 3)
+
+    rows = client.get("/books/").json()
+    columns = client.get("/books/", params={"format": "columnar"}).json()
+
+    assert set(columns) == set(rows[0])
+    assert [dict(zip(columns, values))
+            for values in zip(*columns.values())] == rows
+
+
+def test_get_book_history_columnar(client):
+    headers = get_auth_headers(client)
+    book_id = create_books(client, headers, 1)[0]["id"]
+    borrowing = client.post("/borrow", json={
+        "book_id": book_id, "borrower_name": "Columnar"
+    }, headers=headers).json()
+
+    columns = client.get(f"/books/{book_id}/history",
+                         params={"format": "columnar"}).json()
+    assert columns["id"] == [borrowing["id"]]
+    assert columns["borrow_date"] == [borrowing["borrow_date"]]
+    assert columns["return_date"] == [None]
+
+
+def test_msgpack_format(client):
+    if formats.msgpack is None:
+        response = client.get("/books/", params={"format": "msgpack"})
+        assert response.status_code == 406
+        return
+    headers = get_auth_headers(client)
+    create_books(client, headers, 2)
+    response = client.get("/books/", params={"format": "msgpack"})
+    assert response.headers["content-type"] == formats.MSGPACK_MEDIA_TYPE
+    assert formats.msgpack.unpackb(response.content) == \
+        client.get("/books/").json()
+
+
+def test_formats_load_genres_per_page(client, engine):
+    headers = get_auth_headers(client)
+    create_books(client, headers, 5)
+    for format in ("json", "columnar", "msgpack"):
+        with capture_queries(engine) as statements:
+            response = client.get("/books/", params={"format": format})
+        assert response.status_code == 200
+        genre_selects = [s for s, _ in statements if "FROM book_genres" in s]
+        assert len(genre_selects) == 1
+
+
+def test_unknown_format_rejected(client):
+    assert client.get("/books/", params={"format": "xml"}).status_code == 422
+
+
+def test_large_responses_are_gzipped(client):
+    headers = get_auth_headers(client)
+    create_books(client, headers, 20)
+
+    response = client.get("/books/", params={"limit": 20},
+                          headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 20
+
+    small = client.get("/books/", params={"limit": 1},
+                       headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+    plain = client.get("/books/", params={"limit": 20},
+                       headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == response.json()
+
+
+def test_columnar_is_smaller_than_json(client):
+    headers = get_auth_headers(client)
+    create_books(client, headers, 20)
+    params = {"limit": 20}
+    rows = client.get("/books/", params=params).content
+    columns = client.get(
+        "/books/", params={**params, "format": "columnar"}).content
+    assert len(columns) < len(rows)
+    assert len(gzip.compress(columns)) < len(gzip.compress(rows))
@@ -0,0 +1,150 @@
+from datetime import date, datetime, timedelta, UTC
+
+from app import models
+from app.holds import expire_holds
+from app.scheduler import Scheduler
+from .utils import capture_queries, get_auth_headers
+
+
+def create_book(db_session, test_data):
+    book = models.Book(
+        title="Held Book",
+        isbn=9786177171900,
+        publish_date=date(2020, 1, 1),
+        author_id=test_data["author"].id,
+        publisher_id=test_data["publisher"].id
+    )
+    db_session.add(book)
+    db_session.commit()
+    return book.id
+
+
+def borrow(client, headers, book_id, name):
+    return client.post("/borrow", json={"book_id": book_id,
+                                        "borrower_name": name},
+                       headers=headers)
+
+
+def hold(client, headers, book_id, name):
+    return client.post(f"/books/{book_id}/holds",
+                       json={"borrower_name": name}, headers=headers)
+
+
+def test_hold_requires_unavailable_book(client, db_session, test_data):
+    headers = get_auth_headers(client)
+    book_id = create_book(db_session, test_data)
+
+    response = hold(client, headers, book_id, "Early Reader")
+    assert response.status_code == 400
+    assert hold(client, headers, 999, "Reader").status_code == 404
+
+
+def test_holds_are_served_in_order(client, db_session, test_data):
+    headers = get_auth_headers(client)
+    book_id = create_book(db_session, test_data)
+    borrowing_id = borrow(client, headers, book_id, "First").json()["id"]
+
+    assert hold(client, headers, book_id, "Second").json()["position"] == 1
+    assert hold(client, headers, book_id, "Third").json()["position"] == 2
+    assert hold(client, headers, book_id, "Second").status_code == 400
+
+    client.post(f"/return/{borrowing_id}", headers=headers)
+    queue = client.get(f"/books/{book_id}/holds", headers=headers).json()
+    assert [(h["borrower_name"], h["status"], h["position"])
+            for h in queue] == [("Second", "ready", None),
+                                ("Third", "waiting", 1)]
+    assert queue[0]["expires_at"] is not None
+
+    # The returned book is reserved for the head of the queue
+    assert borrow(client, headers, book_id, "Third").status_code == 400
+    assert borrow(client, headers, book_id, "Second").status_code == 200
+    queue = client.get(f"/books/{book_id}/holds", headers=headers).json()
+    assert [h["borrower_name"] for h in queue] == ["Third"]
+
+
+def test_unclaimed_holds_expire_in_batches(client, db_session, test_data):
+    headers = get_auth_headers(client)
+    book_id = create_book(db_session, test_data)
+    borrowing_id = borrow(client, headers, book_id, "First").json()["id"]
+    hold(client, headers, book_id, "Second")
+    hold(client, headers, book_id, "Third")
+    client.post(f"/return/{borrowing_id}", headers=headers)
+
+    assert expire_holds(db_session, batch_size=1) == 0
+
+    later = datetime.now(UTC) + timedelta(days=30)
+    # Second expires and the book passes to Third, whose new deadline is
+    # after `later`
+    assert expire_holds(db_session, batch_size=1, now=later) == 1
+    queue = client.get(f"/books/{book_id}/holds", headers=headers).json()
+    assert [(h["borrower_name"], h["status"]) for h in queue] == [
+        ("Third", "ready")]
+
+    assert expire_holds(db_session, now=later + timedelta(days=30)) == 1
+    assert client.get(f"/books/{book_id}/holds", headers=headers).json() == []
+    db_session.expire_all()
+    assert db_session.get(models.Book, book_id).is_available is True
+
+
+def test_scheduler_records_job_stats():
+    scheduler = Scheduler()
+    scheduler.add_job("ok", lambda: 3, interval=60)
+    scheduler.add_job("broken", lambda: 1 / 0, interval=60)
+
+    assert scheduler.run_job("ok") == 3
+    assert scheduler.run_job("broken") is None
+
+    stats = scheduler.stats()
+    assert stats["ok"]["runs"] == 1 and stats["ok"]["last_result"] == 3
+    assert stats["broken"]["errors"] == 1
+    assert "ZeroDivisionError" in stats["broken"]["last_error"]
+
+
+def test_new_copies_serve_waiting_holds(client, db_session, test_data):
+    headers = get_auth_headers(client)
+    book_id = create_book(db_session, test_data)
+    borrow(client, headers, book_id, "First")
+    hold(client, headers, book_id, "Second")
+
+    response = client.post(f"/books/{book_id}/copies",
+                           params={"count": 2}, headers=headers)
+    assert response.status_code == 200
+    # One new copy is reserved for the hold, the other goes to the shelf
+    assert (response.json()["total_copies"],
+            response.json()["available_copies"]) == (3, 1)
+    queue = client.get(f"/books/{book_id}/holds", headers=headers).json()
+    assert [(h["borrower_name"], h["status"]) for h in queue] == [
+        ("Second", "ready")]
+    assert borrow(client, headers, book_id, "Second").json()["copy_id"]
+
+
+def test_expire_holds_queries_per_batch(engine, db_session, test_data):
+    now = datetime.now(UTC)
+    for index in range(5):
+        book = models.Book(
+            title=f"Held Book {index}",
+            isbn=9786177171910 + index,
+            publish_date=date(2020, 1, 1),
+            author_id=test_data["author"].id,
+            publisher_id=test_data["publisher"].id,
+            is_available=False,
+            available_copies=0
+        )
+        copy = models.BookCopy(book=book, is_available=False)
+        db_session.add(models.Hold(
+            book=book, copy=copy, borrower_name=f"Reader {index}",
+            status="ready", ready_at=now, expires_at=now))
+    db_session.commit()
+
+    with capture_queries(engine) as statements:
+        assert expire_holds(db_session, now=now + timedelta(hours=1)) == 5
+    holds = [s for s, _ in statements if "FROM holds" in s]
+    # The batch, the next one and a waiting-hold lookup per book
+    assert len(holds) == 2 + 5
+    # Books and copies come in one query each, not one per hold
+    assert not any(s.startswith("SELECT") and s.endswith(
+        ("WHERE books.id = ?", "WHERE book_copies.id = ?"))
+        for s, _ in statements)
+    assert sum(s.startswith("UPDATE holds") for s, _ in statements) == 1
+    db_session.expire_all()
+    assert all(book.is_available for book in db_session.query(models.Book))
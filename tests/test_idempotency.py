@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+from datetime import date, datetime, timedelta, UTC
+
+from sqlalchemy import event
+
+from app import models
+from app.idempotency import REPLAYED_HEADER, purge_expired_keys
+from .utils import get_auth_headers, capture_queries
+
+BOOK = {
+    "title": "Retried Book",
+    "isbn": 9786177171980,
+    "publish_date": str(date(2020, 1, 1)),
+    "author_id": 1,
+    "genre_ids": [1],
+    "publisher_id": 1
+}
+
+
+def test_retried_create_replays_without_running_handler(
+        client, engine, db_session):
+    headers = {**get_auth_headers(client), "Idempotency-Key": "create-1"}
+    first = client.post("/books/", json=BOOK, headers=headers)
+    assert first.status_code == 200
+    assert REPLAYED_HEADER not in first.headers
+
+    with capture_queries(engine) as statements:
+        retry = client.post("/books/", json=BOOK, headers=headers)
+    assert retry.status_code == 200
+    assert retry.headers[REPLAYED_HEADER] == "true"
+    assert retry.json() == first.json()
+    assert not any("books" in statement for statement, _ in statements)
+    assert db_session.query(models.Book).count() == 1
+
+
+def test_key_reused_with_different_body(client):
+    headers = {**get_auth_headers(client), "Idempotency-Key": "create-2"}
+    client.post("/books/", json=BOOK, headers=headers)
+    response = client.post("/books/", json={**BOOK, "title": "Other"},
+                           headers=headers)
+    assert response.status_code == 422
+
+
+def test_double_return_replays_first_result(client):
+    headers = get_auth_headers(client)
+    book_id = client.post("/books/", json=BOOK, headers=headers).json()["id"]
+    borrowing_id = client.post("/borrow", json={
+        "book_id": book_id, "borrower_name": "Reader"
+    }, headers=headers).json()["id"]
+
+    headers["Idempotency-Key"] = "return-1"
+    first = client.post(f"/return/{borrowing_id}", headers=headers)
+    retry = client.post(f"/return/{borrowing_id}", headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    # Without the key the second return is still rejected
+    del headers["Idempotency-Key"]
+    assert client.post(f"/return/{borrowing_id}",
+                       headers=headers).status_code == 400
+
+
+def test_client_errors_are_replayed(client):
+    headers = {**get_auth_headers(client), "Idempotency-Key": "borrow-1"}
+    body = {"book_id": 999, "borrower_name": "Reader"}
+    first = client.post("/borrow", json=body, headers=headers)
+    retry = client.post("/borrow", json=body, headers=headers)
+    assert first.status_code == retry.status_code == 404
+    assert retry.json() == {"detail": "Book not found"}
+    assert retry.headers[REPLAYED_HEADER] == "true"
+
+
+def test_retry_while_first_attempt_runs(client, db_session):
+    headers = {**get_auth_headers(client), "Idempotency-Key": "genre-1"}
+    body = b'{"name": "Slow Genre"}'
+    db_session.add(models.IdempotencyRecord(
+        scope="testuser POST /genres/", key="genre-1",
+        request_hash=hashlib.sha256(body).hexdigest(),
+        expires_at=datetime.now(UTC) + timedelta(hours=1)))
+    db_session.commit()
+
+    response = client.post("/genres/", content=body, headers={
+        **headers, "Content-Type": "application/json"})
+    assert response.status_code == 409
+
+
+def test_purge_expired_keys(db_session):
+    now = datetime.now(UTC)
+    db_session.add_all([
+        models.IdempotencyRecord(scope="s", key=str(i), request_hash="h",
+                                 status_code=200, response_body="{}",
+                                 expires_at=now + timedelta(hours=hours))
+        for i, hours in enumerate([-2, -1, 1])
+    ])
+    db_session.commit()
+
+    assert purge_expired_keys(db_session, batch_size=1) == 2
+    assert [r.key for r in db_session.query(models.IdempotencyRecord)] == [
+        "2"]
+
+
+def test_keys_are_committed_off_the_event_loop(client, db_session):
+    on_loop = []
+
+    def before_commit(session):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            pass
+
+    headers = {**get_auth_headers(client), "Idempotency-Key": "create-9"}
+    event.listen(db_session, "before_commit", before_commit)
+    assert client.post("/books/", json=BOOK, headers=headers).status_code == 200
+    response = client.post("/books/", json={**BOOK, "isbn": 9786177171981},
+                           headers={**headers, "Idempotency-Key": "create-10"})
+    assert response.status_code == 200
+    event.remove(db_session, "before_commit", before_commit)
+    assert db_session.query(models.IdempotencyRecord).count() == 2
+    assert on_loop == []
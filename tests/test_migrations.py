@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import config, models
+from app.auth.utils import create_access_token
+from app.database import get_db
+from app.fines import assess_fines
+from app.main import app
+from app.migrations import upgrade_schema
+
+# Tables as the first release created them
+BASELINE_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR UNIQUE, "
+    "hashed_password VARCHAR, is_active BOOLEAN)",
+    "CREATE TABLE authors (id INTEGER PRIMARY KEY, name VARCHAR UNIQUE, "
+    "birthdate DATE)",
+    "CREATE TABLE publishers (id INTEGER PRIMARY KEY, name VARCHAR UNIQUE, "
+    "established_year INTEGER)",
+    "CREATE TABLE genres (id INTEGER PRIMARY KEY, name VARCHAR UNIQUE)",
+    "CREATE TABLE books (id INTEGER PRIMARY KEY, title VARCHAR, "
+    "isbn INTEGER, publish_date DATE, "
+    "author_id INTEGER REFERENCES authors (id), "
+    "publisher_id INTEGER REFERENCES publishers (id), is_available BOOLEAN)",
+    "CREATE UNIQUE INDEX ix_books_isbn ON books (isbn)",
+    "CREATE TABLE book_genres (book_id INTEGER REFERENCES books (id), "
+    "genre_id INTEGER REFERENCES genres (id), PRIMARY KEY (book_id, genre_id))",
+    "CREATE TABLE borrowing_history (id INTEGER PRIMARY KEY, "
+    "book_id INTEGER REFERENCES books (id), borrower_name VARCHAR, "
+    "borrow_date DATETIME, return_date DATETIME)",
+]
+
+
+@pytest.fixture
+def baseline_engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool,
+                           connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        # An index whose columns changed in a later release
+        conn.execute(text(
+            "CREATE INDEX ix_books_available_title ON books "
+            "(is_available, title)"))
+        conn.execute(text(
+            "INSERT INTO authors (id, name) VALUES (1, 'Jane Austen')"))
+        conn.execute(text(
+            "INSERT INTO books (id, title, isbn, author_id, is_available) "
+            "VALUES (1, 'Emma', 1, 1, 1), (2, 'Persuasion', 2, 1, 0), "
+            "(3, NULL, 3, NULL, 1)"))
+        conn.execute(text(
+            "INSERT INTO borrowing_history (id, book_id, borrower_name, "
+            "borrow_date, return_date) VALUES "
+            "(1, 2, 'Ann', '2026-01-01 10:00:00.000000', NULL), "
+            "(2, 1, 'Bob', '2025-12-01 10:00:00.000000', "
+            "'2025-12-05 10:00:00.000000')"))
+    return engine
+
+
+def test_upgrade_baseline_database(baseline_engine):
+    stats = upgrade_schema(baseline_engine)
+    assert {"books.total_copies", "books.available_copies",
+            "borrowing_history.copy_id", "borrowing_history.due_date",
+            "borrowing_history.fine_cents"} <= set(stats["columns_added"])
+    assert "ix_books_available_title" in stats["indexes_synced"]
+    assert stats["copies_created"] == 3
+    assert stats["due_dates_set"] == 1
+    assert stats["sort_keys_set"] == 2
+    assert (stats["borrowers_created"], stats["loans_linked"]) == (2, 2)
+    assert {"books.title_sort_key",
+            "books.author_sort_key"} <= set(stats["columns_added"])
+
+    inspector = inspect(baseline_engine)
+    indexes = {index["name"]: index["column_names"]
+               for index in inspector.get_indexes("books")}
+    assert indexes["ix_books_available_title"] == [
+        "is_available", "title_sort_key", "id"]
+
+    with Session(baseline_engine) as db:
+        books = {book.id: book for book in db.query(models.Book)}
+        assert (books[1].total_copies, books[1].available_copies) == (1, 1)
+        assert (books[2].total_copies, books[2].available_copies) == (1, 0)
+        assert (books[1].title_sort_key, books[1].author_sort_key) == (
+            "emma", "jane austen")
+        copies = {copy.book_id: copy for copy in db.query(models.BookCopy)}
+        assert copies[1].is_available and not copies[2].is_available
+
+        loans = {loan.id: loan for loan in db.query(models.BorrowingHistory)}
+        assert loans[1].copy_id == copies[2].id
+        assert loans[2].copy_id is None
+        # The active loan is due a loan period after it started
+        assert loans[1].due_date == datetime(2026, 1, 1, 10) + timedelta(
+            days=config.LOAN_PERIOD_DAYS)
+        assert loans[2].due_date is None
+
+        # ... and now overdue, so the fines job charges it
+        assess_fines(db, now=datetime(2026, 2, 1))
+        db.commit()
+        db.refresh(loans[1])
+        assert loans[1].fine_cents > 0
+
+
+def test_upgrade_is_idempotent(baseline_engine):
+    upgrade_schema(baseline_engine)
+    again = upgrade_schema(baseline_engine)
+    assert again == {"columns_added": [], "indexes_synced": [],
+                     "copies_created": 0, "due_dates_set": 0,
+                     "sort_keys_set": 0, "borrowers_created": 0,
+                     "loans_linked": 0}
+    with Session(baseline_engine) as db:
+        assert db.query(models.BookCopy).count() == 3
+
+
+def test_legacy_loans_count_towards_borrower_limit(
+        baseline_engine, monkeypatch):
+    # Ann already has the first release's loan of book 2 out; two more
+    with baseline_engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO books (id, title, isbn, author_id, is_available) "
+            "VALUES (4, 'Sanditon', 4, 1, 0), (5, 'Lady Susan', 5, 1, 0)"))
+        conn.execute(text(
+            "INSERT INTO borrowing_history (id, book_id, borrower_name, "
+            "borrow_date) VALUES "
+            "(3, 4, 'Ann', '2026-01-02 10:00:00.000000'), "
+            "(4, 5, 'Ann', '2026-01-03 10:00:00.000000')"))
+    upgrade_schema(baseline_engine)
+
+    def baseline_db():
+        with Session(baseline_engine) as db:
+            yield db
+
+    monkeypatch.setattr(config, "AUTH_STATELESS", True)
+    monkeypatch.setitem(app.dependency_overrides, get_db, baseline_db)
+    token = create_access_token({"sub": "librarian", "uid": 1})
+    response = TestClient(app).post(
+        "/borrow", json={"book_id": 1, "borrower_name": "Ann"},
+        headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400
+    assert "Cannot borrow more than" in response.json()["detail"]
@@ -0,0 +1,119 @@
+import json
+from datetime import date
+
+from fastapi.testclient import TestClient
+
+from app import config, main, models
+from app.main import app
+from app.outbox import FileSink, HttpSink, OutboxRelay, OutboxSink, enqueue
+from app.scheduler import scheduler
+from .utils import get_auth_headers
+
+
+class ListSink(OutboxSink):
+    def __init__(self, fail_times: int = 0):
+        self.batches = []
+        self.closed = False
+        self.fail_times = fail_times
+
+    def send(self, events):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError("sink down")
+        self.batches.append(events)
+
+    def close(self):
+        self.closed = True
+
+
+def topics(db_session):
+    return [event.topic for event in
+            db_session.query(models.OutboxEvent).order_by(models.OutboxEvent.id)]
+
+
+def test_endpoints_write_events_in_their_transaction(client, db_session):
+    headers = get_auth_headers(client)
+    book_id = client.post("/books/", json={
+        "title": "Eventful Book",
+        "isbn": 9786177171970,
+        "publish_date": str(date(2020, 1, 1)),
+        "author_id": 1,
+        "genre_ids": [1],
+        "publisher_id": 1
+    }, headers=headers).json()["id"]
+    borrowing = client.post("/borrow", json={
+        "book_id": book_id, "borrower_name": "Reader"
+    }, headers=headers).json()
+    # A rejected borrow writes nothing
+    client.post("/borrow", json={"book_id": book_id, "borrower_name": "Other"},
+                headers=headers)
+    client.post(f"/return/{borrowing['id']}", headers=headers)
+
+    assert topics(db_session) == [
+        "book.created", "book.borrowed", "book.returned"]
+    payload = db_session.query(models.OutboxEvent).all()[1].payload
+    assert payload["borrowing_id"] == borrowing["id"]
+    assert payload["borrower_name"] == "Reader"
+
+
+def test_relay_delivers_in_order_and_batches(db_session):
+    for i in range(5):
+        enqueue(db_session, "test", {"n": i})
+    db_session.commit()
+
+    sink = ListSink()
+    metrics = OutboxRelay(sink, batch_size=2).run_once(db_session)
+
+    assert [[e["payload"]["n"] for e in batch] for batch in sink.batches] == [
+        [0, 1], [2, 3], [4]]
+    assert metrics["pending"] == 0 and metrics["delivered"] == 5
+    assert topics(db_session) == []
+
+
+def test_relay_retries_with_backoff(db_session, monkeypatch):
+    monkeypatch.setattr(config, "OUTBOX_RETRY_BASE_SECONDS", 1.0)
+    enqueue(db_session, "test", {"n": 0})
+    db_session.commit()
+    sink = ListSink(fail_times=2)
+    relay = OutboxRelay(sink)
+
+    metrics = relay.run_once(db_session, now=100.0)
+    assert metrics["pending"] == 1 and metrics["consecutive_failures"] == 1
+    # Waits out the backoff: 1 s after the first failure, then 2 s
+    relay.run_once(db_session, now=100.5)
+    assert sink.fail_times == 1
+    relay.run_once(db_session, now=101.0)
+    assert relay.retry_at == 103.0
+    event = db_session.query(models.OutboxEvent).one()
+    assert event.attempts == 2 and "sink down" in event.last_error
+
+    metrics = relay.run_once(db_session, now=103.0)
+    assert metrics["pending"] == 0 and metrics["consecutive_failures"] == 0
+    assert len(sink.batches) == 1
+
+
+def test_file_sink_appends_json_lines(tmp_path):
+    path = tmp_path / "events.jsonl"
+    sink = FileSink(str(path))
+    sink.send([{"id": 1}, {"id": 2}])
+    sink.send([{"id": 3}])
+    assert [json.loads(line)["id"]
+            for line in path.read_text().splitlines()] == [1, 2, 3]
+
+
+def test_http_sink_closes_its_client():
+    sink = HttpSink("http://sink.invalid/events")
+    OutboxRelay(sink).close()
+    assert sink.client.is_closed
+
+
+def test_shutdown_closes_the_relay_sink(monkeypatch):
+    sink = ListSink()
+    monkeypatch.setattr(config, "SCHEDULER_ENABLED", True)
+    monkeypatch.setattr(config, "SCHEDULER_LOCK_FILE", "")
+    monkeypatch.setattr(main, "sink_from_url", lambda url: sink)
+    monkeypatch.setattr(scheduler, "jobs", {})
+    with TestClient(app):
+        assert "relay_outbox" in scheduler.jobs
+        assert not sink.closed
+    assert sink.closed
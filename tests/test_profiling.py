@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.responses import StreamingResponse
+
+from app.auth.utils import create_access_token
+from app.main import app
+from app.profiling import ProfilingMiddleware
+from app.singleflight import SingleFlightMiddleware
+from .utils import get_auth_headers
+
+
+def busy_sync_work(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def busy_async_work(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+    await asyncio.sleep(0)
+
+
+demo = FastAPI()
+
+
+@demo.get("/sync")
+def sync_endpoint():
+    busy_sync_work(0.1)
+    return {"done": True}
+
+
+@demo.get("/async")
+async def async_endpoint():
+    await busy_async_work(0.1)
+    return {"done": True}
+
+
+@demo.get("/stream")
+async def stream_endpoint():
+    async def events():
+        yield "data: one\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def token_headers(username="alice", **claims):
+    token = create_access_token({"sub": username, **claims})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def profiled_client(**options):
+    options.setdefault("per_minute", 60)
+    options.setdefault("burst", 10)
+    return TestClient(ProfilingMiddleware(demo, **options))
+
+
+@pytest.mark.parametrize("path, function", [
+    ("/sync", "busy_sync_work"),
+    ("/async", "busy_async_work"),
+])
+def test_profile_collapsed_stacks(path, function):
+    response = profiled_client().get(
+        path, params={"profile": 1}, headers=token_headers())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.headers["x-profile-status"] == "200"
+    assert int(response.headers["x-profile-samples"]) > 5
+    assert float(response.headers["x-profile-duration-ms"]) >= 100
+
+    lines = response.text.splitlines()
+    assert lines
+    counts = 0
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        counts += int(count)
+    assert counts == int(response.headers["x-profile-samples"])
+    # Stacks run from the outermost frame to the one that was sampled
+    hot = lines[0].rsplit(" ", 1)[0].split(";")
+    assert hot[-1].startswith(function + " (")
+    assert "tests/test_profiling.py" in hot[-1]
+
+
+def test_profile_header_trigger():
+    headers = {**token_headers(), "X-Profile": "1"}
+    response = profiled_client().get("/sync", headers=headers)
+    assert "busy_sync_work" in response.text
+
+
+def test_profile_leaves_other_requests_alone():
+    client = profiled_client()
+    response = client.get("/sync")
+    assert response.json() == {"done": True}
+    assert "x-profile-skipped" not in response.headers
+
+
+@pytest.mark.parametrize("headers, reason", [
+    ({}, "unauthenticated"),
+    ({"Authorization": "Bearer not-a-token"}, "unauthenticated"),
+    ({"Authorization": token_headers()["Authorization"].replace(
+        ".", ".\u00e9", 1).encode("latin-1")}, "unauthenticated"),
+    (token_headers(active=False), "unauthenticated"),
+    (token_headers("mallory"), "forbidden"),
+])
+def test_profile_refused(headers, reason):
+    client = profiled_client(users=["alice"])
+    response = client.get("/sync", params={"profile": 1}, headers=headers)
+    assert response.json() == {"done": True}
+    assert response.headers["x-profile-skipped"] == reason
+
+
+def test_profile_rate_limited():
+    client = profiled_client(per_minute=1, burst=2)
+    skipped = [
+        client.get("/async", params={"profile": 1}, headers=token_headers())
+        .headers.get("x-profile-skipped")
+        for _ in range(3)
+    ]
+    assert skipped == [None, None, "rate-limited"]
+
+
+def test_profile_burst_only():
+    # PROFILE_PER_MINUTE=0: the burst, then never again
+    client = profiled_client(per_minute=0, burst=1)
+    skipped = [
+        client.get("/async", params={"profile": 1}, headers=token_headers())
+        .headers.get("x-profile-skipped")
+        for _ in range(3)
+    ]
+    assert skipped == [None, "rate-limited", "rate-limited"]
+
+
+def test_profile_passes_event_streams_through():
+    response = profiled_client().get(
+        "/stream", params={"profile": 1}, headers=token_headers())
+    assert response.text == "data: one\n\n"
+    assert response.headers["x-profile-skipped"] == "streaming"
+
+
+def test_profile_bypasses_single_flight():
+    coalescing = SingleFlightMiddleware(demo, prefixes=["/"])
+    # A leader for the same key whose response would otherwise be shared
+    leader = asyncio.new_event_loop().create_future()
+    leader.set_result(({"type": "http.response.start", "status": 200,
+                        "headers": []}, b"shared"))
+    coalescing._inflight[("/sync", (("profile", "1"),), ())] = leader
+    client = TestClient(ProfilingMiddleware(coalescing, per_minute=60, burst=10))
+    response = client.get("/sync", params={"profile": 1},
+                          headers=token_headers())
+    assert "busy_sync_work" in response.text
+    assert coalescing.coalesced == 0
+
+
+def test_profile_real_endpoint(client):
+    profiled = TestClient(ProfilingMiddleware(app))
+    headers = get_auth_headers(client)
+    response = profiled.get("/books/", params={"profile": 1}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["x-profile-status"] == "200"
+    assert "x-profile-skipped" not in response.headers
@@ -0,0 +1,283 @@
+"""
+Query plan regression tests.
+
+Every endpoint in app/routers and app/auth runs against a seeded database
+while its SQL is captured. Each statement is then explained with EXPLAIN
+QUERY PLAN and checked for:
+
+- no full scan or full index walk of a table that grows with use (books,
+  loans, ...), except sorted pages walking their sort index;
+- no temp B-tree for ORDER BY.
+
+Each case lists the plan lines it is allowed to have, with the reason.
+
+A new endpoint goes into CASES; a model or query change that loses an index
+fails here instead of under production load.
+"""
+import re
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from app import models
+from app.database import Base
+from .utils import get_auth_headers, capture_queries, explain_query_plan
+
+# Tables whose size follows the catalog or traffic; small lookup tables
+# (genres, publishers, cache_generations) may be scanned
+GROWING_TABLES = {
+    "authors", "books", "book_genres", "book_copies", "borrowers",
+    "borrowing_history", "borrowing_history_archive", "holds", "outbox",
+    "idempotency_keys", "users", "refresh_sessions",
+}
+# Both full scans and full index walks; a walk that a LIMIT cuts short (a
+# sorted page) is listed in the case's allowed lines
+FULL_SCAN = re.compile(r"^SCAN (\w+)")
+TEMP_SORT = "USE TEMP B-TREE FOR ORDER BY"
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+BOOKS = 30
+NOW = datetime(2025, 6, 1)
+
+
+@pytest.fixture
+def seeded(db_session, test_data):
+    """A few of everything, with loans in every state"""
+    author_id = test_data["author"].id
+    publisher_id = test_data["publisher"].id
+    genre_id = test_data["genre"].id
+    db_session.execute(insert(models.Book), [
+        {"id": i, "title": f"Plan Book {i}", "title_sort_key": f"plan {i}",
+         "author_sort_key": "test author", "isbn": 9786177173000 + i,
+         "publish_date": date(2000 + i % 20, 1, 1), "author_id": author_id,
+         "publisher_id": publisher_id, "is_available": i % 3 != 0,
+         "available_copies": int(i % 3 != 0)}
+        for i in range(1, BOOKS + 1)
+    ])
+    db_session.execute(insert(models.BookGenre), [
+        {"book_id": i, "genre_id": genre_id} for i in range(1, BOOKS + 1)
+    ])
+    db_session.execute(insert(models.BookCopy), [
+        {"id": i, "book_id": i, "is_available": i % 3 != 0}
+        for i in range(1, BOOKS + 1)
+    ])
+    db_session.execute(insert(models.Borrower), [
+        {"id": 1, "name": "Plan Reader", "created_at": NOW}])
+    db_session.execute(insert(models.BorrowingHistory), [
+        {"id": i, "book_id": i, "copy_id": i, "borrower_id": 1,
+         "borrower_name": "Plan Reader",
+         "borrow_date": NOW - timedelta(days=40 - i),
+         "due_date": NOW - timedelta(days=26 - i),
+         "return_date": None if i % 3 == 0 else NOW - timedelta(days=i)}
+        for i in range(1, BOOKS + 1)
+    ])
+    db_session.execute(insert(models.BorrowingHistoryArchive), [
+        {"id": 1000 + i, "book_id": 1, "borrower_id": 1,
+         "borrower_name": "Plan Reader",
+         "borrow_date": NOW - timedelta(days=900 + i),
+         "return_date": NOW - timedelta(days=890 + i)}
+        for i in range(5)
+    ])
+    db_session.execute(insert(models.Hold), [
+        {"book_id": 3, "borrower_name": f"Waiting {i}", "status": "waiting",
+         "created_at": NOW} for i in range(3)
+    ])
+    db_session.commit()
+    return {"author": author_id, "publisher": publisher_id,
+            "genre": genre_id, "borrowed_book": 3, "loan": 3,
+            "borrower": 1}
+
+
+def walk(table: str, index: str) -> str:
+    return f"SCAN {table} USING INDEX {index}"
+
+
+def login(client):
+    return client.post("/token", data={
+        "username": "testuser", "password": "testpass"}).json()
+
+
+def new_book(ids):
+    return {"title": "Planned", "isbn": 9786177173999,
+            "publish_date": "2020-01-01", "author_id": ids["author"],
+            "genre_ids": [ids["genre"]], "publisher_id": ids["publisher"]}
+
+
+# (case id, method, path, request kwargs(ids, client), allowed plan lines)
+CASES = [
+    # Unfiltered pages walk the sort index and stop after `limit` rows
+    ("books-title", "GET", "/books/", lambda ids, c: {},
+     (walk("books", "ix_books_title_sort_key"),)),
+    ("books-author", "GET", "/books/",
+     lambda ids, c: {"params": {"sort_by": "author"}},
+     (walk("books", "ix_books_author_sort_key"),)),
+    ("books-publish-date", "GET", "/books/",
+     lambda ids, c: {"params": {"sort_by": "publish_date"}},
+     (walk("books", "ix_books_publish_date_id"),)),
+    ("books-available", "GET", "/books/",
+     lambda ids, c: {"params": {"available": True}}, ()),
+    # The genre's books come from ix_book_genres_genre_book, then get sorted
+    ("books-genre", "GET", "/books/",
+     lambda ids, c: {"params": {"genre_id": ids["genre"]}}, (TEMP_SORT,)),
+    ("books-author-filter", "GET", "/books/",
+     lambda ids, c: {"params": {"author_id": ids["author"],
+                                "sort_by": "publish_date"}}, ()),
+    ("books-publisher", "GET", "/books/",
+     lambda ids, c: {"params": {"publisher_id": ids["publisher"]}}, ()),
+    ("books-date-range", "GET", "/books/",
+     lambda ids, c: {"params": {"published_from": "2005-01-01",
+                                "published_to": "2010-12-31",
+                                "sort_by": "publish_date"}}, ()),
+    ("books-include", "GET", "/books/",
+     lambda ids, c: {"params": {"include": "author,publisher"}},
+     (walk("books", "ix_books_title_sort_key"),)),
+    ("books-batch", "GET", "/books/batch",
+     lambda ids, c: {"params": {"ids": "3,1,2"}}, ()),
+    # Builds the in-memory index: one full read per process, not per request
+    ("books-facets", "GET", "/books/facets", lambda ids, c: {},
+     ("SCAN books", "SCAN book_genres",
+      "SCAN authors USING COVERING INDEX ix_authors_name")),
+    ("books-create", "POST", "/books/",
+     lambda ids, c: {"json": new_book(ids)}, ()),
+    ("books-copies", "POST", "/books/{borrowed_book}/copies",
+     lambda ids, c: {"params": {"count": 2}}, ()),
+    ("books-history", "GET", "/books/{borrowed_book}/history",
+     lambda ids, c: {}, ()),
+    ("books-history-archived", "GET", "/books/{borrowed_book}/history",
+     lambda ids, c: {"params": {"include_archived": True}}, ()),
+    # The page (at most 100 authors) is re-sorted after joining the counts;
+    # without a prefix it walks the name index up to `limit`
+    ("authors", "GET", "/authors/", lambda ids, c: {},
+     (TEMP_SORT, walk("authors", "ix_authors_name"))),
+    ("authors-prefix", "GET", "/authors/",
+     lambda ids, c: {"params": {"name_prefix": "Test"}}, (TEMP_SORT,)),
+    ("authors-batch", "GET", "/authors/batch",
+     lambda ids, c: {"params": {"ids": str(ids["author"])}}, ()),
+    ("authors-create", "POST", "/authors/",
+     lambda ids, c: {"json": {"name": "Planned Author",
+                              "birthdate": "1950-01-01"}}, ()),
+    ("author-books", "GET", "/authors/{author}/books", lambda ids, c: {}, ()),
+    ("genres", "GET", "/genres/", lambda ids, c: {}, ()),
+    ("genres-create", "POST", "/genres/",
+     lambda ids, c: {"json": {"name": "Planned Genre"}}, ()),
+    ("publishers", "GET", "/publishers/", lambda ids, c: {}, ()),
+    ("publishers-batch", "GET", "/publishers/batch",
+     lambda ids, c: {"params": {"ids": str(ids["publisher"])}}, ()),
+    ("publishers-create", "POST", "/publishers/",
+     lambda ids, c: {"json": {"name": "Planned Publisher",
+                              "established_year": 1990}}, ()),
+    ("borrow", "POST", "/borrow",
+     lambda ids, c: {"json": {"book_id": 1,
+                              "borrower_name": "New Reader"}}, ()),
+    ("return", "POST", "/return/{loan}", lambda ids, c: {}, ()),
+    ("holds-create", "POST", "/books/{borrowed_book}/holds",
+     lambda ids, c: {"json": {"borrower_name": "Late Reader"}}, ()),
+    ("holds", "GET", "/books/{borrowed_book}/holds", lambda ids, c: {}, ()),
+    ("borrower", "GET", "/borrowers/{borrower}", lambda ids, c: {}, ()),
+    ("borrower-loans-active", "GET", "/borrowers/{borrower}/loans",
+     lambda ids, c: {"params": {"status": "active"}}, ()),
+    ("borrower-loans-returned", "GET", "/borrowers/{borrower}/loans",
+     lambda ids, c: {"params": {"status": "returned"}}, ()),
+    # Sorts one borrower's loans, found through the same index
+    ("borrower-loans-all", "GET", "/borrowers/{borrower}/loans",
+     lambda ids, c: {}, (TEMP_SORT,)),
+    ("jobs", "GET", "/jobs/", lambda ids, c: {}, ()),
+    ("readyz", "GET", "/readyz", lambda ids, c: {}, ()),
+    ("token", "POST", "/token",
+     lambda ids, c: {"data": {"username": "testuser",
+                              "password": "testpass"}}, ()),
+    ("token-refresh", "POST", "/token/refresh",
+     lambda ids, c: {"json": {"refresh_token": login(c)["refresh_token"]}},
+     ()),
+    ("token-revoke", "POST", "/token/revoke",
+     lambda ids, c: {"json": {"refresh_token": login(c)["refresh_token"]}},
+     ()),
+    ("users-create", "POST", "/users/",
+     lambda ids, c: {"json": {"username": "planner",
+                              "password": "plannerpass"}}, ()),
+]
+
+
+# Indexes the main lookups must use: a query can keep its SEARCH lines and
+# still lose its index to a worse one (e.g. a range over another column)
+EXPECTED_INDEXES = {
+    "books-available": "ix_books_available_title",
+    "books-genre": "ix_book_genres_genre_book",
+    "books-author-filter": "ix_books_author_publish_date",
+    "books-publisher": "ix_books_publisher_title",
+    "books-date-range": "ix_books_publish_date_id",
+    "books-history": "ix_borrowing_history_book_borrow_date",
+    "books-history-archived": "ix_borrowing_history_archive_book_borrow_date",
+    "author-books": "ix_books_author_publish_date",
+    "borrow": "ix_borrowing_history_borrower_return_date",
+    "holds": "ix_holds_book_status_id",
+    "borrower": "ix_borrowing_history_borrower_return_date",
+    "borrower-loans-active": "ix_borrowing_history_borrower_return_date",
+    "borrower-loans-returned": "ix_borrowing_history_borrower_return_date",
+    "borrower-loans-all": "ix_borrowing_history_borrower_return_date",
+}
+
+
+def plan_problems(plan: list[str], allowed) -> list[str]:
+    problems = []
+    for line in plan:
+        if line in allowed:
+            continue
+        scan = FULL_SCAN.match(line)
+        if scan and scan.group(1) in GROWING_TABLES:
+            problems.append(line)
+        elif line.startswith("USE TEMP B-TREE"):
+            problems.append(line)
+    return problems
+
+
+@pytest.mark.parametrize(
+    "case_id, method, path, request_kwargs, allowed",
+    CASES, ids=[case[0] for case in CASES])
+def test_endpoint_query_plans(client, engine, db_session, seeded, case_id,
+                              method, path, request_kwargs, allowed):
+    headers = get_auth_headers(client)
+    kwargs = request_kwargs(seeded, client)
+    with capture_queries(engine) as statements:
+        response = client.request(
+            method, path.format(**seeded), headers=headers, **kwargs)
+    assert response.status_code < 400, response.text
+
+    explained = 0
+    failures = []
+    used = set()
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith(EXPLAINABLE):
+            continue
+        if isinstance(parameters, list):  # executemany
+            parameters = parameters[0]
+        plan = explain_query_plan(db_session, statement, parameters)
+        explained += 1
+        used.update(re.findall(r"INDEX (\w+)", " ".join(plan)))
+        if problems := plan_problems(plan, allowed):
+            failures.append(f"{problems}\n  {' '.join(statement.split())}")
+    assert explained, "no statements captured"
+    assert not failures, "\n".join(failures)
+    if case_id in EXPECTED_INDEXES:
+        assert EXPECTED_INDEXES[case_id] in used, sorted(used)
+
+
+def test_growing_tables_exist():
+    # A misspelt name would exempt the real table from the scan check
+    assert GROWING_TABLES <= set(Base.metadata.tables)
+
+
+def test_plan_checks_catch_regressions():
+    assert plan_problems(["SCAN books"], ()) == ["SCAN books"]
+    assert plan_problems(["SCAN borrowing_history AS h"], ()) != []
+    assert plan_problems([TEMP_SORT], ()) == [TEMP_SORT]
+    assert plan_problems([TEMP_SORT], (TEMP_SORT,)) == []
+    # A filtered query falling back to walking some other index
+    sort_walk = walk("borrowing_history", "ix_borrowing_history_return_date")
+    assert plan_problems([sort_walk], ()) == [sort_walk]
+    assert plan_problems([sort_walk], (sort_walk,)) == []
+    assert plan_problems([
+        "SEARCH books USING INDEX ix_books_title_sort_key (title_sort_key>?)",
+        "SCAN genres",
+    ], ()) == []
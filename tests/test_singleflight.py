@@ -0,0 +1,128 @@
+import asyncio
+import time
+import tracemalloc
+from datetime import date
+
+import httpx
+from sqlalchemy import event
+
+from app import models
+from app.main import app
+from app.singleflight import SingleFlightMiddleware, request_key
+from .utils import capture_queries
+
+
+def book_selects(statements):
+    return [statement for statement, _ in statements
+            if statement.startswith("SELECT") and "FROM books" in statement]
+
+
+def test_concurrent_identical_requests_share_one_query(
+        client, engine, db_session, test_data):
+    db_session.add_all([
+        models.Book(title=f"Book {i}", isbn=9786177172000 + i,
+                    publish_date=date(2020, 1, 1),
+                    author_id=test_data["author"].id,
+                    publisher_id=test_data["publisher"].id)
+        for i in range(3)
+    ])
+    db_session.commit()
+
+    # Hold the leader's query long enough for the others to pile up
+    def slow_query(conn, cursor, statement, *args):
+        if "FROM books" in statement:
+            time.sleep(0.2)
+
+    async def fetch_all(n):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url="http://test") as http:
+            return await asyncio.gather(*[
+                http.get("/books/?sort_by=title&offset=0&limit=20")
+                for _ in range(n)
+            ])
+
+    event.listen(engine, "before_cursor_execute", slow_query)
+    try:
+        with capture_queries(engine) as statements:
+            responses = asyncio.run(fetch_all(20))
+    finally:
+        event.remove(engine, "before_cursor_execute", slow_query)
+
+    assert len(book_selects(statements)) == 1
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.content for r in responses}) == 1
+    assert [b["title"] for b in responses[0].json()] == [
+        "Book 0", "Book 1", "Book 2"]
+
+    # Once the leader finished nothing is kept
+    with capture_queries(engine) as statements:
+        client.get("/books/?sort_by=title&offset=0&limit=20")
+    assert len(book_selects(statements)) == 1
+
+
+def test_request_key_normalizes_query_and_varies_on_headers():
+    def scope(query, auth=None):
+        headers = [(b"authorization", auth)] if auth else []
+        return {"path": "/books/", "query_string": query, "headers": headers}
+
+    vary = ["authorization"]
+    assert request_key(scope(b"limit=20&offset=0"), vary) == \
+        request_key(scope(b"offset=0&limit=20"), vary)
+    assert request_key(scope(b"limit=20"), vary) != \
+        request_key(scope(b"limit=20", b"Bearer x"), vary)
+
+
+async def event_stream(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"text/event-stream")]})
+    for _ in range(64):
+        await send({"type": "http.response.body", "body": bytes(1 << 20),
+                    "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def get(middleware, path):
+    async def run():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url="http://test") as http:
+            return await http.get(path)
+    return asyncio.run(run())
+
+
+def test_event_streams_are_not_recorded():
+    middleware = SingleFlightMiddleware(event_stream, prefixes=["/"])
+    received = 0
+
+    async def count(scope, receive, send):
+        async def counting_send(message):
+            nonlocal received
+            received += len(message.get("body", b""))
+        await middleware(scope, receive, counting_send)
+
+    scope = {"type": "http", "method": "GET", "path": "/events",
+             "query_string": b"", "headers": []}
+    tracemalloc.start()
+    try:
+        asyncio.run(count(scope, None, None))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert received == 64 << 20
+    # One chunk at a time, not the 64 MiB the stream sent
+    assert peak < 8 << 20
+    assert not middleware._inflight
+
+
+def test_excluded_paths_are_not_coalesced():
+    middleware = SingleFlightMiddleware(
+        event_stream, prefixes=["/books"], exclude=["/books/stream"])
+    # A leader for the same key whose response would otherwise be shared
+    leader = asyncio.new_event_loop().create_future()
+    leader.set_result(({"type": "http.response.start", "status": 200,
+                        "headers": []}, b"shared"))
+    middleware._inflight[("/books/stream", (), ())] = leader
+    response = get(middleware, "/books/stream")
+    assert response.headers["content-type"] == "text/event-stream"
+    assert middleware.coalesced == 0
@@ -0,0 +1,56 @@
+from datetime import date
+
+from app import models
+from app.bulk import backfill_sort_keys
+from app.sortkeys import author_sort_key, title_sort_key
+from .utils import get_auth_headers
+
+
+def test_title_sort_key():
+    assert title_sort_key("The Hobbit") == "hobbit"
+    assert title_sort_key("An  Échec") == "echec"
+    assert title_sort_key("A") == "a"
+    assert title_sort_key("Theory") == "theory"
+    assert title_sort_key(None) is None
+    assert author_sort_key("Émile  ZOLA") == "emile zola"
+
+
+def test_sort_keys_follow_author_rename(client, db_session, test_data):
+    headers = get_auth_headers(client)
+    zed = models.Author(name="Zed", birthdate=date(1950, 1, 1))
+    db_session.add(zed)
+    db_session.commit()
+    for i, (title, author_id) in enumerate([
+        ("The Zebra", test_data["author"].id),
+        ("apple", zed.id),
+        ("Banana", test_data["author"].id),
+    ]):
+        client.post("/books/", json={
+            "title": title, "isbn": 9786177172100 + i,
+            "publish_date": str(date(2020, 1, 1)), "author_id": author_id,
+            "genre_ids": [1], "publisher_id": 1
+        }, headers=headers)
+
+    def titles(sort_by):
+        response = client.get(f"/books/?sort_by={sort_by}")
+        return [book["title"] for book in response.json()]
+
+    assert titles("title") == ["apple", "Banana", "The Zebra"]
+    # "Test Author" before "Zed", ties by id
+    assert titles("author") == ["The Zebra", "Banana", "apple"]
+
+    zed.name = "Aaron"
+    db_session.commit()
+    assert titles("author") == ["apple", "The Zebra", "Banana"]
+
+
+def test_backfill_sort_keys(db_session, test_data):
+    db_session.execute(models.Book.__table__.insert(), [
+        {"title": "The Loaded Book", "isbn": 9786177172200,
+         "author_id": test_data["author"].id}
+    ])
+    assert backfill_sort_keys(db_session) == 1
+    book = db_session.query(models.Book).one()
+    assert (book.title_sort_key, book.author_sort_key) == (
+        "loaded book", "test author")
+    assert backfill_sort_keys(db_session) == 0
@@ -1,4 +1,8 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from app.main import app
 
 client = TestClient(app)
@@ -14,3 +18,43 @@ def get_auth_headers(client: TestClient) -> dict:
         raise Exception(f"Authentication failed: {response.json()}")
     token = response.json()["access_token"]
     return {"Authorization": f"Bearer {token}"}
+
+
+def create_books(client: TestClient, headers: dict, count: int,
+                 isbn_base: int = 9786177172000) -> list[dict]:
+    """Create count books of the test author, genre and publisher"""
+    return [
+        client.post("/books/", json={
+            "title": f"Test Book {i}",
+            "isbn": isbn_base + i,
+            "publish_date": str(date(2020, 1, 1) + timedelta(days=i)),
+            "author_id": 1,
+            "genre_ids": [1],
+            "publisher_id": 1
+        }, headers=headers).json()
+        for i in range(count)
+    ]
+
+
+@contextmanager
+def capture_queries(engine):
+    """Collect (statement, parameters) for every SQL executed on the engine"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters,
+                              context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def explain_query_plan(session, statement: str, parameters) -> list[str]:
+    """Return the detail column of SQLite's EXPLAIN QUERY PLAN output"""
+    rows = session.connection().exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + statement, parameters
+    ).all()
+    return [row[3] for row in rows]